@@ -22,5 +22,6 @@ setuptools.setup(
         "bin/playerd",
         "bin/schedulerd",
         "bin/playerctl",
+        "bin/schedulersim",
     ],
 )
@@ -0,0 +1,307 @@
+"""
+asyncio runtime for scheduler and player.
+
+Signals are read from redis.asyncio pubsub, outgoing signals are published
+by single sender task per channel, so they keep order and never block the
+loop. Scheduler state, metrics and latency histograms are written by
+single writer task on async connection. Blocking work (sync acks, device
+sync and reload, clock measurement, generators) runs in threads awaited
+by tasks.
+"""
+import asyncio
+import json
+import logging
+import time
+
+import redis.asyncio
+
+from soundfleet_player.conf import settings
+from soundfleet_player.player import Player
+from soundfleet_player.scheduler import Scheduler
+from soundfleet_player.utils import (
+    encode_signal,
+    get_local_time,
+    get_redis_conn,
+)
+
+
+logger = logging.getLogger(__name__)
+
+
+async def get_async_redis_conn(host="redis", port=6379, timeout=60 * 60):
+    conn = redis.asyncio.StrictRedis(
+        host=host,
+        port=port,
+        db=0,
+        encoding="utf-8",
+        decode_responses=True,
+    )
+    redis_ready = False
+    time_expires = time.time() + timeout
+    while not redis_ready and time_expires - time.time() > 0:
+        try:
+            redis_ready = await conn.ping()
+        except redis.exceptions.ConnectionError:
+            await asyncio.sleep(1)
+    return conn
+
+
+async def get_and_decode_async_redis_message(pubsub, timeout=0.0):
+    try:
+        msg = await pubsub.get_message(timeout=timeout)
+    except redis.exceptions.ConnectionError:
+        logger.error("Redis connection closed.")
+        await asyncio.sleep(min(timeout or 0, 1))
+        return
+    if msg and msg["type"] == "message":
+        try:
+            return json.loads(msg["data"])
+        except TypeError as e:
+            logger.error(
+                "Received invalid signal format that caused "
+                "exception {}".format(e)
+            )
+
+
+class SignalSender:
+    """
+    Publish signals in order, retrying until channel has subscriber.
+    """
+
+    def __init__(self, conn, channel):
+        self._conn = conn
+        self._channel = channel
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._send())
+
+    def send(self, name, args):
+        self._queue.put_nowait(encode_signal(name, args))
+
+    async def _send(self):
+        while True:
+            signal = await self._queue.get()
+            while True:
+                try:
+                    if await self._conn.publish(self._channel, signal):
+                        break
+                except redis.exceptions.ConnectionError:
+                    logger.error("Redis connection closed.")
+                await asyncio.sleep(0.1)
+
+
+class RedisWriter:
+    """
+    Run Redis write commands in order on async connection.
+    """
+
+    def __init__(self, conn):
+        self._conn = conn
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._write())
+
+    def write(self, command, *args, **kwargs):
+        self._queue.put_nowait((command, args, kwargs))
+
+    def write_latency(self, tracker):
+        if tracker.dirty:
+            self.write("set", tracker.get_key(), json.dumps(tracker.export()))
+
+    async def _write(self):
+        while True:
+            command, args, kwargs = await self._queue.get()
+            try:
+                await getattr(self._conn, command)(*args, **kwargs)
+            except redis.exceptions.RedisError as e:
+                logger.error(
+                    "Unable to write {} to Redis: {}".format(args[0], e)
+                )
+            finally:
+                self._queue.task_done()
+
+    async def drain(self):
+        """
+        Wait until queued writes are done.
+        """
+        await self._queue.join()
+
+
+async def sync_clock(clock):
+    """
+    Measure offset of shared clock in thread before it is due, so
+    clock.now() called on the loop doesn't wait for Redis.
+    """
+    while True:
+        try:
+            await asyncio.to_thread(clock.measure)
+        except Exception as e:
+            logger.error("Unable to measure clock offset: {}".format(e))
+        await asyncio.sleep(clock.RESYNC_INTERVAL / 2)
+
+
+class AsyncScheduler(Scheduler):
+    # signals after which device state is read again from Redis
+    DEVICE_SIGNALS = ("DEVICE_SYNC", "DEVICE_UPDATED")
+
+    def __init__(self):
+        # signals are read by async pubsub, no sync one is subscribed
+        super().__init__(redis=get_redis_conn())
+        self._aredis = None
+        self._pubsub = None
+        self._sender = None
+        self._writer = None
+        self._tasks = set()
+        self._generator_tasks = {}
+
+    def run(self):
+        asyncio.run(self.run_async())
+
+    async def run_async(self):
+        self._outbox.start()
+        self._aredis = await get_async_redis_conn()
+        self._sender = SignalSender(self._aredis, settings.PLAYER_REDIS_CHANNEL)
+        self._writer = RedisWriter(self._aredis)
+        self._pubsub = self._aredis.pubsub(ignore_subscribe_messages=True)
+        await self._pubsub.subscribe(settings.SCHEDULER_REDIS_CHANNEL)
+
+        await asyncio.to_thread(self._clock.measure)
+        self._spawn(sync_clock(self._clock))
+        await self._reload_device()
+        if not await asyncio.to_thread(self._restore_state):
+            await asyncio.to_thread(self._device.sync)
+            await self._reload_device()
+        self._schedule_day_change()
+        while self._should_run():
+            await self._drain_signals_async(
+                timeout=self._timers.timeout(self.MAX_WAIT)
+            )
+            if any(s[0] in self.DEVICE_SIGNALS for s in self._control_signals):
+                await self._reload_device()
+            self._process()
+        await self._writer.drain()
+
+    async def _drain_signals_async(self, timeout):
+        signal = await get_and_decode_async_redis_message(
+            self._pubsub, timeout=timeout
+        )
+        deadline = time.monotonic() + settings.SCHEDULER_DRAIN_BUDGET
+        count = 0
+        while signal:
+            self._queue_signal(signal)
+            count += 1
+            if self._drain_finished(count, deadline):
+                break
+            signal = await get_and_decode_async_redis_message(self._pubsub)
+
+    def _spawn(self, coro):
+        task = asyncio.create_task(coro)
+        # keep reference until task is done
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    def _send_player_signal(self, name, args):
+        self._sender.send(name, args)
+
+    async def _reload_device(self):
+        snapshot = await asyncio.to_thread(self._device.load_snapshot)
+        self._device.invalidate(snapshot)
+
+    def _refresh_device(self):
+        # snapshot was read by _reload_device() before signal dispatch
+        pass
+
+    def _store_state(self, state):
+        self._writer.write(
+            "set", self._state_cache.get_key(), json.dumps(state)
+        )
+
+    def _store_metrics(self, **values):
+        self._writer.write("hset", self._metrics.get_key(), mapping=values)
+
+    def _flush_latency(self):
+        self._writer.write_latency(self._latency)
+
+    def _ack_sync(self):
+        self._spawn(asyncio.to_thread(super()._ack_sync))
+
+    def _on_day_change(self):
+        today = get_local_time(self._device.timezone).date()
+        if self._is_primary and self._last_device_sync != today:
+            self._spawn(asyncio.to_thread(self._device.sync))
+        self._schedule_day_change()
+
+    def _run_generator(self, fn, key):
+        task = self._generator_tasks.get(key)
+        if task is not None and not task.done():
+            # single flight, run once more after current draw
+            task.rerun = True
+            return
+        task = self._spawn(self._generate(fn, key))
+        task.rerun = False
+        self._generator_tasks[key] = task
+
+    async def _generate(self, fn, key):
+        task = asyncio.current_task()
+        while True:
+            try:
+                await asyncio.to_thread(fn)
+            except Exception as e:
+                logger.error("Generator {} failed: {}".format(key, e))
+            if not task.rerun:
+                break
+            task.rerun = False
+
+    def _cancel_generators(self):
+        for task in self._generator_tasks.values():
+            # running draw can't be interrupted, generator drops its result
+            task.rerun = False
+        self._generator_tasks = {}
+        super()._cancel_generators()
+
+
+class AsyncPlayer(Player):
+    def __init__(self, *args, **kwargs):
+        # signals are read by async pubsub, no sync one is subscribed
+        kwargs.setdefault("redis", get_redis_conn())
+        super().__init__(*args, **kwargs)
+        self._aredis = None
+        self._pubsub = None
+        self._sender = None
+        self._writer = None
+        self._clock_task = None
+
+    def run(self):
+        asyncio.run(self.run_async())
+
+    async def run_async(self):
+        self._aredis = await get_async_redis_conn()
+        self._sender = SignalSender(
+            self._aredis, settings.SCHEDULER_REDIS_CHANNEL
+        )
+        self._writer = RedisWriter(self._aredis)
+        self._pubsub = self._aredis.pubsub(ignore_subscribe_messages=True)
+        await self._pubsub.subscribe(settings.PLAYER_REDIS_CHANNEL)
+
+        await asyncio.to_thread(self._clock.measure)
+        self._clock_task = asyncio.create_task(sync_clock(self._clock))
+        self._ack_ready()
+        next_idle_check = time.monotonic() + self.IDLE_INTERVAL
+        while self._should_run():
+            signal = await get_and_decode_async_redis_message(
+                self._pubsub,
+                timeout=self._get_timeout(next_idle_check),
+            )
+            if signal:
+                self._dispatch_signal(signal)
+            self._check_deadlines()
+            if time.monotonic() >= next_idle_check:
+                self._check_idle()
+                self._on_flush_latency()
+                next_idle_check = time.monotonic() + self.IDLE_INTERVAL
+        await self._writer.drain()
+
+    def _send_scheduler_signal(self, name, args):
+        self._sender.send(name, args)
+
+    def _on_flush_latency(self):
+        self._writer.write_latency(self._latency)
@@ -0,0 +1,296 @@
+"""
+Latency benchmarks of players with dummy media backend.
+
+Benchmark acts as scheduler, sends PLAY of next track as soon as
+TRACK_FINISHED arrives and collects player latency histograms, or sends
+synchronized PLAY to several players and collects their start skews.
+Signals are exchanged on dedicated channels, so running player and
+scheduler are not affected.
+
+Eviction benchmark replays a week of device schedule against download
+cache of limited capacity and compares hit rates of eviction policies.
+"""
+import datetime
+import json
+import logging
+import os
+import random
+import threading
+import time
+
+from soundfleet_player import latency
+from soundfleet_player.conf import settings
+from soundfleet_player.eviction import (
+    CachedFile,
+    LRUPolicy,
+    ScheduleAwarePolicy,
+)
+from soundfleet_player.media_backends.dummy import MediaBackend
+from soundfleet_player.player import Player
+from soundfleet_player.utils import (
+    get_and_decode_redis_message,
+    get_local_time,
+    get_redis_conn,
+)
+
+
+logger = logging.getLogger(__name__)
+
+
+class BenchmarkPlayer(Player):
+    def __init__(self, *args, name="benchmark", **kwargs):
+        super().__init__(*args, **kwargs)
+        self._latency = latency.LatencyTracker(name)
+        self._latency.reset()
+        self.stopped = threading.Event()
+
+    def _should_run(self):
+        return not self.stopped.is_set()
+
+
+def run_benchmark(transitions=100, track_length=0.05, timeout=10):
+    """
+    Play transitions + 1 tracks back to back.
+    :return: latency summary of player histograms
+    """
+    channels = _use_benchmark_channels()
+    redis = get_redis_conn()
+    pubsub = redis.pubsub(ignore_subscribe_messages=True)
+    pubsub.subscribe(settings.SCHEDULER_REDIS_CHANNEL)
+    player = BenchmarkPlayer(MediaBackend())
+    thread = threading.Thread(target=player.run, daemon=True)
+    try:
+        thread.start()
+        _wait_for(pubsub, "PLAYER_READY", timeout)
+        for i in range(transitions + 1):
+            track = {
+                "id": i,
+                "file": "{}.ogg".format(i),
+                "length": track_length,
+            }
+            signal = json.dumps(("PLAY", [track], latency.now()))
+            redis.publish(settings.PLAYER_REDIS_CHANNEL, signal)
+            _wait_for(pubsub, "TRACK_FINISHED", timeout)
+    finally:
+        _stop_players(redis, [(player, thread)], timeout)
+        pubsub.close()
+        _restore_channels(channels)
+    return player._latency.summary()
+
+
+def run_sync_benchmark(players=3, starts=5, delay=0.2, timeout=10):
+    """
+    Start tracks synchronized by shared clock on several players,
+    first player is leader and the rest are followers.
+    :param delay: seconds between PLAY and synchronized start
+    :return: summary of start skews in ms and max spread of skews
+        between players of single start
+    """
+    channels = _use_benchmark_channels()
+    redis = get_redis_conn()
+    pubsub = redis.pubsub(ignore_subscribe_messages=True)
+    pubsub.subscribe(settings.SCHEDULER_REDIS_CHANNEL)
+    clock = latency.SharedClock(redis)
+    skews = latency.Histogram()
+    spreads = []
+    running = []
+    try:
+        for i in range(players):
+            player = BenchmarkPlayer(
+                MediaBackend(), name="benchmark:{}".format(i)
+            )
+            player._follower = i > 0
+            thread = threading.Thread(target=player.run, daemon=True)
+            thread.start()
+            running.append((player, thread))
+        _wait_for(pubsub, "PLAYER_READY", timeout)
+        for i in range(starts):
+            track = {"id": i, "file": "{}.ogg".format(i), "length": 60}
+            signal = json.dumps(
+                ("PLAY", [track, clock.now() + delay], latency.now())
+            )
+            redis.publish(settings.PLAYER_REDIS_CHANNEL, signal)
+            start_skews = []
+            while len(start_skews) < players:
+                signal = _wait_for(pubsub, "START_SKEW", timeout)
+                track_id, skew = signal[1]
+                if track_id == i:
+                    start_skews.append(skew * 1000)
+                    skews.observe(abs(skew) * 1000)
+            spreads.append(max(start_skews) - min(start_skews))
+    finally:
+        _stop_players(redis, running, timeout)
+        pubsub.close()
+        _restore_channels(channels)
+    return {
+        "players": players,
+        "clock_round_trip_ms": round(clock.round_trip * 1000, 3)
+        if clock.round_trip is not None
+        else None,
+        "start_skew": skews.summary(),
+        "max_spread_ms": round(max(spreads, default=0), 3),
+    }
+
+
+def run_eviction_benchmark(
+    device,
+    capacity=None,
+    days=7,
+    policies=None,
+    start=None,
+    watermark=None,
+    seed=0,
+):
+    """
+    Replay days of schedule of device, music tracks drawn back to back
+    from active block, ads of ad blocks in their intervals and spots,
+    and download every track missing in cache of capacity bytes.
+    All policies replay the same tracks.
+    :param capacity: bytes of cache, quarter of all tracks by default
+    :param watermark: bytes freed on top of missing track when cache is
+        full, CACHE_FREE_WATERMARK by default
+    :param policies: dict of name and policy class created with device
+    :return: dict of policy name and its hit rate and downloaded bytes
+    """
+    if policies is None:
+        policies = {"lru": LRUPolicy, "schedule": ScheduleAwarePolicy}
+    if start is None:
+        start = get_local_time(device.timezone)
+    if capacity is None:
+        capacity = sum(
+            _track_size(track) for track in device.audio_tracks.values()
+        )
+        capacity //= 4
+    if watermark is None:
+        watermark = settings.CACHE_FREE_WATERMARK
+    requests = _replay_schedule(device, start, days, random.Random(seed))
+    return {
+        name: _replay_cache(policy(device), requests, capacity, watermark)
+        for name, policy in policies.items()
+    }
+
+
+def _replay_schedule(device, start, days, rng):
+    """
+    :return: list of time and track requested at that time, by time
+    """
+    end = start + datetime.timedelta(days=days)
+    audio_tracks = device.audio_tracks
+    requests = []
+    # music tracks played back to back
+    at = start
+    while at < end:
+        block = device.music_schedule.get_block(at)
+        track_ids = [
+            track_id
+            for track_id in (block["tracks"] if block else [])
+            if track_id in audio_tracks
+        ]
+        if not track_ids:
+            at = device.music_schedule.next_change(at)
+            continue
+        track = audio_tracks[rng.choice(track_ids)]
+        requests.append((at, track))
+        at += datetime.timedelta(seconds=max(track.get("length") or 0, 1))
+    # ads drawn in intervals of active ad block
+    at = start
+    while at < end:
+        block = device.ad_schedule.get_block(at)
+        if block is None:
+            at = device.ad_schedule.next_change(at)
+            continue
+        track_ids = [
+            track_id for track_id in block["tracks"] if track_id in audio_tracks
+        ]
+        if track_ids and not block["play_all_ads"]:
+            track_ids = rng.choices(track_ids, k=block["ads_count_per_block"])
+        requests.extend((at, audio_tracks[track_id]) for track_id in track_ids)
+        at += datetime.timedelta(minutes=max(block["playback_interval"], 1))
+    at = start
+    while True:
+        next_spot = device.spot_schedule.next_spot(at)
+        if next_spot is None or next_spot[0] >= end:
+            break
+        at, spot = next_spot
+        if spot["track"] in audio_tracks:
+            requests.append((at, audio_tracks[spot["track"]]))
+    return sorted(requests, key=lambda request: request[0])
+
+
+def _replay_cache(policy, requests, capacity, watermark):
+    cache = {}
+    used = 0
+    hits = 0
+    downloaded = 0
+    for at, track in requests:
+        name = track["file"]
+        size = _track_size(track)
+        if name in cache:
+            hits += 1
+            cache[name] = cache[name]._replace(
+                last_access=at.timestamp(), hits=cache[name].hits + 1
+            )
+            continue
+        downloaded += size
+        if used + size > capacity:
+            # free space for track and watermark at once, like storage
+            target = size + watermark
+            for evicted in policy.order(cache.values(), now=at):
+                if capacity - used >= target:
+                    break
+                used -= cache.pop(evicted).size
+        if used + size > capacity:
+            # pinned files take whole cache, track is not kept
+            continue
+        cache[name] = CachedFile(
+            name, at.timestamp(), 1, size, frozenset([name])
+        )
+        used += size
+    return {
+        "requests": len(requests),
+        "hit_rate": round(hits / len(requests), 4) if requests else None,
+        "downloaded_mb": round(downloaded / 2**20, 1),
+    }
+
+
+def _track_size(track):
+    return track.get("size") or 1
+
+
+def _use_benchmark_channels():
+    channels = (
+        settings.PLAYER_REDIS_CHANNEL,
+        settings.SCHEDULER_REDIS_CHANNEL,
+    )
+    suffix = "BENCHMARK_{}".format(os.getpid())
+    settings.PLAYER_REDIS_CHANNEL = "PLAYER_{}".format(suffix)
+    settings.SCHEDULER_REDIS_CHANNEL = "SCHEDULER_{}".format(suffix)
+    return channels
+
+
+def _restore_channels(channels):
+    (
+        settings.PLAYER_REDIS_CHANNEL,
+        settings.SCHEDULER_REDIS_CHANNEL,
+    ) = channels
+
+
+def _stop_players(redis, running, timeout):
+    for player, _ in running:
+        player.stopped.set()
+    # wake players waiting for signals
+    redis.publish(settings.PLAYER_REDIS_CHANNEL, json.dumps(("STOP", [])))
+    for player, thread in running:
+        thread.join(timeout)
+        player._latency.flush()
+
+
+def _wait_for(pubsub, name, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        signal = get_and_decode_redis_message(
+            pubsub, logger, timeout=deadline - time.monotonic()
+        )
+        if signal and signal[0] == name:
+            return signal
+    raise TimeoutError("{} not received in {}s".format(name, timeout))
@@ -1,8 +1,12 @@
-import datetime
 import json
 import os
+import time
 
-from soundfleet_player.storage import AudioTrackStorage
+from soundfleet_player.storage import (
+    AudioTrackStorage,
+    OFFSET_SUFFIX,
+    PARTIAL_SUFFIX,
+)
 from soundfleet_player.utils import get_redis_conn
 
 
@@ -52,6 +56,80 @@ class AdBlocksCache(RedisCache):
         self._redis.set(key, json.dumps(val))
 
 
+class SpotsCache(RedisCache):
+    def get_key(self):
+        return "SPOTS"
+
+    def get(self):
+        val = self._redis.get(self.get_key())
+        return json.loads(val) if val else []
+
+    def set(self, val):
+        key = self.get_key()
+        self._redis.set(key, json.dumps(val))
+
+
+class SyncGenerationCache(RedisCache):
+    def get_key(self):
+        return "SYNC_GENERATION"
+
+    def get(self):
+        val = self._redis.get(self.get_key())
+        return int(val) if val else 0
+
+    def incr(self):
+        return self._redis.incr(self.get_key())
+
+
+class SchedulerStateCache(RedisCache):
+    def __init__(self, zone=None):
+        super().__init__()
+        self._zone = zone
+
+    def get_key(self):
+        if self._zone is None:
+            return "SCHEDULER_STATE"
+        return f"SCHEDULER_STATE:{self._zone}"
+
+    def get(self):
+        val = self._redis.get(self.get_key())
+        return json.loads(val) if val else {}
+
+    def set(self, val):
+        self._redis.set(self.get_key(), json.dumps(val))
+
+
+class MetricsCache(RedisCache):
+    def __init__(self, name):
+        super().__init__()
+        self._name = name
+
+    def get_key(self):
+        return f"METRICS:{self._name}"
+
+    def get(self):
+        return self._redis.hgetall(self.get_key())
+
+    def set(self, **values):
+        self._redis.hset(self.get_key(), mapping=values)
+
+
+class LatencyCache(RedisCache):
+    def __init__(self, name):
+        super().__init__()
+        self._name = name
+
+    def get_key(self):
+        return f"LATENCY:{self._name}"
+
+    def get(self):
+        val = self._redis.get(self.get_key())
+        return json.loads(val) if val else {}
+
+    def set(self, val):
+        self._redis.set(self.get_key(), json.dumps(val))
+
+
 class AudioTracksCache(RedisCache):
     def get_key(self, id="*"):
         return "AUDIO_TRACK:{}".format(id)
@@ -65,12 +143,12 @@ class AudioTracksCache(RedisCache):
         return json.loads(self._redis.get(self.get_key(id)))
 
     def all(self):
-        key = self.get_key()
+        keys = self._redis.keys(self.get_key())
+        if not keys:
+            return {}
         return {
             track["id"]: track
-            for track in map(
-                json.loads, [self._redis.get(k) for k in self._redis.keys(key)]
-            )
+            for track in map(json.loads, filter(None, self._redis.mget(keys)))
         }
 
     def update(self, track_list):
@@ -86,35 +164,84 @@ class AudioTracksCache(RedisCache):
             self.set(track)
 
 
-class DownloadLRUCache(RedisCache):
-    def __init__(self, download_dir):
-        super().__init__()
+class TrackIndexCache(RedisCache):
+    """
+    Digest of content of each downloaded track file.
+    """
 
-        init_t = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        for fname in os.listdir(download_dir):
-            key = self.get_key(fname)
-            if self._redis.get(key):
-                continue
-            self._redis.set(self.get_key(fname), init_t)
+    def get_key(self):
+        return "TRACK_INDEX"
 
-    def get_key(self, filename="*"):
-        return f"DL_CACHE:{filename}"
+    def get(self, filename):
+        return self._redis.hget(self.get_key(), filename)
 
-    def touch(self, filename):
-        key = self.get_key(filename)
-        self._redis.set(
-            key, datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        )
+    def set(self, filename, digest):
+        self._redis.hset(self.get_key(), filename, digest)
 
     def remove(self, filename):
-        key = self.get_key(filename)
-        self._redis.delete(key)
+        self._redis.hdel(self.get_key(), filename)
 
     def all(self):
-        key = self.get_key()
-        return {
-            k.split(":")[-1]: datetime.datetime.strptime(
-                self._redis.get(k), "%Y-%m-%d %H:%M:%S"
-            )
-            for k in self._redis.keys(key)
+        return self._redis.hgetall(self.get_key())
+
+    def references(self, digest):
+        """
+        :return: number of track files with content of digest
+        """
+        return sum(
+            1 for value in self._redis.hvals(self.get_key()) if value == digest
+        )
+
+
+class DownloadLRUCache(RedisCache):
+    """
+    Downloaded files in sorted set scored by time of last access, with
+    number of accesses of each file.
+    """
+
+    def __init__(self, download_dir):
+        super().__init__()
+
+        init_t = time.time()
+        files = {
+            fname: init_t
+            for fname in os.listdir(download_dir)
+            # unfinished download, resumed or overwritten later
+            if not fname.endswith((PARTIAL_SUFFIX, OFFSET_SUFFIX))
         }
+        if files:
+            # files already known keep their time of access
+            self._redis.zadd(self.get_key(), files, nx=True)
+
+    def get_key(self):
+        return "DL_CACHE"
+
+    def get_hits_key(self):
+        return "DL_CACHE_HITS"
+
+    def touch(self, filename):
+        pipe = self._redis.pipeline(transaction=False)
+        pipe.zadd(self.get_key(), {filename: time.time()})
+        pipe.hincrby(self.get_hits_key(), filename, 1)
+        pipe.execute()
+
+    def remove(self, *filenames):
+        if filenames:
+            pipe = self._redis.pipeline(transaction=False)
+            pipe.zrem(self.get_key(), *filenames)
+            pipe.hdel(self.get_hits_key(), *filenames)
+            pipe.execute()
+
+    def entries(self):
+        """
+        :return: list of file name, time of last access and number of
+            accesses, from least recently used
+        """
+        pipe = self._redis.pipeline(transaction=False)
+        pipe.zrange(self.get_key(), 0, -1, withscores=True)
+        pipe.hgetall(self.get_hits_key())
+        files, hits = pipe.execute()
+        return [
+            (fname, last_access, int(hits.get(fname, 0)))
+            for fname, last_access in files
+        ]
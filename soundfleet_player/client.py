@@ -26,7 +26,12 @@ def make_request(
     headers=None,
     request_timeout=None,
     response_timeout=None,
+    return_client_errors=False,
 ):
+    """
+    :return: response, None on connection and HTTP errors, or response
+        with 4xx status if return_client_errors is set
+    """
     timeout = request_timeout or 5, response_timeout or 10
     func = getattr(requests, method)
     headers = _get_auth_headers() if headers is None else headers
@@ -43,5 +48,7 @@ def make_request(
         return response
     except requests.HTTPError as e:
         logger.error(e)
+        if return_client_errors and e.response.status_code < 500:
+            return e.response
     except Exception as e:
         logger.critical(e)
@@ -35,6 +35,65 @@ def setup_settings():
             PLAYER_REDIS_CHANNEL=env(
                 "PLAYER_REDIS_CHANNEL", default="PLAYER_REDIS_CHANNEL"
             ),
+            # time in seconds spent on reading pending signals per scheduler
+            # iteration, 0 reads single signal per iteration
+            SCHEDULER_DRAIN_BUDGET=float(
+                env("SCHEDULER_DRAIN_BUDGET", default=0.05)
+            ),
+            # number of music tracks drawn and downloaded ahead,
+            # limited by Scheduler.BUFFER_LENGTH
+            MUSIC_LOOKAHEAD=int(env("MUSIC_LOOKAHEAD", default=1)),
+            # seconds before end of track when next track is handed to
+            # player for gapless start, 0 disables preloading
+            PRELOAD_AHEAD=float(env("PRELOAD_AHEAD", default=5)),
+            # backend run in child process by isolated backend
+            ISOLATED_MEDIA_BACKEND=env(
+                "ISOLATED_MEDIA_BACKEND",
+                default="soundfleet_player.media_backends.vlc",
+            ),
+            # crossfade of tracks in seconds, used by crossfade backend
+            CROSSFADE=float(env("CROSSFADE", default=3)),
+            # parallel track downloads sharing HTTP connections
+            DOWNLOAD_WORKERS=int(env("DOWNLOAD_WORKERS", default=4)),
+            # bytes written at once, read timeout in seconds and number
+            # of resumed attempts of single download
+            DOWNLOAD_CHUNK_SIZE=int(
+                env("DOWNLOAD_CHUNK_SIZE", default=2**20)
+            ),
+            DOWNLOAD_TIMEOUT=float(env("DOWNLOAD_TIMEOUT", default=30)),
+            DOWNLOAD_RETRIES=int(env("DOWNLOAD_RETRIES", default=3)),
+            # bytes freed on top of downloaded track when cache is full,
+            # so following downloads don't evict files one by one
+            CACHE_FREE_WATERMARK=int(
+                env("CACHE_FREE_WATERMARK", default=2**29)
+            ),
+            # class choosing evicted files, see eviction module, files of
+            # tracks played in next EVICTION_PIN_HOURS are kept
+            EVICTION_POLICY=env(
+                "EVICTION_POLICY",
+                default="soundfleet_player.eviction.ScheduleAwarePolicy",
+            ),
+            EVICTION_PIN_HOURS=float(env("EVICTION_PIN_HOURS", default=6)),
+            # fixed-time spots are downloaded this many seconds before
+            # start and handed to player SPOT_ARM_AHEAD seconds before start
+            SPOT_DOWNLOAD_AHEAD=float(env("SPOT_DOWNLOAD_AHEAD", default=300)),
+            SPOT_ARM_AHEAD=float(env("SPOT_ARM_AHEAD", default=10)),
+            # seconds between PLAY signal and synchronized start of track
+            # by all players of the space, 0 starts tracks immediately
+            SYNC_START_DELAY=float(env("SYNC_START_DELAY", default=0)),
+            # player only follows leader player of the space and doesn't
+            # report track lifecycle to scheduler
+            SYNC_FOLLOWER=bool(int(env("SYNC_FOLLOWER", default=0))),
+            # ids of zones played by single device, each zone has its own
+            # scheduler state and player, empty for single output device
+            ZONES=env.list("ZONES", default=[]),
+            # audio output device of each zone, e.g. {"bar": "hw:1,0"},
+            # used by VLC backend
+            ZONE_OUTPUT_DEVICES=env.json("ZONE_OUTPUT_DEVICES", default={}),
+            # spool of play events waiting for upload
+            OUTBOX_DIR=env(
+                "OUTBOX_DIR", default="/var/lib/soundfleet/outbox"
+            ),
             LOGGING_CONFIG={
                 "version": 1,
                 "disable_existing_loggers": True,
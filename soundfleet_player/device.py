@@ -1,3 +1,4 @@
+import copy
 import json
 import logging
 import time
@@ -9,6 +10,7 @@ from typing import Literal, Union
 from soundfleet_player import client
 from soundfleet_player import cache
 from soundfleet_player.conf import settings
+from soundfleet_player.schedule import ScheduleIndex, SpotSchedule
 from soundfleet_player.types import (
     AdBlock,
     AudioTrack,
@@ -32,14 +34,27 @@ class SyncFailed(Exception):
 class Device:
     SYNC_RETRY_COUNT = 10
     SYNC_COUNTDOWN_TIME = 10
+    # properties read into snapshot by load_snapshot()
+    SNAPSHOT = (
+        "sync_generation",
+        "timezone",
+        "music_schedule",
+        "ad_schedule",
+        "spot_schedule",
+        "audio_tracks",
+    )
 
     def __init__(self):
         self._redis = get_redis_conn()
         self._cache = cache.DeviceCache()
         self._music_blocks_cache = cache.MusicBlocksCache()
         self._ad_blocks_cache = cache.AdBlocksCache()
+        self._spots_cache = cache.SpotsCache()
         self._audio_tracks_cache = cache.AudioTracksCache()
+        self._sync_generation_cache = cache.SyncGenerationCache()
         self._sync_in_progress = False
+        # in-process snapshot of cached state, see invalidate()
+        self._snapshot = {}
 
     def sync(self):
         if self._sync_in_progress:
@@ -49,12 +64,34 @@ class Device:
             self._cache.set(state["device"])
             self._music_blocks_cache.set(state["music_blocks"])
             self._ad_blocks_cache.set(state["ad_blocks"])
+            self._spots_cache.set(state.get("spots", []))
             self._audio_tracks_cache.update(state["audio_tracks"])
+            self._sync_generation_cache.incr()
         except SyncFailed:
             logger.error("Failed to sync device, using state from cache.")
         finally:
+            self.invalidate()
             self._ack_sync()
 
+    def invalidate(self, snapshot=None) -> None:
+        """
+        Drop in-process snapshot of device state,
+        next access reads state from Redis.
+        :param snapshot: snapshot from load_snapshot() used instead
+        """
+        self._snapshot = snapshot or {}
+
+    def load_snapshot(self) -> dict:
+        """
+        Read all of device state from Redis into new snapshot, current
+        snapshot is not touched, so it can be called from other thread.
+        """
+        loader = copy.copy(self)
+        loader._snapshot = {}
+        for name in self.SNAPSHOT:
+            getattr(loader, name)
+        return loader._snapshot
+
     def get_state(self) -> DeviceState:
         sync_id = self._start_sync_task()
         return self._get_device_state(sync_id)
@@ -63,29 +100,55 @@ class Device:
         device = self._cache.get()
         device.update(**kwargs)
         self._cache.set(device)
+        self.invalidate()
+        self._notify_updated()
 
     def update_music_blocks_cache(self, music_blocks) -> None:
         self._music_blocks_cache.set(music_blocks)
+        self._sync_generation_cache.incr()
+        self.invalidate()
+        self._notify_updated()
+
+    @property
+    def sync_generation(self) -> int:
+        """
+        Number increased every time synced schedule changes.
+        """
+        return self._get_cached(
+            "sync_generation", self._sync_generation_cache.get
+        )
 
     @property
     def volume(self) -> int:
-        device = self._cache.get() or {}
-        return device.get("volume", 100)
+        return self._device_data.get("volume", 100)
 
     @property
     def timezone(self) -> pytz.timezone:
-        device = self._cache.get() or {}
-        tzname = device.get("timezone_name", "UTC")
-        return pytz.timezone(tzname)
+        return self._get_cached(
+            "timezone",
+            lambda: pytz.timezone(
+                self._device_data.get("timezone_name", "UTC")
+            ),
+        )
 
     @property
     def playback_priority(self) -> Literal["music", "ads"]:
-        device = self._cache.get() or {}
-        return device.get("playback_priority", "music")
+        return self._device_data.get("playback_priority", "music")
+
+    @property
+    def _device_data(self) -> dict:
+        return self._get_cached("device", lambda: self._cache.get() or {})
+
+    def _get_cached(self, name, load):
+        try:
+            return self._snapshot[name]
+        except KeyError:
+            value = self._snapshot[name] = load()
+            return value
 
     @property
     def music_blocks(self) -> MusicBlock:
-        music_blocks = self._music_blocks_cache.get() or []
+        music_blocks = self._raw_music_blocks
         music_blocks = map(
             lambda block: MusicBlock(
                 {
@@ -105,7 +168,7 @@ class Device:
 
     @property
     def ad_blocks(self) -> list[AdBlock]:
-        ad_blocks = self._ad_blocks_cache.get() or []
+        ad_blocks = self._raw_ad_blocks
         ad_blocks = map(
             lambda block: AdBlock(
                 {
@@ -127,11 +190,47 @@ class Device:
         return list(ad_blocks)
 
     @property
-    def audio_tracks(self) -> list[AudioTrack]:
-        return self._audio_tracks_cache.all()
+    def _raw_music_blocks(self) -> list[dict]:
+        return self._get_cached(
+            "music_blocks", lambda: self._music_blocks_cache.get() or []
+        )
+
+    @property
+    def _raw_ad_blocks(self) -> list[dict]:
+        return self._get_cached(
+            "ad_blocks", lambda: self._ad_blocks_cache.get() or []
+        )
+
+    @property
+    def music_schedule(self) -> ScheduleIndex:
+        return self._get_cached(
+            "music_schedule",
+            lambda: ScheduleIndex(self._raw_music_blocks, self.timezone),
+        )
+
+    @property
+    def ad_schedule(self) -> ScheduleIndex:
+        return self._get_cached(
+            "ad_schedule",
+            lambda: ScheduleIndex(self._raw_ad_blocks, self.timezone),
+        )
+
+    @property
+    def spot_schedule(self) -> SpotSchedule:
+        return self._get_cached(
+            "spot_schedule",
+            lambda: SpotSchedule(
+                self._spots_cache.get() or [], self.timezone
+            ),
+        )
+
+    @property
+    def audio_tracks(self) -> dict[int, AudioTrack]:
+        return self._get_cached("audio_tracks", self._audio_tracks_cache.all)
 
     def get_audio_track(self, track_id: int):
-        return self._audio_tracks_cache.get(track_id)
+        # return copy, callers extend track with playback details
+        return dict(self.audio_tracks[track_id])
 
     @property
     def _state_url(self) -> str:
@@ -190,6 +289,11 @@ class Device:
         self._sync_in_progress = False
         raise SyncFailed()
 
+    def _notify_updated(self) -> None:
+        # let other processes drop their snapshots, nobody may be listening
+        signal = json.dumps(("DEVICE_UPDATED", []))
+        self._redis.publish(settings.SCHEDULER_REDIS_CHANNEL, signal)
+
     def _ack_sync(self) -> None:
         signal = json.dumps(("DEVICE_SYNC", []))
         while not self._redis.publish(settings.SCHEDULER_REDIS_CHANNEL, signal):
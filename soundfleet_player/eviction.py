@@ -0,0 +1,133 @@
+"""
+Policies choosing files evicted from download cache.
+
+Policy gets all cached files and returns names of those which can be
+evicted, first to evict first. Storage deletes them in this order until
+enough space is free. Policy is configured by EVICTION_POLICY setting,
+dotted path of class created with device.
+"""
+import datetime
+import importlib
+
+from typing import NamedTuple
+
+from soundfleet_player.conf import settings
+from soundfleet_player.utils import get_local_time
+
+
+class CachedFile(NamedTuple):
+    name: str
+    # epoch seconds of last download or reuse
+    last_access: float
+    # number of downloads and reuses
+    hits: int
+    size: int
+    # file names of tracks stored in file
+    tracks: frozenset
+
+
+class LRUPolicy:
+    """
+    Evict least recently used files first.
+    """
+
+    def __init__(self, device=None):
+        pass
+
+    def order(self, files, now=None):
+        return [
+            f.name for f in sorted(files, key=lambda f: f.last_access)
+        ]
+
+
+class ScheduleAwarePolicy:
+    """
+    Files of tracks played by blocks and spots from now until
+    EVICTION_PIN_HOURS are pinned, they are evicted only when nothing
+    else is left, the one needed latest first. Among the rest, files of
+    tracks not referenced by any block or spot go first, then files by
+    GDSF-like priority: last access increased by HIT_VALUE seconds per
+    hit, scaled by mean size to file size, so large rarely used files
+    are evicted before small popular ones.
+    """
+
+    HIT_VALUE = 3600
+
+    def __init__(self, device, horizon=None):
+        self._device = device
+        self._horizon = datetime.timedelta(
+            hours=settings.EVICTION_PIN_HOURS if horizon is None else horizon
+        )
+
+    def order(self, files, now=None):
+        if now is None:
+            now = get_local_time(self._device.timezone)
+        audio_tracks = self._device.audio_tracks
+        needed_at = {
+            audio_tracks[track_id]["file"]: at
+            for track_id, at in self._upcoming(now).items()
+            if track_id in audio_tracks
+        }
+        referenced = {
+            audio_tracks[track_id]["file"]
+            for track_id in self._referenced()
+            if track_id in audio_tracks
+        }
+        unpinned = [f for f in files if not f.tracks & needed_at.keys()]
+        pinned = [f for f in files if f.tracks & needed_at.keys()]
+        mean_size = (
+            sum(f.size for f in unpinned) / len(unpinned) if unpinned else 0
+        )
+
+        def priority(f):
+            value = self.HIT_VALUE * f.hits * mean_size / max(f.size, 1)
+            return (bool(f.tracks & referenced), f.last_access + value)
+
+        def pinned_priority(f):
+            at = min(needed_at[track] for track in f.tracks & needed_at.keys())
+            return (-at.timestamp(), f.last_access)
+
+        return [
+            f.name
+            for f in sorted(unpinned, key=priority)
+            + sorted(pinned, key=pinned_priority)
+        ]
+
+    def _upcoming(self, now):
+        """
+        Ids of tracks of blocks and spots active until horizon, with time
+        they are needed first.
+        """
+        end = now + self._horizon
+        needed_at = {}
+        for schedule in (self._device.music_schedule, self._device.ad_schedule):
+            dt = now
+            while dt <= end:
+                block = schedule.get_block(dt)
+                if block is not None:
+                    for track_id in block["tracks"]:
+                        needed_at.setdefault(track_id, dt)
+                dt = schedule.next_change(dt)
+        dt = now
+        while True:
+            next_spot = self._device.spot_schedule.next_spot(dt)
+            if next_spot is None or next_spot[0] > end:
+                break
+            dt, spot = next_spot
+            needed_at[spot["track"]] = min(needed_at.get(spot["track"], dt), dt)
+        return needed_at
+
+    def _referenced(self):
+        track_ids = set()
+        for schedule in (self._device.music_schedule, self._device.ad_schedule):
+            for block in schedule.blocks:
+                track_ids.update(block["tracks"])
+        track_ids.update(
+            spot["track"] for spot in self._device.spot_schedule.spots
+        )
+        return track_ids
+
+
+def get_eviction_policy(device):
+    module, name = settings.EVICTION_POLICY.rsplit(".", 1)
+    return getattr(importlib.import_module(module), name)(device)
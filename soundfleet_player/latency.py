@@ -0,0 +1,209 @@
+import bisect
+import logging
+import time
+
+from soundfleet_player.cache import LatencyCache
+
+
+logger = logging.getLogger(__name__)
+
+
+def now():
+    """
+    Wall clock timestamp for signals, comparable between processes.
+    """
+    return time.time()
+
+
+class Histogram:
+    """
+    Latency histogram with logarithmic buckets in milliseconds.
+
+    Bucket bounds grow by 2**(1/4) from 0.1ms to about 100s, so
+    percentiles are estimated within ~19% using constant memory.
+    """
+
+    BOUNDS = [round(0.1 * 2 ** (i / 4), 4) for i in range(81)]
+
+    def __init__(self, counts=None, total=0.0, maximum=0.0):
+        self.counts = counts or [0] * (len(self.BOUNDS) + 1)
+        self.total = total
+        self.maximum = maximum
+
+    @property
+    def count(self):
+        return sum(self.counts)
+
+    def observe(self, ms):
+        ms = max(ms, 0)
+        self.counts[bisect.bisect_left(self.BOUNDS, ms)] += 1
+        self.total += ms
+        self.maximum = max(self.maximum, ms)
+
+    def percentile(self, p):
+        count = self.count
+        if not count:
+            return None
+        rank = p / 100 * count
+        seen = 0
+        for idx, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if seen >= rank and bucket_count:
+                if idx >= len(self.BOUNDS):
+                    return round(self.maximum, 3)
+                return min(self.BOUNDS[idx], round(self.maximum, 3))
+        return round(self.maximum, 3)
+
+    def summary(self):
+        count = self.count
+        return {
+            "count": count,
+            "mean": round(self.total / count, 3) if count else None,
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "p99": self.percentile(99),
+            "max": round(self.maximum, 3),
+        }
+
+    def to_dict(self):
+        return {
+            **self.summary(),
+            "total": self.total,
+            # upper bound in ms of each non empty bucket, "inf" for last
+            "buckets": {
+                str(self.BOUNDS[idx]) if idx < len(self.BOUNDS) else "inf": c
+                for idx, c in enumerate(self.counts)
+                if c
+            },
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        counts = [0] * (len(cls.BOUNDS) + 1)
+        for bound, count in data.get("buckets", {}).items():
+            idx = (
+                len(cls.BOUNDS)
+                if bound == "inf"
+                else cls.BOUNDS.index(float(bound))
+            )
+            counts[idx] = count
+        return cls(counts, data.get("total", 0.0), data.get("max", 0.0))
+
+
+class LatencyTracker:
+    """
+    Named latency histograms of a process, kept in memory and stored in
+    Redis by flush(), called periodically by process loop and on request
+    of playerctl, so observing doesn't cost Redis round-trip.
+    """
+
+    # seconds between flushes of histograms changed since last one
+    FLUSH_INTERVAL = 10
+
+    def __init__(self, name):
+        self._cache = LatencyCache(name)
+        self._histograms = {}
+        self.dirty = False
+        try:
+            # continue histograms of previous run
+            for metric, data in self._cache.get().items():
+                self._histograms[metric] = Histogram.from_dict(data)
+        except Exception as e:
+            logger.error("Unable to load latency histograms: {}".format(e))
+
+    def observe(self, metric, seconds):
+        histogram = self._histograms.setdefault(metric, Histogram())
+        histogram.observe(seconds * 1000)
+        self.dirty = True
+
+    def observe_since(self, metric, timestamp):
+        if timestamp is not None:
+            self.observe(metric, now() - timestamp)
+
+    def summary(self):
+        return {
+            metric: histogram.summary()
+            for metric, histogram in self._histograms.items()
+        }
+
+    def reset(self):
+        self._histograms = {}
+        self.dirty = True
+        self.flush()
+
+    def flush(self):
+        """
+        Store histograms in Redis if they changed since last flush.
+        """
+        if not self.dirty:
+            return
+        try:
+            self._cache.set(self.export())
+        except Exception as e:
+            self.dirty = True
+            logger.error("Unable to store latency histograms: {}".format(e))
+
+    def export(self):
+        """
+        :return: histograms as stored in Redis, they are no longer dirty
+        """
+        self.dirty = False
+        return {
+            metric: histogram.to_dict()
+            for metric, histogram in self._histograms.items()
+        }
+
+    def get_key(self):
+        return self._cache.get_key()
+
+
+class SharedClock:
+    """
+    Wall clock of Redis server, shared by processes on different hosts.
+
+    Offset of local clock is taken from Redis TIME sample with shortest
+    round-trip, assuming server read the time half way through it.
+    """
+
+    SAMPLES = 5
+    # seconds after which offset is measured again
+    RESYNC_INTERVAL = 60
+
+    def __init__(self, redis):
+        self._redis = redis
+        self.offset = 0.0
+        self.round_trip = None
+        self._measured_at = None
+
+    def measure(self):
+        best = None
+        for _ in range(self.SAMPLES):
+            sent = time.time()
+            seconds, microseconds = self._redis.time()
+            received = time.time()
+            round_trip = received - sent
+            if best is None or round_trip < best[0]:
+                server_time = seconds + microseconds / 1e6
+                best = (round_trip, server_time - (sent + received) / 2)
+        self.round_trip, self.offset = best
+        self._measured_at = time.monotonic()
+        return self.offset
+
+    def now(self):
+        if (
+            self._measured_at is None
+            or time.monotonic() - self._measured_at >= self.RESYNC_INTERVAL
+        ):
+            try:
+                self.measure()
+            except Exception as e:
+                # keep last offset until Redis is reachable
+                logger.error("Unable to measure clock offset: {}".format(e))
+                self._measured_at = time.monotonic()
+        return time.time() + self.offset
+
+    def from_local(self, timestamp):
+        """
+        Shared clock time of local wall clock timestamp.
+        """
+        return timestamp + self.offset
@@ -1,11 +1,22 @@
-from typing import Protocol
+from typing import Callable, Optional, Protocol
 
 
 from soundfleet_player.types import AudioTrack
 
 
+# media events passed to event callback
+PLAYING = "PLAYING"
+END_REACHED = "END_REACHED"
+ERROR = "ERROR"
+
+EventCallback = Callable[[str, AudioTrack], None]
+
+
 class MediaBackend(Protocol):
     def play(self, track: AudioTrack) -> None:
+        """
+        Start track, replacing track that is currently played.
+        """
         pass
 
     def stop(self) -> None:
@@ -16,3 +27,30 @@ class MediaBackend(Protocol):
 
     def set_volume(self, value: int) -> None:
         pass
+
+    def get_position(self) -> Optional[float]:
+        """
+        Playback position of current track in seconds, None if unknown.
+        """
+        pass
+
+    def get_duration(self) -> Optional[float]:
+        """
+        Seconds from start of current track to start of next one,
+        None if unknown.
+        """
+        pass
+
+    def preload(self, track: AudioTrack) -> None:
+        """
+        Prepare track, so following play of it starts without delay.
+        """
+        pass
+
+    def set_event_callback(self, callback: EventCallback) -> None:
+        """
+        Register callback called with event name and track when playback
+        of track starts or ends. Callback may be called from backend's
+        thread.
+        """
+        pass
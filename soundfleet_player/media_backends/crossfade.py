@@ -0,0 +1,224 @@
+"""
+Two deck VLC backend with crossfade.
+
+Shortly before the end of track (cue out point) backend reports its end
+and fades the deck out, next track is started on the other deck and
+faded in, so tail of outgoing track overlaps head of incoming one.
+"""
+import threading
+
+import vlc
+
+from soundfleet_player.conf import settings
+from soundfleet_player.media_backends.base import (
+    END_REACHED,
+    ERROR,
+    PLAYING,
+    EventCallback,
+)
+from soundfleet_player.media_backends.fader import Fader
+from soundfleet_player.types import AudioTrack
+
+
+class Deck:
+    def __init__(self, on_event, output_device=None):
+        self.player = vlc.MediaPlayer()
+        if output_device is not None:
+            self.player.audio_output_device_set(None, output_device)
+        self.track = None
+        # track is fading out, its events are not reported
+        self.cued_out = False
+        event_manager = self.player.event_manager()
+        for event_type, name in (
+            (vlc.EventType.MediaPlayerPlaying, PLAYING),
+            (vlc.EventType.MediaPlayerEndReached, END_REACHED),
+            (vlc.EventType.MediaPlayerEncounteredError, ERROR),
+        ):
+            event_manager.event_attach(event_type, on_event, self, name)
+
+
+class MediaBackend:
+    # time given to VLC to parse preloaded media, in ms
+    PARSE_TIMEOUT = 5000
+    # cue out is rechecked against VLC position until it is this close
+    CUE_PRECISION = 0.05
+
+    def __init__(self, crossfade=None, output_device=None) -> None:
+        self._crossfade = (
+            settings.CROSSFADE if crossfade is None else crossfade
+        )
+        self._decks = [
+            Deck(self._on_vlc_event, output_device),
+            Deck(self._on_vlc_event, output_device),
+        ]
+        self._active = 0
+        self._volume = 100
+        self._fader = Fader()
+        self._cue_timer = None
+        self._preloaded = None
+        self._event_callback = None
+        self._lock = threading.RLock()
+
+    @property
+    def _deck(self) -> Deck:
+        return self._decks[self._active]
+
+    def play(self, track: AudioTrack) -> None:
+        with self._lock:
+            outgoing = self._deck
+            crossfade = outgoing.cued_out and self._fader.is_ramping(outgoing)
+            if not outgoing.cued_out:
+                # current track is replaced, no crossfade
+                self._stop_deck(outgoing)
+            self._cancel_cue_timer()
+            self._active = 1 - self._active
+            deck = self._deck
+            self._stop_deck(deck)
+            deck.track = track
+            deck.player.set_media(self._get_media(track))
+            if crossfade:
+                deck.player.audio_set_volume(0)
+                self._fader.ramp(
+                    deck,
+                    deck.player.audio_set_volume,
+                    0,
+                    self._volume,
+                    self._crossfade,
+                )
+            else:
+                deck.player.audio_set_volume(self._volume)
+            deck.player.play()
+            if self._get_crossfade(track):
+                self._schedule_cue_out(
+                    deck, track, track["length"] - self._crossfade
+                )
+
+    def stop(self) -> None:
+        with self._lock:
+            self._cancel_cue_timer()
+            for deck in self._decks:
+                self._stop_deck(deck)
+
+    def is_playing(self) -> bool:
+        return self._deck.player.is_playing()
+
+    def set_volume(self, value: int) -> None:
+        with self._lock:
+            self._volume = min(max(value, 0), 100)
+            deck = self._deck
+            if deck.cued_out:
+                return
+            # track fading in ends at new volume
+            if not self._fader.retarget(deck, self._volume):
+                deck.player.audio_set_volume(self._volume)
+
+    def get_position(self):
+        position = self._deck.player.get_time()
+        return position / 1000 if position >= 0 else None
+
+    def get_duration(self):
+        # next track starts at cue out
+        cue_points = self.get_cue_points()
+        return cue_points["cue_out"] / 1000 if cue_points else None
+
+    def preload(self, track: AudioTrack) -> None:
+        media = vlc.Media(track["uri"])
+        # file is opened and parsed in background by VLC
+        media.parse_with_options(
+            vlc.MediaParseFlag.local, self.PARSE_TIMEOUT
+        )
+        self._preloaded = (track["uri"], media)
+
+    def set_event_callback(self, callback: EventCallback) -> None:
+        self._event_callback = callback
+
+    def get_cue_points(self):
+        """
+        Cue points of current track in ms, next track starts fading in
+        at cue out.
+        """
+        with self._lock:
+            deck = self._deck
+            if deck.track is None:
+                return None
+            length = deck.player.get_length()
+            if length <= 0:
+                length = int(deck.track["length"] * 1000)
+            crossfade = int(self._get_crossfade(deck.track) * 1000)
+            return {
+                "cue_in": 0,
+                "cue_out": length - crossfade,
+                "length": length,
+                "crossfade": crossfade,
+            }
+
+    def _get_crossfade(self, track):
+        # short tracks are played whole
+        if self._crossfade <= 0 or track["length"] < 2 * self._crossfade:
+            return 0
+        return self._crossfade
+
+    def _get_media(self, track: AudioTrack):
+        preloaded, self._preloaded = self._preloaded, None
+        if preloaded is not None and preloaded[0] == track["uri"]:
+            return preloaded[1]
+        return vlc.Media(track["uri"])
+
+    def _schedule_cue_out(self, deck, track, delay):
+        self._cue_timer = threading.Timer(
+            max(delay, 0), self._cue_out, args=(deck, track)
+        )
+        self._cue_timer.daemon = True
+        self._cue_timer.start()
+
+    def _cancel_cue_timer(self):
+        if self._cue_timer is not None:
+            self._cue_timer.cancel()
+            self._cue_timer = None
+
+    def _cue_out(self, deck, track):
+        with self._lock:
+            if deck.track is not track or deck.cued_out:
+                return
+            length = deck.player.get_length()
+            position = deck.player.get_time()
+            if length > 0 and position >= 0:
+                remaining = (length - position) / 1000 - self._crossfade
+                if remaining > self.CUE_PRECISION:
+                    # track started late or is longer than declared
+                    self._schedule_cue_out(deck, track, remaining)
+                    return
+            deck.cued_out = True
+            self._fader.ramp(
+                deck,
+                deck.player.audio_set_volume,
+                self._volume,
+                0,
+                self._crossfade,
+                on_done=lambda: self._release_deck(deck, track),
+            )
+        self._emit(END_REACHED, track)
+
+    def _release_deck(self, deck, track):
+        with self._lock:
+            if deck.track is track:
+                self._stop_deck(deck)
+
+    def _stop_deck(self, deck):
+        self._fader.cancel(deck)
+        deck.track = None
+        deck.cued_out = False
+        deck.player.stop()
+
+    def _on_vlc_event(self, event, deck, name):
+        # called from VLC thread, libvlc functions must not be called here
+        track = deck.track
+        if track is None or deck.cued_out:
+            return
+        if name == PLAYING and deck is not self._deck:
+            return
+        self._emit(name, track)
+
+    def _emit(self, name, track):
+        if self._event_callback is not None:
+            self._event_callback(name, track)
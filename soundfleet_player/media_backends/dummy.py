@@ -1,22 +1,49 @@
 import threading
+import time
 
-from functools import partial
-
+from soundfleet_player.media_backends.base import (
+    END_REACHED,
+    PLAYING,
+    EventCallback,
+)
 from soundfleet_player.types import AudioTrack
 
 
 class MediaBackend:
     _is_playing = False
     _volume = 100
+    _timer = None
+    _event_callback = None
+    _track = None
+    _started_at = None
 
     def play(self, track: AudioTrack) -> None:
+        self._cancel_timer()
         self._is_playing = True
-        threading.Timer(
-            track["length"], partial(self._set_is_playing, False)
-        ).start()
+        self._track = track
+        self._started_at = time.monotonic()
+        self._timer = threading.Timer(
+            track["length"], self._on_end_reached, args=(track,)
+        )
+        self._timer.daemon = True
+        self._timer.start()
+        if self._event_callback is not None:
+            self._event_callback(PLAYING, track)
 
     def stop(self):
+        self._cancel_timer()
         self._set_is_playing(False)
+        self._track = None
+
+    def get_position(self):
+        if self._track is None:
+            return None
+        return min(time.monotonic() - self._started_at, self._track["length"])
+
+    def get_duration(self):
+        if self._track is None:
+            return None
+        return self._track["length"]
 
     def is_playing(self):
         return self._is_playing
@@ -24,5 +51,21 @@ class MediaBackend:
     def set_volume(self, value: int):
         self._volume = value
 
+    def preload(self, track: AudioTrack) -> None:
+        pass
+
+    def set_event_callback(self, callback: EventCallback) -> None:
+        self._event_callback = callback
+
+    def _on_end_reached(self, track: AudioTrack):
+        self._set_is_playing(False)
+        if self._event_callback is not None:
+            self._event_callback(END_REACHED, track)
+
+    def _cancel_timer(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
     def _set_is_playing(self, val: bool):
         self._is_playing = val
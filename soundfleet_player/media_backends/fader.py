@@ -0,0 +1,123 @@
+import logging
+import threading
+import time
+import traceback
+
+
+logger = logging.getLogger(__name__)
+
+
+class Ramp:
+    def __init__(self, set_volume, start, end, duration, on_done):
+        self.set_volume = set_volume
+        self.start = start
+        self.end = end
+        self.duration = duration
+        self.on_done = on_done
+        self.started_at = time.monotonic()
+        self.volume = None
+
+    def volume_at(self, now):
+        if self.duration <= 0:
+            return self.end, True
+        progress = min((now - self.started_at) / self.duration, 1)
+        volume = round(self.start + (self.end - self.start) * progress)
+        return volume, progress >= 1
+
+
+class Fader:
+    """
+    Volume ramps run by single timer thread.
+
+    Volume of each step is computed from elapsed monotonic time, so ramps
+    end on time even if some steps are late.
+    """
+
+    # interval between volume steps, in seconds
+    STEP = 0.02
+
+    def __init__(self):
+        self._ramps = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def ramp(self, key, set_volume, start, end, duration, on_done=None):
+        """
+        Move volume from start to end over duration seconds, replaces
+        running ramp of the same key.
+        """
+        with self._lock:
+            self._ramps[key] = Ramp(set_volume, start, end, duration, on_done)
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="fader", daemon=True
+                )
+                self._thread.start()
+        self._wakeup.set()
+
+    def retarget(self, key, end):
+        """
+        Make running ramp of key end at new volume, still on time.
+        :return: False if key has no running ramp
+        """
+        with self._lock:
+            ramp = self._ramps.get(key)
+            if ramp is None:
+                return False
+            now = time.monotonic()
+            volume, _ = ramp.volume_at(now)
+            remaining = max(ramp.started_at + ramp.duration - now, 0)
+            self._ramps[key] = Ramp(
+                ramp.set_volume, volume, end, remaining, ramp.on_done
+            )
+        self._wakeup.set()
+        return True
+
+    def cancel(self, key):
+        with self._lock:
+            self._ramps.pop(key, None)
+
+    def is_ramping(self, key):
+        return key in self._ramps
+
+    def _run(self):
+        next_step = time.monotonic()
+        while True:
+            with self._lock:
+                ramps = list(self._ramps.items())
+            if not ramps:
+                self._wakeup.wait()
+                self._wakeup.clear()
+                next_step = time.monotonic()
+                continue
+            now = time.monotonic()
+            for key, ramp in ramps:
+                volume, done = ramp.volume_at(now)
+                if volume != ramp.volume:
+                    self._call(ramp.set_volume, volume)
+                    ramp.volume = volume
+                if done:
+                    with self._lock:
+                        if self._ramps.get(key) is ramp:
+                            del self._ramps[key]
+                    if ramp.on_done is not None:
+                        self._call(ramp.on_done)
+            # steps are aligned to start, sleeping doesn't accumulate delay
+            next_step += self.STEP
+            delay = next_step - time.monotonic()
+            if delay < 0:
+                next_step = time.monotonic()
+                delay = 0
+            self._wakeup.wait(delay)
+            self._wakeup.clear()
+
+    def _call(self, fn, *args):
+        try:
+            fn(*args)
+        except Exception as e:
+            logger.error(
+                "Fader call {} failed: {} \n {}".format(
+                    fn, e, traceback.format_exc()
+                )
+            )
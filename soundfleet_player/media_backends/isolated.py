@@ -0,0 +1,254 @@
+"""
+Media backend running real backend in child process.
+
+Calls are passed over a pipe and watched by watchdog, child which doesn't
+answer in CALL_TIMEOUT or dies is killed and replaced with standby child
+started in advance, so player recovers without restart.
+"""
+import importlib
+import logging
+import multiprocessing
+import threading
+import time
+
+from soundfleet_player.conf import settings
+from soundfleet_player.media_backends.base import (
+    END_REACHED,
+    ERROR,
+    EventCallback,
+)
+from soundfleet_player.types import AudioTrack
+
+
+logger = logging.getLogger(__name__)
+
+
+class ChildError(Exception):
+    pass
+
+
+def serve(module, conn, events):
+    """
+    Run backend from given module in child process and answer calls.
+    """
+    backend = importlib.import_module(module).MediaBackend()
+    lock = threading.Lock()
+
+    def send_event(name, track):
+        # called from backend threads
+        with lock:
+            events.send((name, track))
+
+    backend.set_event_callback(send_event)
+    try:
+        conn.send((True, None))
+        while True:
+            method, args = conn.recv()
+            try:
+                result = (True, getattr(backend, method)(*args))
+            except Exception as e:
+                result = (False, repr(e))
+            conn.send(result)
+    except (EOFError, OSError):
+        # parent process exited
+        pass
+
+
+class Child:
+    def __init__(self, module, on_event):
+        context = multiprocessing.get_context("spawn")
+        self._conn, child_conn = context.Pipe()
+        self._events, child_events = context.Pipe(duplex=False)
+        self._process = context.Process(
+            target=serve,
+            args=(module, child_conn, child_events),
+            name="media-backend",
+            daemon=True,
+        )
+        self._process.start()
+        child_conn.close()
+        child_events.close()
+        self._ready = False
+        self._on_event = on_event
+        self._reader = threading.Thread(
+            target=self._read_events, name="media-backend-events", daemon=True
+        )
+        self._reader.start()
+
+    @property
+    def pid(self):
+        return self._process.pid
+
+    def wait_ready(self, timeout):
+        if not self._ready:
+            self._receive(timeout)
+            self._ready = True
+
+    def call(self, method, args, timeout):
+        try:
+            self._conn.send((method, args))
+        except (OSError, ValueError) as e:
+            raise ChildError(e)
+        ok, result = self._receive(timeout)
+        if not ok:
+            raise RuntimeError(result)
+        return result
+
+    def kill(self):
+        self._process.kill()
+        self._process.join(1)
+        self._conn.close()
+
+    def _receive(self, timeout):
+        try:
+            if not self._conn.poll(timeout):
+                raise ChildError("no response in {}s".format(timeout))
+            return self._conn.recv()
+        except (EOFError, OSError) as e:
+            raise ChildError(e)
+
+    def _read_events(self):
+        while True:
+            try:
+                name, track = self._events.recv()
+            except (EOFError, OSError):
+                self._on_event(self, None, None)
+                return
+            self._on_event(self, name, track)
+
+
+class MediaBackend:
+    # time given to child process to answer call, in seconds
+    CALL_TIMEOUT = 2
+    # time given to child process to start backend
+    START_TIMEOUT = 30
+
+    def __init__(self, module=None) -> None:
+        self._module = module or settings.ISOLATED_MEDIA_BACKEND
+        self._lock = threading.RLock()
+        self._event_callback = None
+        self._track = None
+        self._volume = None
+        self._closed = False
+        self.restarts = 0
+        self._active = Child(self._module, self._on_child_event)
+        self._active.wait_ready(self.START_TIMEOUT)
+        self._standby = Child(self._module, self._on_child_event)
+
+    def play(self, track: AudioTrack) -> None:
+        with self._lock:
+            self._track = track
+            self._call("play", track)
+
+    def stop(self) -> None:
+        with self._lock:
+            self._track = None
+            self._call("stop")
+
+    def is_playing(self) -> bool:
+        return bool(self._call("is_playing"))
+
+    def set_volume(self, value: int) -> None:
+        with self._lock:
+            self._volume = value
+            self._call("set_volume", value)
+
+    def get_position(self):
+        return self._call("get_position")
+
+    def get_duration(self):
+        return self._call("get_duration")
+
+    def preload(self, track: AudioTrack) -> None:
+        self._call("preload", track)
+
+    def set_event_callback(self, callback: EventCallback) -> None:
+        self._event_callback = callback
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            for child in (self._active, self._standby):
+                if child is not None:
+                    child.kill()
+
+    def _call(self, method, *args):
+        with self._lock:
+            child = self._active
+            try:
+                return child.call(method, args, self.CALL_TIMEOUT)
+            except ChildError as e:
+                logger.error(
+                    "Media backend {} call {} failed: {}".format(
+                        child.pid, method, e
+                    )
+                )
+                self._replace(child)
+
+    def _replace(self, child):
+        """
+        Kill child and promote standby in its place.
+        """
+        with self._lock:
+            if child is not self._active:
+                return
+            started_at = time.monotonic()
+            child.kill()
+            standby, self._standby = self._standby, None
+            try:
+                if standby is None:
+                    # previous standby is still starting
+                    raise ChildError("no standby")
+                standby.wait_ready(self.START_TIMEOUT)
+            except ChildError:
+                if standby is not None:
+                    standby.kill()
+                standby = Child(self._module, self._on_child_event)
+                standby.wait_ready(self.START_TIMEOUT)
+            self._active = standby
+            self.restarts += 1
+            if self._volume is not None:
+                try:
+                    standby.call(
+                        "set_volume", (self._volume,), self.CALL_TIMEOUT
+                    )
+                except ChildError as e:
+                    logger.error("Unable to restore volume: {}".format(e))
+            logger.warning(
+                "Media backend {} replaced with {} in {:.3f}s".format(
+                    child.pid, standby.pid, time.monotonic() - started_at
+                )
+            )
+            # spawn next standby without blocking player
+            threading.Thread(
+                target=self._spawn_standby, name="media-backend-standby"
+            ).start()
+            track, self._track = self._track, None
+        if track is not None:
+            # player moves on to next track
+            self._emit(ERROR, track)
+
+    def _spawn_standby(self):
+        standby = Child(self._module, self._on_child_event)
+        with self._lock:
+            if self._closed:
+                standby.kill()
+            else:
+                self._standby = standby
+
+    def _on_child_event(self, child, name, track):
+        if child is not self._active or self._closed:
+            return
+        if name is None:
+            # child died
+            self._replace(child)
+            return
+        if name in (END_REACHED, ERROR):
+            with self._lock:
+                if track == self._track:
+                    self._track = None
+        self._emit(name, track)
+
+    def _emit(self, name, track):
+        if self._event_callback is not None:
+            self._event_callback(name, track)
@@ -1,17 +1,50 @@
 import vlc
 
+from soundfleet_player.media_backends.base import (
+    END_REACHED,
+    ERROR,
+    PLAYING,
+    EventCallback,
+)
 from soundfleet_player.types import AudioTrack
 
 
 class MediaBackend:
-    def __init__(self) -> None:
+    # time given to VLC to parse preloaded media, in ms
+    PARSE_TIMEOUT = 5000
+
+    def __init__(self, output_device=None) -> None:
         self._player = vlc.MediaPlayer()
+        if output_device is not None:
+            self._player.audio_output_device_set(None, output_device)
+        self._track = None
+        self._preloaded = None
+        self._event_callback = None
+        event_manager = self._player.event_manager()
+        event_manager.event_attach(
+            vlc.EventType.MediaPlayerPlaying,
+            self._on_vlc_event,
+            PLAYING,
+        )
+        event_manager.event_attach(
+            vlc.EventType.MediaPlayerEndReached,
+            self._on_vlc_event,
+            END_REACHED,
+        )
+        event_manager.event_attach(
+            vlc.EventType.MediaPlayerEncounteredError,
+            self._on_vlc_event,
+            ERROR,
+        )
 
     def play(self, track: AudioTrack):
-        self._player.set_media(vlc.Media(track["uri"]))
+        self._player.stop()
+        self._track = track
+        self._player.set_media(self._get_media(track))
         self._player.play()
 
     def stop(self) -> None:
+        self._track = None
         self._player.stop()
 
     def is_playing(self) -> bool:
@@ -20,3 +53,34 @@ class MediaBackend:
     def set_volume(self, value: int) -> None:
         value = min(max(value, 0), 100)
         self._player.audio_set_volume(value)
+
+    def get_position(self):
+        position = self._player.get_time()
+        return position / 1000 if position >= 0 else None
+
+    def get_duration(self):
+        length = self._player.get_length()
+        return length / 1000 if length > 0 else None
+
+    def preload(self, track: AudioTrack) -> None:
+        media = vlc.Media(track["uri"])
+        # file is opened and parsed in background by VLC
+        media.parse_with_options(
+            vlc.MediaParseFlag.local, self.PARSE_TIMEOUT
+        )
+        self._preloaded = (track["uri"], media)
+
+    def _get_media(self, track: AudioTrack):
+        preloaded, self._preloaded = self._preloaded, None
+        if preloaded is not None and preloaded[0] == track["uri"]:
+            return preloaded[1]
+        return vlc.Media(track["uri"])
+
+    def set_event_callback(self, callback: EventCallback) -> None:
+        self._event_callback = callback
+
+    def _on_vlc_event(self, event, name):
+        # called from VLC thread, libvlc functions must not be called here
+        track = self._track
+        if self._event_callback is not None and track is not None:
+            self._event_callback(name, track)
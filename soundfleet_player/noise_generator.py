@@ -1,42 +1,97 @@
 import datetime
-import json
 import logging
-import os
 import random
+import uuid
 
 from collections import deque
-from functools import partial
 
 from soundfleet_player.conf import settings
+from soundfleet_player.eviction import get_eviction_policy
 from soundfleet_player.storage import AudioTrackStorage, DownloadFailed
-from soundfleet_player.utils import get_redis_conn
+from soundfleet_player.utils import encode_signal, get_redis_conn
 
 
 logger = logging.getLogger(__name__)
 
 
 class BaseGenerator:
-    def __init__(self, device):
-        self._storage = AudioTrackStorage()
+    def __init__(self, device, storage=None, zone=None):
+        self._storage = storage or AudioTrackStorage(
+            get_eviction_policy(device)
+        )
         self._device = device
+        self._zone = zone
         self._redis = get_redis_conn()
+        self._cancelled = False
+        # sent with downloaded tracks, scheduler drops tracks of
+        # generators replaced by sync
+        self.id = uuid.uuid4().hex
+
+    def cancel(self):
+        """
+        Stop reporting drawn tracks, generator was replaced after sync.
+        """
+        self._cancelled = True
+
+    def _publish(self, name, args):
+        signal = encode_signal(name, args, self._zone, timestamp=False)
+        while not self._redis.publish(settings.SCHEDULER_REDIS_CHANNEL, signal):
+            continue
+
+
+class BlockBasedGenerator(BaseGenerator):
+    """
+    Generator drawing tracks from music or ad blocks.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._compiled_schedule = None
+
+    @property
+    def _schedule(self):
+        # blocks are compiled once, generators are recreated on every sync
+        if self._compiled_schedule is None:
+            self._compiled_schedule = self._get_schedule()
+        return self._compiled_schedule
+
+    def _get_schedule(self):
+        raise NotImplementedError
+
+    def has_block(self, draw_time):
+        return self._schedule.get_block(draw_time) is not None
 
-    @staticmethod
-    def _track_absolute_path(track):
-        return os.path.join(settings.DOWNLOAD_DIR, track["file"])
+    def next_block_change(self, draw_time):
+        """
+        Time when block active at draw_time may change.
+        """
+        return self._schedule.next_change(draw_time)
 
 
-class MusicBlockBasedGenerator(BaseGenerator):
+class MusicBlockBasedGenerator(BlockBasedGenerator):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self._history = deque(maxlen=10)
 
-    def draw_and_download(self, draw_time):
-        def _block_cmp(t, block):
-            return block["start"] <= t <= block["end"]
+    def _get_schedule(self):
+        return self._device.music_schedule
+
+    def get_state(self):
+        return {"history": list(self._history)}
 
-        cmp = partial(_block_cmp, draw_time)
-        block = next(filter(cmp, self._device.music_blocks), None)
+    def set_state(self, state):
+        self._history.extend(state.get("history", []))
+
+    def is_track_scheduled(self, track, draw_time):
+        block = self._schedule.get_block(draw_time)
+        return (
+            block is not None
+            and track["id"] in block["tracks"]
+            and track["id"] in self._device.audio_tracks
+        )
+
+    def draw_and_download(self, draw_time):
+        block = self._schedule.get_block(draw_time)
 
         population = block["tracks"] if block is not None else None
 
@@ -52,7 +107,6 @@ class MusicBlockBasedGenerator(BaseGenerator):
         # save drawn track id in history to avoid frequent repetition
         self._history.append(track_id)
         track = self._device.get_audio_track(track_id)
-        track.update(uri=f"file://{self._track_absolute_path(track)}")
         logger.debug("Drawn music track: {}".format(track))
         self._download_and_ack(track)
         self._notify_finished()
@@ -67,50 +121,71 @@ class MusicBlockBasedGenerator(BaseGenerator):
         return track_id
 
     def _download_and_ack(self, track):
+        if self._cancelled:
+            return
         try:
             track = self._storage.download(track)
-            signal = json.dumps(
-                (
-                    "MUSIC_TRACK_DOWNLOADED",
-                    [
-                        track,
-                    ],
-                )
-            )
-            while not self._redis.publish(
-                settings.SCHEDULER_REDIS_CHANNEL, signal
-            ):
-                continue
         except DownloadFailed:
-            signal = json.dumps(
-                (
-                    "MUSIC_TRACK_DOWNLOAD_FAILED",
-                    [
-                        track,
-                    ],
-                )
-            )
-            while not self._redis.publish(
-                settings.SCHEDULER_REDIS_CHANNEL, signal
-            ):
-                continue
+            if not self._cancelled:
+                self._publish("MUSIC_TRACK_DOWNLOAD_FAILED", [track, self.id])
+            return
+        # generator may have been replaced by sync while downloading
+        if not self._cancelled:
+            self._publish("MUSIC_TRACK_DOWNLOADED", [track, self.id])
 
     def _notify_finished(self):
-        signal = json.dumps(("MUSIC_GENERATOR_FINISHED", []))
-        while not self._redis.publish(settings.SCHEDULER_REDIS_CHANNEL, signal):
-            continue
+        self._publish("MUSIC_GENERATOR_FINISHED", [])
 
 
-class AdBlockBasedGenerator(BaseGenerator):
+class SpotGenerator(BaseGenerator):
+    """
+    Download track of fixed-time spot ahead of its start.
+    """
+
+    def download(self, spot):
+        if self._cancelled:
+            return
+        try:
+            track = self._device.get_audio_track(spot["track"])
+            track = self._storage.download(track)
+        except (KeyError, DownloadFailed) as e:
+            logger.error("Unable to download spot {}: {}".format(spot, e))
+            self._publish("SPOT_TRACK_DOWNLOAD_FAILED", [spot["id"]])
+            return
+        self._publish("SPOT_TRACK_DOWNLOADED", [spot["id"], track])
+
+
+class AdBlockBasedGenerator(BlockBasedGenerator):
     _current_block_id = None
     _next_block = None
 
-    def draw_and_download(self, draw_time):
-        def _block_cmp(t, block):
-            return block["start"] <= t <= block["end"]
+    @property
+    def next_draw_time(self):
+        """
+        Time from which next ads can be drawn in current block.
+        """
+        return self._next_block
+
+    def _get_schedule(self):
+        return self._device.ad_schedule
+
+    def get_state(self):
+        return {
+            "current_block_id": self._current_block_id,
+            "next_block": self._next_block.isoformat()
+            if self._next_block
+            else None,
+        }
+
+    def set_state(self, state):
+        self._current_block_id = state.get("current_block_id")
+        next_block = state.get("next_block")
+        self._next_block = (
+            datetime.datetime.fromisoformat(next_block) if next_block else None
+        )
 
-        cmp = partial(_block_cmp, draw_time)
-        block = next(filter(cmp, self._device.ad_blocks), None)
+    def draw_and_download(self, draw_time):
+        block = self._schedule.get_block(draw_time)
 
         if block is None:
             self._notify_finished()
@@ -130,13 +205,12 @@ class AdBlockBasedGenerator(BaseGenerator):
                 tracks = []
         for track in tracks:
             logger.debug("Drawn ad track: {}".format(track))
-            self._download_and_ack(track)
+        if tracks:
+            self._download_and_ack_many(tracks)
         self._notify_finished()
 
     def _notify_finished(self):
-        signal = json.dumps(("ADS_GENERATOR_FINISHED", []))
-        while not self._redis.publish(settings.SCHEDULER_REDIS_CHANNEL, signal):
-            continue
+        self._publish("ADS_GENERATOR_FINISHED", [])
 
     def _draw_ads(self, block):
         population = block["tracks"]
@@ -156,15 +230,6 @@ class AdBlockBasedGenerator(BaseGenerator):
             tracks = [
                 self._device.get_audio_track(track_id) for track_id in track_ids
             ]
-        tracks = list(
-            map(
-                lambda track: dict(
-                    track,
-                    **{"uri": f"file://{self._track_absolute_path(track)}"},
-                ),
-                tracks,
-            )
-        )
         duration = sum(map(lambda track: track["length"], tracks)) - 1
         return (
             tracks,
@@ -178,15 +243,19 @@ class AdBlockBasedGenerator(BaseGenerator):
             ),
         )
 
-    def _download_and_ack(self, track):
-        track = self._storage.download(track)
-        signal = json.dumps(
-            (
-                "AD_TRACK_DOWNLOADED",
-                [
-                    track,
-                ],
-            )
-        )
-        while not self._redis.publish(settings.SCHEDULER_REDIS_CHANNEL, signal):
-            continue
+    def _download_and_ack_many(self, tracks):
+        """
+        Download ads of break in parallel, acked in order they were drawn.
+        """
+        if self._cancelled:
+            return
+        futures = self._storage.download_many(tracks)
+        for future in futures:
+            try:
+                track = future.result()
+            except DownloadFailed as e:
+                logger.error("Skipping ad, download failed: {}".format(e))
+                continue
+            if self._cancelled:
+                return
+            self._publish("AD_TRACK_DOWNLOADED", [track, self.id])
@@ -0,0 +1,207 @@
+import json
+import logging
+import os
+import threading
+
+from soundfleet_player import client
+
+
+logger = logging.getLogger(__name__)
+
+
+class Outbox:
+    """
+    Durable queue of requests to remote server.
+
+    Events are appended as JSON lines to segment files rotated by size,
+    background thread uploads them in batches and stores its position
+    in offset file, so events survive outages and restarts.
+    Fully uploaded segments are removed. Events rejected by server with
+    4xx status won't be accepted by retrying, they are moved to
+    rejected file and upload continues with next one.
+    """
+
+    SEGMENT_SIZE = 2**20  # 1MB
+    BATCH_SIZE = 50
+    MIN_BACKOFF = 1
+    MAX_BACKOFF = 300
+    # upload pending events at least this often, in seconds
+    UPLOAD_INTERVAL = 60
+
+    def __init__(self, directory, url, method="post"):
+        self._directory = directory
+        self._url = url
+        self._method = method
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+        self._segment = None
+        self._cursor = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(
+            target=self._upload_forever, name="outbox", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._wakeup.set()
+        self._thread = None
+
+    def append(self, event) -> None:
+        line = json.dumps(event) + "\n"
+        with self._lock:
+            self._ensure_directory()
+            if self._segment is None:
+                self._segment = max(self._segments(), default=1)
+            path = self._segment_path(self._segment)
+            if (
+                os.path.exists(path)
+                and os.path.getsize(path) >= self.SEGMENT_SIZE
+            ):
+                self._segment += 1
+                path = self._segment_path(self._segment)
+            with open(path, "a") as f:
+                f.write(line)
+        self._wakeup.set()
+
+    def upload_pending(self) -> bool:
+        """
+        Upload events until outbox is empty.
+        :return: False if upload failed and should be retried
+        """
+        while True:
+            batch = self._read_batch()
+            if not batch:
+                return True
+            for event, cursor in batch:
+                response = client.make_request(
+                    self._url,
+                    self._method,
+                    data=event,
+                    return_client_errors=True,
+                )
+                if response is None:
+                    # connection error or 5xx, retry later
+                    self._save_cursor()
+                    return False
+                if not response.ok:
+                    self._reject(event, response.status_code)
+                self._cursor = cursor
+            self._save_cursor()
+
+    def _reject(self, event, status_code):
+        logger.error(
+            "Outbox event rejected with status {}: {}".format(
+                status_code, event
+            )
+        )
+        line = json.dumps({"status": status_code, "event": event}) + "\n"
+        with open(self._rejected_path, "a") as f:
+            f.write(line)
+
+    def _upload_forever(self):
+        backoff = self.MIN_BACKOFF
+        while not self._stopped.is_set():
+            try:
+                uploaded = self.upload_pending()
+            except Exception as e:
+                logger.error("Outbox upload failed: {}".format(e))
+                uploaded = False
+            if uploaded:
+                backoff = self.MIN_BACKOFF
+                self._wakeup.wait(self.UPLOAD_INTERVAL)
+                self._wakeup.clear()
+            else:
+                logger.debug("Retrying outbox upload in {}s".format(backoff))
+                self._stopped.wait(backoff)
+                backoff = min(backoff * 2, self.MAX_BACKOFF)
+
+    def _read_batch(self):
+        """
+        Read up to BATCH_SIZE events after cursor.
+        :return: list of pairs (event, cursor after event)
+        """
+        batch = []
+        segment, position = self._get_cursor()
+        while len(batch) < self.BATCH_SIZE:
+            path = self._segment_path(segment)
+            if not os.path.exists(path):
+                later = [s for s in self._segments() if s > segment]
+                if not later:
+                    break
+                segment, position = min(later), 0
+                continue
+            with open(path) as f:
+                f.seek(position)
+                while len(batch) < self.BATCH_SIZE:
+                    line = f.readline()
+                    if not line.endswith("\n"):
+                        # end of file or line which is still being written
+                        break
+                    position = f.tell()
+                    batch.append((json.loads(line), (segment, position)))
+            if len(batch) >= self.BATCH_SIZE:
+                break
+            with self._lock:
+                if segment >= max(self._segments(), default=segment):
+                    # segment is still being written
+                    break
+            # segment fully read, continue from next one
+            segment, position = segment + 1, 0
+            if batch:
+                # segment is removed once its last event is uploaded
+                batch[-1] = (batch[-1][0], (segment, position))
+            else:
+                self._cursor = (segment, position)
+                self._save_cursor()
+        return batch
+
+    def _get_cursor(self):
+        if self._cursor is None:
+            self._cursor = (min(self._segments(), default=1), 0)
+            try:
+                with open(self._offset_path) as f:
+                    self._cursor = tuple(json.load(f))
+            except (OSError, ValueError):
+                pass
+        return self._cursor
+
+    def _save_cursor(self):
+        tmp_path = self._offset_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self._cursor, f)
+        os.replace(tmp_path, self._offset_path)
+        # segments before cursor are fully uploaded
+        for segment in self._segments():
+            if segment < self._cursor[0]:
+                os.unlink(self._segment_path(segment))
+
+    def _ensure_directory(self):
+        if not os.path.exists(self._directory):
+            os.makedirs(self._directory, exist_ok=True)
+
+    def _segments(self):
+        if not os.path.exists(self._directory):
+            return []
+        return [
+            int(name.split(".")[0])
+            for name in os.listdir(self._directory)
+            if name.endswith(".jsonl") and name.split(".")[0].isdigit()
+        ]
+
+    def _segment_path(self, segment):
+        return os.path.join(self._directory, "{:010d}.jsonl".format(segment))
+
+    @property
+    def _offset_path(self):
+        return os.path.join(self._directory, "offset.json")
+
+    @property
+    def _rejected_path(self):
+        return os.path.join(self._directory, "rejected.jsonl")
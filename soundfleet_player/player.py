@@ -1,12 +1,18 @@
-import json
 import logging
 import time
 import traceback
+import uuid
 
+from soundfleet_player import latency
 from soundfleet_player.conf import settings
-from soundfleet_player.media_backends.base import MediaBackend
+from soundfleet_player.media_backends.base import (
+    ERROR,
+    PLAYING,
+    MediaBackend,
+)
 from soundfleet_player.utils import (
     Null,
+    encode_signal,
     get_and_decode_redis_message,
     get_redis_conn,
 )
@@ -17,50 +23,116 @@ logger = logging.getLogger(__name__)
 
 class Player:
     _current_track = None
+    # track started right after current one ends
+    _next_track = None
+    # monotonic time until which backend has to start playing current track
+    _start_deadline = None
+    # timestamps of last play request and end of last track
+    _play_requested_at = None
+    _ended_at = None
+    # monotonic time of next TRACK_POSITION report
+    _next_position_report = None
+    # track waiting for synchronized start, its monotonic start time
+    # and shared clock start times of current and preloaded tracks
+    _armed_track = None
+    _armed_deadline = None
+    _start_at = None
+    _next_start_at = None
+    # fixed-time spot waiting for start, its monotonic start time
+    # (None while spot waits for end of current track) and shared
+    # clock start time of spot being started
+    _spot = None
+    _spot_deadline = None
+    _spot_start_at = None
+    # interval of PLAYER_IDLE signals
+    IDLE_INTERVAL = 10
+    # time given to media backend to start playing
+    PLAY_TIMEOUT = 10
+    # interval of TRACK_POSITION signals while track is playing
+    POSITION_INTERVAL = 5
+    # loop wakes up this early before synchronized start and sleeps
+    # the rest, wait for signals is not precise enough
+    SYNC_GUARD = 0.02
+    # signals sent by follower player, leader reports track lifecycle
+    FOLLOWER_SIGNALS = ("START_SKEW", "SPOT_STARTED")
 
-    def __init__(self, media_backend: MediaBackend):
+    def __init__(self, media_backend: MediaBackend, zone=None, redis=None):
+        # zone players share Redis connection, signals are routed
+        # to them by MultiZonePlayer
+        self._zone = zone
         self._media_backend = media_backend
-        self._redis = get_redis_conn()
-        self._redis_pipe = self._redis.pubsub()
-        self._redis_pipe.subscribe(settings.PLAYER_REDIS_CHANNEL)
+        self._media_backend.set_event_callback(self._media_event_callback)
+        if redis is None:
+            self._redis = get_redis_conn()
+            self._redis_pipe = self._redis.pubsub()
+            self._redis_pipe.subscribe(settings.PLAYER_REDIS_CHANNEL)
+        else:
+            self._redis = redis
+            self._redis_pipe = None
+        self._latency = latency.LatencyTracker(
+            "player" if zone is None else f"player:{zone}"
+        )
+        self._clock = latency.SharedClock(self._redis)
+        self._follower = settings.SYNC_FOLLOWER
+        # media events of other players on the same channel are ignored
+        self._instance_id = uuid.uuid4().hex
         self._signal_map = {
             "PLAY": self._on_play,
             "SET_VOLUME": self._on_set_volume,
             "SKIP": self._on_skip,
+            "PRELOAD": self._on_preload,
+            "SPOT": self._on_spot,
+            "MEDIA_EVENT": self._on_media_event,
+            "FLUSH_LATENCY": self._on_flush_latency,
         }
 
     def run(self):
-        counter = 1
         self._ack_ready()
+        next_idle_check = time.monotonic() + self.IDLE_INTERVAL
         while self._should_run():
-            # check if any sound is playing and send signal to scheduler if not
-            if self._current_track and not self._is_playing():
-                logger.debug(
-                    f"Player finished playing {self._current_track},"
-                    f" sending TRACK_FINISHED signal"
-                )
-                self._ack_finish()
-
-            signal = get_and_decode_redis_message(self._redis_pipe, logger)
+            # block until signal arrives, end of track is signalled
+            # by media backend event
+            signal = get_and_decode_redis_message(
+                self._redis_pipe,
+                logger,
+                timeout=self._get_timeout(next_idle_check),
+            )
             if signal:
                 self._dispatch_signal(signal)
-            if counter % 100 == 0:
-                # ack scheduler that player is idle every 100th iteration
-                # which is about 10s
-                if not self._is_playing():
-                    logger.debug("Player is idle, sending PLAYER_IDLE signal")
-                    self._ack_idle()
-                counter = 1
-            else:
-                counter += 1
-            time.sleep(0.1)
+            self._check_deadlines()
+            if time.monotonic() >= next_idle_check:
+                self._check_idle()
+                self._latency.flush()
+                next_idle_check = time.monotonic() + self.IDLE_INTERVAL
 
     @classmethod
     def _should_run(cls):
         return True
 
+    def _get_timeout(self, next_idle_check):
+        deadline = next_idle_check
+        for armed in (self._armed_deadline, self._spot_deadline):
+            if armed is not None:
+                deadline = min(deadline, armed - self.SYNC_GUARD)
+        for other in (self._start_deadline, self._next_position_report):
+            if other is not None:
+                deadline = min(deadline, other)
+        return max(deadline - time.monotonic(), 0)
+
+    def _check_deadlines(self):
+        self._check_spot()
+        self._check_armed_start()
+        self._check_start_timeout()
+        if (
+            self._next_position_report is not None
+            and time.monotonic() >= self._next_position_report
+        ):
+            self._report_position()
+
     def _dispatch_signal(self, signal):
-        name, args = signal
+        name, args = signal[:2]
+        if len(signal) > 2 and signal[2] is not None:
+            self._latency.observe_since("signal_transit", signal[2])
         func = self._signal_map.get(name, Null())
         try:
             func(*args)
@@ -71,29 +143,160 @@ class Player:
                 )
             )
 
-    def _play(self, track):
-        if self._is_playing():
-            self._media_backend.stop()
-        self._media_backend.play(track)
+    def _play(self, track, spot_start_at=None):
+        # backend replaces or crossfades track that is still playing
         self._current_track = track
-        self._ack_play()
-        # give player some time to connect to stream or load and play file
-        t = time.time()
-        while not self._is_playing():
-            if time.time() - t > 10:  # wait 10s
-                break
-            logger.warning(
-                f"Player not yet playing, "
-                f"time left: {t - time.time()}s, track: {track}"
-            )
-            time.sleep(1)
-        if self._is_playing():
-            logger.info(f"Player started playing {track}")
+        self._spot_start_at = spot_start_at
+        self._play_requested_at = latency.now()
+        # start is confirmed by PLAYING media event, signals are handled
+        # while backend connects to stream or loads file
+        self._start_deadline = time.monotonic() + self.PLAY_TIMEOUT
+        self._media_backend.play(track)
+
+    def _arm(self, track, start_at):
+        """
+        Load track and start it at shared clock time start_at,
+        so all players of the space start it at once.
+        """
+        self._start_at = start_at
+        delay = start_at - self._clock.now()
+        if delay <= 0:
+            # start time passed already, skew is reported
+            self._play(track)
+            return
+        self._media_backend.preload(track)
+        self._armed_track = track
+        self._armed_deadline = time.monotonic() + delay
+
+    def _disarm(self):
+        self._armed_track = None
+        self._armed_deadline = None
+
+    def _check_armed_start(self):
+        if self._armed_deadline is None:
+            return
+        if not self._sleep_until(self._armed_deadline):
+            return
+        track = self._armed_track
+        self._disarm()
+        self._play(track)
+
+    def _sleep_until(self, deadline):
+        """
+        Sleep rest of SYNC_GUARD before deadline.
+        :return: False if deadline is still too far
+        """
+        remaining = deadline - time.monotonic()
+        if remaining > self.SYNC_GUARD:
+            return False
+        if remaining > 0:
+            time.sleep(remaining)
+        return True
+
+    def _arm_spot(self, track, start_at, priority):
+        self._spot = {
+            "track": track,
+            "start_at": start_at,
+            "priority": priority,
+        }
+        self._spot_deadline = time.monotonic() + max(
+            start_at - self._clock.now(), 0
+        )
+        self._media_backend.preload(track)
+
+    def _check_spot(self):
+        if self._spot_deadline is None:
+            return
+        if self._spot["priority"] == "follow" and self._current_track:
+            if time.monotonic() >= self._spot_deadline:
+                # spot starts once current track ends
+                self._spot_deadline = None
+            return
+        if self._sleep_until(self._spot_deadline):
+            self._start_spot()
+
+    def _is_spot_waiting(self):
+        return self._spot is not None and self._spot_deadline is None
+
+    def _start_spot(self):
+        """
+        Start spot instead of current or preloaded track, scheduler
+        continues after spot.
+        """
+        spot, self._spot = self._spot, None
+        self._spot_deadline = None
+        self._next_track = None
+        self._next_start_at = None
+        self._start_at = None
+        self._disarm()
+        self._send_scheduler_signal(
+            "SPOT_START", [spot["track"], self._current_track]
+        )
+        self._play(spot["track"], spot_start_at=spot["start_at"])
+
+    def _is_starting(self):
+        return self._start_deadline is not None
+
+    def _check_start_timeout(self):
+        if self._is_starting() and time.monotonic() >= self._start_deadline:
+            logger.error(f"Unable to play {self._current_track}")
+            self._media_backend.stop()
+            self._ack_failed()
+            self._play_next()
+
+    def _check_idle(self):
+        if (
+            self._is_starting()
+            or self._is_playing()
+            or self._armed_track is not None
+        ):
+            return
+        if self._current_track:
+            # end of track event was lost
+            logger.warning(f"Player not playing {self._current_track}")
+            self._end_track()
+            if self._current_track or self._armed_track is not None:
+                return
+        # silence while idle is not transition gap
+        self._ended_at = None
+        logger.debug("Player is idle, sending PLAYER_IDLE signal")
+        self._ack_idle()
+
+    def _media_event_callback(self, event, track):
+        # called from media backend thread, pass event to player loop
+        signal = encode_signal(
+            "MEDIA_EVENT",
+            [event, track, latency.now(), self._instance_id],
+            self._zone,
+            timestamp=False,
+        )
+        self._redis.publish(settings.PLAYER_REDIS_CHANNEL, signal)
+
+    def _preload(self, track, start_at=None):
+        self._next_track = track
+        self._next_start_at = start_at
+        self._media_backend.preload(track)
+
+    def _play_next(self):
+        track, self._next_track = self._next_track, None
+        start_at, self._next_start_at = self._next_start_at, None
+        if not track:
+            return
+        if start_at is not None:
+            self._arm(track, start_at)
         else:
-            logger.error(f"Unable to play {track}")
+            self._start_at = None
+            self._play(track)
 
     def _skip(self):
-        if self._current_track and self._is_playing():
+        # scheduler draws new track after skip
+        self._next_track = None
+        self._next_start_at = None
+        self._disarm()
+        if self._current_track and (
+            self._is_starting() or self._is_playing()
+        ):
+            self._ended_at = latency.now()
             self._media_backend.stop()
             self._ack_finish()
 
@@ -101,49 +304,142 @@ class Player:
         self._media_backend.set_volume(val)
 
     def _ack_ready(self):
-        signal = json.dumps(("PLAYER_READY", []))
-        while not self._redis.publish(settings.SCHEDULER_REDIS_CHANNEL, signal):
-            time.sleep(0.1)
+        self._send_scheduler_signal("PLAYER_READY", [])
 
     def _ack_idle(self):
-        signal = json.dumps(("PLAYER_IDLE", []))
-        while not self._redis.publish(settings.SCHEDULER_REDIS_CHANNEL, signal):
-            time.sleep(0.1)
+        self._send_scheduler_signal("PLAYER_IDLE", [])
 
     def _ack_play(self):
-        signal = json.dumps(
-            (
-                "TRACK_PLAY",
-                [
-                    self._current_track,
-                ],
-            )
-        )
-        while not self._redis.publish(settings.SCHEDULER_REDIS_CHANNEL, signal):
-            time.sleep(0.1)
+        self._send_scheduler_signal("TRACK_PLAY", [self._current_track])
 
     def _ack_finish(self):
-        signal = json.dumps(
-            (
-                "TRACK_FINISHED",
-                [
-                    self._current_track,
-                ],
-            )
+        self._send_scheduler_signal("TRACK_FINISHED", [self._current_track])
+        self._current_track = None
+        self._start_deadline = None
+        self._next_position_report = None
+
+    def _ack_failed(self):
+        self._send_scheduler_signal("TRACK_FAILED", [self._current_track])
+        self._current_track = None
+        self._start_deadline = None
+        self._next_position_report = None
+
+    def _report_position(self):
+        """
+        Send position and duration of current track in seconds,
+        scheduler uses them to predict end of track.
+        """
+        self._next_position_report = (
+            time.monotonic() + self.POSITION_INTERVAL
+        )
+        position = self._media_backend.get_position()
+        duration = self._media_backend.get_duration()
+        if position is None or duration is None:
+            return
+        self._send_scheduler_signal(
+            "TRACK_POSITION",
+            [self._current_track["id"], round(position, 3), round(duration, 3)],
         )
+
+    def _send_scheduler_signal(self, name, args):
+        if self._follower and name not in self.FOLLOWER_SIGNALS:
+            return
+        signal = encode_signal(name, args, self._zone)
         while not self._redis.publish(settings.SCHEDULER_REDIS_CHANNEL, signal):
             time.sleep(0.1)
-        self._current_track = None
+
+    def _observe_start(self, timestamp):
+        self._latency.observe(
+            "backend_start", timestamp - self._play_requested_at
+        )
+        if self._ended_at is not None:
+            self._latency.observe("transition_gap", timestamp - self._ended_at)
+            self._ended_at = None
+        if self._start_at is not None:
+            skew = self._clock.from_local(timestamp) - self._start_at
+            self._start_at = None
+            self._latency.observe("start_skew", abs(skew))
+            self._send_scheduler_signal(
+                "START_SKEW", [self._current_track["id"], round(skew, 4)]
+            )
+        if self._spot_start_at is not None:
+            error = self._clock.from_local(timestamp) - self._spot_start_at
+            self._spot_start_at = None
+            self._latency.observe("spot_start_error", abs(error))
+            self._send_scheduler_signal(
+                "SPOT_STARTED", [self._current_track["id"], round(error, 4)]
+            )
 
     def _is_playing(self):
         return self._media_backend.is_playing()
 
     # local signals
-    def _on_play(self, track):
-        self._play(track)
+    def _on_play(self, track, start_at=None):
+        # PLAY interrupts current track, scheduler drops preloaded one
+        self._next_track = None
+        self._next_start_at = None
+        self._disarm()
+        if start_at is not None:
+            self._arm(track, start_at)
+        else:
+            self._start_at = None
+            self._play(track)
 
     def _on_set_volume(self, val):
         self._set_volume(val)
 
     def _on_skip(self):
         self._skip()
+
+    def _on_preload(self, track, start_at=None):
+        self._preload(track, start_at)
+        if self._current_track is None and self._armed_track is None:
+            # current track ended before PRELOAD arrived, scheduler
+            # counts preloaded track as started by TRACK_FINISHED
+            self._play_next()
+
+    def _on_spot(self, track, start_at, priority):
+        self._arm_spot(track, start_at, priority)
+
+    def _on_flush_latency(self):
+        self._latency.flush()
+
+    def _on_media_event(self, event, track, timestamp=None, source=None):
+        if source is not None and source != self._instance_id:
+            # event of other player subscribed to the channel
+            return
+        if track != self._current_track:
+            # event of track that was already stopped or replaced
+            return
+        timestamp = timestamp or latency.now()
+        if event == PLAYING:
+            if self._is_starting():
+                self._start_deadline = None
+                logger.info(f"Player started playing {track}")
+                self._ack_play()
+                self._observe_start(timestamp)
+                self._report_position()
+            return
+        self._ended_at = timestamp
+        if event == ERROR:
+            logger.error(f"Media backend failed playing {track}")
+            if self._is_starting():
+                self._ack_failed()
+                if self._is_spot_waiting():
+                    self._start_spot()
+                else:
+                    self._play_next()
+                return
+        logger.debug(f"Player finished playing {track}")
+        self._end_track()
+
+    def _end_track(self):
+        """
+        Current track ended, waiting spot replaces it without
+        TRACK_FINISHED, otherwise preloaded track is started.
+        """
+        if self._is_spot_waiting():
+            self._start_spot()
+            return
+        self._ack_finish()
+        self._play_next()
@@ -0,0 +1,197 @@
+import bisect
+import datetime
+
+from collections import defaultdict
+
+
+MICROSECONDS_IN_DAY = 24 * 60 * 60 * 10**6
+
+
+def _parse_time(time_str) -> int:
+    """
+    Convert "HH:MM:SS" to microseconds since midnight.
+    """
+    hours, minutes, seconds = time_str.split(":")
+    return (int(hours) * 3600 + int(minutes) * 60 + int(seconds)) * 10**6
+
+
+def _time_of_day(dt) -> int:
+    return (
+        dt.hour * 3600 + dt.minute * 60 + dt.second
+    ) * 10**6 + dt.microsecond
+
+
+class ScheduleIndex:
+    """
+    Immutable interval index of music or ad blocks.
+
+    Blocks are compiled once into sorted segments of local wall-clock time,
+    so finding active block is a bisect instead of parsing and scanning
+    every block. Block start and end are inclusive, block with end before
+    start crosses midnight and continues next day.
+
+    Blocks can be limited to a calendar with optional keys:
+    "weekdays" - list of days of week (0 is Monday),
+    "dates" - list of "YYYY-MM-DD" dates.
+    When blocks overlap, date specific blocks take precedence over weekday
+    specific ones, then blocks without calendar, then order of blocks.
+    """
+
+    def __init__(self, blocks, timezone):
+        self._timezone = timezone
+        self._blocks = tuple(blocks)
+        self._calendars = tuple(map(self._compile_calendar, self._blocks))
+
+        starts = defaultdict(list)
+        ends = defaultdict(list)
+        for idx, block in enumerate(self._blocks):
+            start = _parse_time(block["start"])
+            end = _parse_time(block["end"]) + 1  # make end exclusive
+            rank = (self._calendar_rank(self._calendars[idx]), idx)
+            if start < end:
+                pieces = [(start, end, 0)]
+            else:
+                # block crosses midnight, second piece belongs
+                # to calendar day of block start
+                pieces = [(start, MICROSECONDS_IN_DAY, 0), (0, end, 1)]
+            for piece_start, piece_end, day_offset in pieces:
+                piece = (rank, day_offset, idx)
+                starts[piece_start].append(piece)
+                ends[piece_end].append(piece)
+
+        boundaries = sorted({0, MICROSECONDS_IN_DAY, *starts, *ends})
+        segments = []
+        active = set()
+        for boundary in boundaries[:-1]:
+            active.difference_update(ends[boundary])
+            active.update(starts[boundary])
+            segments.append(tuple(sorted(active)))
+        self._boundaries = tuple(boundaries)
+        self._segments = tuple(segments)
+
+    def __len__(self):
+        return len(self._blocks)
+
+    @property
+    def blocks(self):
+        return self._blocks
+
+    def get_block(self, dt):
+        """
+        Return block active at given time or None.
+        """
+        local_dt = self._localize(dt)
+        idx = bisect.bisect_right(self._boundaries, _time_of_day(local_dt))
+        for _, day_offset, block_idx in self._segments[idx - 1]:
+            date = local_dt.date() - datetime.timedelta(days=day_offset)
+            if self._is_in_calendar(self._calendars[block_idx], date):
+                return self._blocks[block_idx]
+        return None
+
+    def next_change(self, dt):
+        """
+        Return time after which active block may be different.
+        """
+        local_dt = self._localize(dt)
+        idx = bisect.bisect_right(self._boundaries, _time_of_day(local_dt))
+        naive = datetime.datetime.combine(
+            local_dt.date(), datetime.time.min
+        ) + datetime.timedelta(microseconds=self._boundaries[idx])
+        if hasattr(self._timezone, "localize"):
+            # normalize moves times skipped by DST change forward
+            return self._timezone.normalize(self._timezone.localize(naive))
+        return naive.replace(tzinfo=self._timezone)
+
+    def _localize(self, dt):
+        if dt.tzinfo is None:
+            return dt
+        return dt.astimezone(self._timezone)
+
+    @staticmethod
+    def _compile_calendar(block):
+        weekdays = block.get("weekdays")
+        dates = block.get("dates")
+        return (
+            frozenset(weekdays) if weekdays else None,
+            frozenset(
+                datetime.date.fromisoformat(date) for date in dates
+            )
+            if dates
+            else None,
+        )
+
+    @staticmethod
+    def _calendar_rank(calendar):
+        weekdays, dates = calendar
+        if dates is not None:
+            return 0
+        if weekdays is not None:
+            return 1
+        return 2
+
+    @staticmethod
+    def _is_in_calendar(calendar, date):
+        weekdays, dates = calendar
+        if weekdays is not None and date.weekday() not in weekdays:
+            return False
+        if dates is not None and date not in dates:
+            return False
+        return True
+
+
+class SpotSchedule:
+    """
+    Ad spots played at fixed local wall-clock times.
+
+    Spots use the same optional calendar keys as blocks.
+    """
+
+    # days searched for next occurrence of calendar limited spots
+    HORIZON_DAYS = 8
+
+    def __init__(self, spots, timezone):
+        self._timezone = timezone
+        spots = sorted(spots, key=lambda spot: _parse_time(spot["time"]))
+        self._spots = tuple(spots)
+        self._times = tuple(_parse_time(spot["time"]) for spot in spots)
+        self._calendars = tuple(
+            map(ScheduleIndex._compile_calendar, self._spots)
+        )
+
+    def __len__(self):
+        return len(self._spots)
+
+    @property
+    def spots(self):
+        return self._spots
+
+    def next_spot(self, dt):
+        """
+        Return pair of aware start time and spot of first spot
+        starting after dt, or None.
+        """
+        if not self._spots:
+            return None
+        local_dt = dt.astimezone(self._timezone)
+        date = local_dt.date()
+        idx = bisect.bisect_right(self._times, _time_of_day(local_dt))
+        for _ in range(self.HORIZON_DAYS):
+            for spot_idx in range(idx, len(self._spots)):
+                if ScheduleIndex._is_in_calendar(
+                    self._calendars[spot_idx], date
+                ):
+                    return (
+                        self._localize(date, self._times[spot_idx]),
+                        self._spots[spot_idx],
+                    )
+            date += datetime.timedelta(days=1)
+            idx = 0
+        return None
+
+    def _localize(self, date, time_of_day):
+        naive = datetime.datetime.combine(
+            date, datetime.time.min
+        ) + datetime.timedelta(microseconds=time_of_day)
+        if hasattr(self._timezone, "localize"):
+            return self._timezone.normalize(self._timezone.localize(naive))
+        return naive.replace(tzinfo=self._timezone)
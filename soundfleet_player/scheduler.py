@@ -1,18 +1,24 @@
 import datetime
-import json
 import logging
-import threading
 import time
 import traceback
 
-from soundfleet_player import client
+from collections import deque
+
+from soundfleet_player import client, latency
+from soundfleet_player.cache import MetricsCache, SchedulerStateCache
 from soundfleet_player.conf import settings
 from soundfleet_player.noise_generator import (
     AdBlockBasedGenerator,
     MusicBlockBasedGenerator,
+    SpotGenerator,
 )
 from soundfleet_player.device import Device
+from soundfleet_player.outbox import Outbox
+from soundfleet_player.timers import Timers
+from soundfleet_player.workers import WorkerPool
 from soundfleet_player.utils import (
+    encode_signal,
     get_and_decode_redis_message,
     get_local_time,
     get_redis_conn,
@@ -25,24 +31,64 @@ logger = logging.getLogger(__name__)
 
 class Scheduler:
     BUFFER_LENGTH = 10
-
-    def __init__(self):
-        self._device = Device()
-
-        self._redis = get_redis_conn()
-
-        self._redis_pipe = self._redis.pubsub()
-        self._redis_pipe.subscribe(settings.SCHEDULER_REDIS_CHANNEL)
+    # upper bound of single wait for signals, in seconds
+    MAX_WAIT = 60
+    # delay before generator is run again when it had nothing to draw
+    GENERATOR_RETRY_INTERVAL = 5
+    # max number of signals read in single iteration
+    DRAIN_BATCH_SIZE = 100
+    # change of expected end of track in seconds which makes scheduler
+    # check buffered music and draw times again
+    DRIFT_TOLERANCE = 1
+    # signals dispatched ahead of download notifications
+    CONTROL_SIGNALS = (
+        "TRACK_FINISHED",
+        "TRACK_FAILED",
+        "PLAYER_READY",
+        "SPOT_START",
+        "DEVICE_SYNC",
+        "DEVICE_UPDATED",
+    )
+
+    def __init__(
+        self, zone=None, device=None, workers=None, outbox=None, redis=None
+    ):
+        # zone schedulers share device, workers, outbox and Redis
+        # connection, signals are routed to them by MultiZoneScheduler
+        self._zone = zone
+        # primary scheduler syncs device daily and acks syncs
+        self._is_primary = True
+        self._device = device or Device()
+        self._timers = Timers()
+        self._metrics = MetricsCache(self._zone_key("scheduler"))
+        self._latency = latency.LatencyTracker(self._zone_key("scheduler"))
+        # time of last TRACK_FINISHED, until next PLAY is sent
+        self._finished_at = None
+        self._control_signals = deque()
+        self._signals = deque()
+        self._max_dispatch_backlog = 0
+
+        if redis is None:
+            self._redis = get_redis_conn()
+            self._redis_pipe = self._redis.pubsub()
+            self._redis_pipe.subscribe(settings.SCHEDULER_REDIS_CHANNEL)
+        else:
+            self._redis = redis
+            self._redis_pipe = None
+        # clock of synchronized starts, shared with players
+        self._clock = latency.SharedClock(self._redis)
 
         self._player_ready = False
         self._player_idle = None
         self._music = []
+        self._music_buffer_length = max(
+            min(settings.MUSIC_LOOKAHEAD or 1, self.BUFFER_LENGTH), 1
+        )
         self._ads = []
 
         self._ads_generator = None
-        self._ads_generator_busy = False
         self._music_generator = None
-        self._music_generator_busy = False
+        self._workers = workers or WorkerPool(size=2, name="generator")
 
         self._last_device_sync = None
 
@@ -50,47 +96,197 @@ class Scheduler:
             "PLAYER_READY": self._on_player_ready,
             "PLAYER_IDLE": self._on_player_idle,
             "TRACK_FINISHED": self._on_track_finished,
+            "TRACK_FAILED": self._on_track_failed,
             "TRACK_PLAY": self._on_track_play,
+            "TRACK_POSITION": self._on_track_position,
+            "START_SKEW": self._on_start_skew,
+            "SPOT_START": self._on_spot_start,
+            "SPOT_STARTED": self._on_spot_started,
+            "SPOT_TRACK_DOWNLOADED": self._on_spot_track_download,
+            "SPOT_TRACK_DOWNLOAD_FAILED": self._on_spot_track_download_failure,  # noqa: E501
             "DEVICE_SYNC": self._on_device_sync,
+            "DEVICE_UPDATED": self._on_device_update,
             "AD_TRACK_DOWNLOADED": self._on_ad_track_download,
             "MUSIC_TRACK_DOWNLOADED": self._on_music_track_download,
             "MUSIC_TRACK_DOWNLOAD_FAILED": self._on_music_track_download_failure,  # noqa: E501
             "ADS_GENERATOR_FINISHED": self._on_ads_generator_finish,
             "MUSIC_GENERATOR_FINISHED": self._on_music_generator_finish,
+            "FLUSH_LATENCY": self._on_flush_latency,
         }
 
         self._current_track = None
+        # track handed to player to start right after current one
+        self._preloaded_track = None
+        # expected end of current track, corrected by player position
+        self._current_track_end = None
         self._next_track_draw_time = None
+        # next fixed-time spot, its start time and downloaded track
+        self._spot = None
+
+        self._outbox = outbox or Outbox(
+            settings.OUTBOX_DIR, self._ack_play_url
+        )
+        self._state_cache = SchedulerStateCache(zone)
+        self._saved_state = None
+        # sync generation playlists were drawn for
+        self._generation = None
 
     def run(self):
-        self._device.sync()
-        counter = 1
+        self._outbox.start()
+        if not self._restore_state():
+            self._device.sync()
+        self._schedule_day_change()
         while self._should_run():
+            # sleep until signal arrives or nearest timer is due
+            self._drain_signals(timeout=self._timers.timeout(self.MAX_WAIT))
+            self._process()
+
+    def _process(self):
+        """
+        Dispatch drained signals, run due timers and pick next track.
+        """
+        self._dispatch_pending_signals()
+
+        self._timers.run_due()
+
+        if self._device.playback_priority == "ads_over_music":
+            self._schedule_ads_over_music()
+        else:
+            self._schedule_music_over_ads()
+
+        self._save_state()
+        self._schedule_latency_flush()
+
+    def _get_state(self):
+        return {
+            "generation": self._generation,
+            "player_ready": self._player_ready,
+            "music": list(self._music),
+            "ads": list(self._ads),
+            "current_track": self._current_track,
+            "preloaded_track": self._preloaded_track,
+            "next_track_draw_time": self._next_track_draw_time.isoformat()
+            if self._next_track_draw_time
+            else None,
+            "last_device_sync": self._last_device_sync.isoformat()
+            if self._last_device_sync
+            else None,
+            "ads_generator": self._ads_generator.get_state()
+            if self._ads_generator
+            else None,
+            "music_generator": self._music_generator.get_state()
+            if self._music_generator
+            else None,
+        }
+
+    def _save_state(self):
+        """
+        Snapshot runtime state to Redis when it changed,
+        restarted scheduler continues from it.
+        """
+        if self._generation is None:
+            return
+        state = self._get_state()
+        if state == self._saved_state:
+            return
+        try:
+            self._store_state(state)
+            self._saved_state = state
+        except Exception as e:
+            logger.error("Unable to save scheduler state: {}".format(e))
+
+    def _store_state(self, state):
+        self._state_cache.set(state)
+
+    def _restore_state(self):
+        """
+        Restore state saved before restart if device wasn't synced since.
+        """
+        state = self._state_cache.get()
+        if not state or state["generation"] != self._device.sync_generation:
+            return False
+        logger.info("Restoring scheduler state")
+        self._generation = state["generation"]
+        self._player_ready = state["player_ready"]
+        self._music = state["music"]
+        self._ads = state["ads"]
+        self._current_track = state["current_track"]
+        self._preloaded_track = state.get("preloaded_track")
+        if state["next_track_draw_time"]:
+            self._next_track_draw_time = datetime.datetime.fromisoformat(
+                state["next_track_draw_time"]
+            )
+        if state["last_device_sync"]:
+            self._last_device_sync = datetime.date.fromisoformat(
+                state["last_device_sync"]
+            )
+        self._ads_generator = self._create_ads_generator()
+        self._ads_generator.set_state(state["ads_generator"] or {})
+        self._music_generator = self._create_music_generator()
+        self._music_generator.set_state(state["music_generator"] or {})
+        self._saved_state = state
+        self._schedule_generators()
+        self._schedule_spot()
+        return True
+
+    def _drain_signals(self, timeout):
+        """
+        Read pending signals into priority lanes until pubsub buffer
+        is empty or drain budget is spent.
+        """
+        signal = get_and_decode_redis_message(
+            self._redis_pipe, logger, timeout=timeout
+        )
+        deadline = time.monotonic() + settings.SCHEDULER_DRAIN_BUDGET
+        count = 0
+        while signal:
+            self._queue_signal(signal)
+            count += 1
+            if self._drain_finished(count, deadline):
+                break
             signal = get_and_decode_redis_message(self._redis_pipe, logger)
-            if signal:
-                self._dispatch_signal(signal)
-
-            if self._device.playback_priority == "ads_over_music":
-                self._schedule_ads_over_music()
-            else:
-                self._schedule_music_over_ads()
-
-            # generate noises
-            # limit number of draws by spawning them every 1s instead of 0.1s
-            if counter % 10 == 0:
-                self._run_generator(self._generate_ads)
-                self._run_generator(self._generate_music)
-
-            # every 10m reset counter and sync device if day has changed
-            if counter % 6000 == 0:
-                counter = 1
-                now = get_local_time(self._device.timezone)
-                if now.day != self._last_device_sync.day:
-                    self._device.sync()
-            else:
-                counter += 1
 
-            time.sleep(0.1)
+    def _queue_signal(self, signal):
+        if signal[0] in self.CONTROL_SIGNALS:
+            self._control_signals.append(signal)
+        else:
+            self._signals.append(signal)
+
+    def _drain_finished(self, count, deadline):
+        return count >= self.DRAIN_BATCH_SIZE or time.monotonic() >= deadline
+
+    def _dispatch_pending_signals(self):
+        backlog = len(self._control_signals) + len(self._signals)
+        if backlog:
+            self._update_dispatch_metrics(backlog)
+        while self._control_signals:
+            self._dispatch_signal(self._control_signals.popleft())
+        while self._signals:
+            self._dispatch_signal(self._signals.popleft())
+
+    def _schedule_latency_flush(self):
+        if self._latency.dirty and not self._timers.is_scheduled("latency"):
+            self._timers.schedule(
+                "latency",
+                self._latency.FLUSH_INTERVAL,
+                self._flush_latency,
+            )
+
+    def _flush_latency(self):
+        self._latency.flush()
+
+    def _update_dispatch_metrics(self, backlog):
+        self._max_dispatch_backlog = max(self._max_dispatch_backlog, backlog)
+        self._store_metrics(
+            dispatch_backlog=backlog,
+            max_dispatch_backlog=self._max_dispatch_backlog,
+        )
+
+    def _store_metrics(self, **values):
+        try:
+            self._metrics.set(**values)
+        except Exception as e:
+            logger.error("Unable to store scheduler metrics: {}".format(e))
 
     def _schedule_ads_over_music(self):
         if self._player_ready:
@@ -100,6 +296,7 @@ class Scheduler:
                 track = self._pick_next_track()
             elif self._current_track["track_type"] == "music" and self._ads:
                 # if ads are generated then skip music and play ads
+                self._requeue_preloaded_track()
                 track = self._pick_next_track()
             if track is not None:
                 self._play_track(track)
@@ -114,38 +311,181 @@ class Scheduler:
     def _should_run(cls):
         return True
 
-    @classmethod
-    def _run_generator(cls, fn, delay=0):
-        threading.Timer(delay, fn).start()
+    def _run_generator(self, fn, key):
+        self._workers.submit(self._zone_key(key), fn)
+
+    def _zone_key(self, key):
+        if self._zone is None:
+            return key
+        return "{}:{}".format(key, self._zone)
+
+    def _schedule_generators(self):
+        """
+        Set timers for generators which have empty playlists.
+        """
+        if self._music_generator is not None and self._needs_music():
+            self._schedule_music_generator(0)
+        if self._ads_generator is not None and not self._ads:
+            self._schedule_ads_generator(self._get_ads_generator_delay())
+
+    def _schedule_music_generator(self, delay):
+        self._timers.schedule(
+            "music",
+            delay,
+            lambda: self._run_generator(self._generate_music, "music"),
+        )
+
+    def _schedule_ads_generator(self, delay):
+        self._timers.schedule(
+            "ads",
+            delay,
+            lambda: self._run_generator(self._generate_ads, "ads"),
+        )
+
+    def _get_ads_generator_delay(self, retry=False):
+        """
+        Seconds until ads generator is able to draw next ads.
+        :param retry: generator has just run, don't run it again immediately
+        """
+        draw_time = self._get_ads_draw_time()
+        next_draw_time = self._ads_generator.next_draw_time
+        if next_draw_time is not None:
+            delay = (next_draw_time - draw_time).total_seconds()
+            if delay > 0 or not retry:
+                return max(delay, 0)
+        if not retry:
+            return 0
+        # generator had nothing to draw, wait for next ad block
+        return self._get_block_change_delay(self._ads_generator, draw_time)
+
+    def _get_block_change_delay(self, generator, draw_time):
+        if generator.has_block(draw_time):
+            return self.GENERATOR_RETRY_INTERVAL
+        next_change = generator.next_block_change(draw_time)
+        return max((next_change - draw_time).total_seconds(), 0)
+
+    def _get_ads_draw_time(self):
+        if self._device.playback_priority == "ads_over_music":
+            return get_local_time(self._device.timezone)
+        # if music has higher priority then next ad should
+        # be from time of next track
+        return self._next_track_draw_time or get_local_time(
+            self._device.timezone
+        )
+
+    def _schedule_day_change(self):
+        timezone = self._device.timezone
+        now = get_local_time(timezone)
+        midnight = timezone.localize(
+            datetime.datetime.combine(
+                now.date() + datetime.timedelta(days=1), datetime.time.min
+            )
+        )
+        self._timers.schedule(
+            "day_change",
+            (midnight - now).total_seconds(),
+            self._on_day_change,
+        )
+
+    def _schedule_spot(self, after=None):
+        """
+        Set timer to download track of next fixed-time spot.
+        :param after: look for spot starting after this time, now if None
+        """
+        self._timers.cancel("spot")
+        self._spot = None
+        now = get_local_time(self._device.timezone)
+        next_spot = self._device.spot_schedule.next_spot(
+            max(after, now) if after else now
+        )
+        if next_spot is None:
+            return
+        at, spot = next_spot
+        self._spot = {"spot": spot, "at": at, "track": None}
+        self._timers.schedule(
+            "spot",
+            (at - now).total_seconds() - settings.SPOT_DOWNLOAD_AHEAD,
+            self._download_spot,
+        )
+
+    def _download_spot(self):
+        generator = self._create_spot_generator()
+        spot = self._spot["spot"]
+        self._run_generator(lambda: generator.download(spot), "spot")
+
+    def _arm_spot(self):
+        """
+        Hand downloaded spot to player, which starts it by its own timer.
+        """
+        at, track = self._spot["at"], self._spot["track"]
+        remaining = (
+            at - get_local_time(self._device.timezone)
+        ).total_seconds()
+        self._send_player_signal(
+            "SPOT",
+            [
+                track,
+                self._clock.now() + remaining,
+                self._spot["spot"]["priority"],
+            ],
+        )
+        self._schedule_spot(after=at)
+
+    def _is_spot_signal(self, spot_id):
+        # spot may have been rescheduled by device sync
+        return self._spot is not None and self._spot["spot"]["id"] == spot_id
+
+    def _on_day_change(self):
+        today = get_local_time(self._device.timezone).date()
+        if self._is_primary and self._last_device_sync != today:
+            self._device.sync()
+        self._schedule_day_change()
 
     def _generate_ads(self):
-        if (
-            self._ads_generator is not None
-            and not self._ads
-            and not self._ads_generator_busy
-        ):
-            self._ads_generator_busy = True
-            if self._device.playback_priority == "ads_over_music":
-                next_track_time = get_local_time(self._device.timezone)
-            else:
-                # if music has higher priority then next ad should
-                # be from time of next track
-                next_track_time = self._next_track_draw_time or get_local_time(
-                    self._device.timezone
-                )
-            self._ads_generator.draw_and_download(next_track_time)
+        generator = self._ads_generator
+        if generator is not None and not self._ads:
+            generator.draw_and_download(self._get_ads_draw_time())
 
     def _generate_music(self):
-        if (
-            self._music_generator is not None
-            and not self._music
-            and not self._music_generator_busy
-        ):
-            self._music_generator_busy = True
-            next_track_time = self._next_track_draw_time or get_local_time(
-                self._device.timezone
+        generator = self._music_generator
+        if generator is not None and self._needs_music():
+            generator.draw_and_download(self._get_music_draw_time())
+
+    def _needs_music(self):
+        return len(self._music) < self._music_buffer_length
+
+    def _get_music_draw_time(self, music=None):
+        """
+        Projected play time of track following music buffer.
+        """
+        next_track_time = self._next_track_draw_time or get_local_time(
+            self._device.timezone
+        )
+        buffered = sum(
+            track["length"]
+            for track in (self._music if music is None else music)
+        )
+        return next_track_time + datetime.timedelta(seconds=buffered)
+
+    def _trim_music(self):
+        """
+        Keep buffered music tracks which still match schedule
+        at their projected play time.
+        """
+        music = []
+        for track in self._music:
+            draw_time = self._get_music_draw_time(music)
+            if not self._music_generator.is_track_scheduled(
+                track, draw_time
+            ):
+                break
+            music.append(track)
+        logger.debug(
+            "Kept {} of {} buffered music tracks".format(
+                len(music), len(self._music)
             )
-            self._music_generator.draw_and_download(next_track_time)
+        )
+        self._music = music
 
     def _pick_next_track(self):
         pick = None
@@ -160,42 +500,108 @@ class Scheduler:
                 seconds=pick["length"]
             )
             logger.debug("Picked: {}".format(pick))
+            # playlists and next draw time have changed
+            self._schedule_generators()
         else:
             self._next_track_draw_time = current_time
         return pick
 
     def _play_track(self, track):
         self._current_track = track
-        signal = json.dumps(
-            (
-                "PLAY",
-                [
-                    track,
-                ],
-            )
-        )
-        while not self._redis.publish(settings.PLAYER_REDIS_CHANNEL, signal):
-            time.sleep(0.1)
+        args = [track]
+        if settings.SYNC_START_DELAY:
+            # players load track and start it at the same moment
+            args.append(self._clock.now() + settings.SYNC_START_DELAY)
+        self._send_player_signal("PLAY", args)
+        if self._finished_at is not None:
+            self._latency.observe_since("finish_to_play", self._finished_at)
+            self._finished_at = None
 
     def _skip_track(self):
-        signal = json.dumps(("SKIP", []))
-        while not self._redis.publish(settings.PLAYER_REDIS_CHANNEL, signal):
-            time.sleep(0.1)
+        # player drops preloaded track on skip
+        self._preloaded_track = None
+        self._timers.cancel("preload")
+        self._send_player_signal("SKIP", [])
+
+    def _requeue_preloaded_track(self):
+        # player drops preloaded track on PLAY, play it later
+        self._timers.cancel("preload")
+        track, self._preloaded_track = self._preloaded_track, None
+        if track is not None:
+            self._requeue_track(track)
+
+    def _requeue_track(self, track):
+        queue = self._ads if track["track_type"] == "ad" else self._music
+        queue.insert(0, track)
+
+    def _preload_track(self, track):
+        self._preloaded_track = track
+        args = [track]
+        if settings.SYNC_START_DELAY and self._current_track_end is not None:
+            # players start preloaded track at expected end of current one
+            remaining = (
+                self._current_track_end
+                - get_local_time(self._device.timezone)
+            ).total_seconds()
+            args.append(self._clock.now() + max(remaining, 0))
+        self._send_player_signal("PRELOAD", args)
+
+    def _schedule_preload(self, remaining):
+        """
+        Pick next track shortly before current one ends, so player
+        can prepare it and start it right after current one.
+        :param remaining: seconds until end of current track
+        """
+        if not settings.PRELOAD_AHEAD or self._preloaded_track is not None:
+            return
+        self._timers.schedule(
+            "preload",
+            remaining - settings.PRELOAD_AHEAD,
+            self._preload_next_track,
+        )
 
-    def _set_player_volume(self, val):
-        signal = json.dumps(
-            (
-                "SET_VOLUME",
-                [
-                    val,
-                ],
+    def _preload_next_track(self):
+        if (
+            not self._player_ready
+            or self._current_track is None
+            or self._preloaded_track is not None
+        ):
+            return
+        track = self._pick_next_track()
+        if track is not None:
+            self._preload_track(track)
+            # preloaded track starts at end of current one, not now
+            if self._update_next_track_draw_time():
+                self._schedule_generators()
+
+    def _update_next_track_draw_time(self):
+        """
+        Project draw time of next track from expected end of current one.
+        :return: seconds the draw time moved by
+        """
+        if self._current_track_end is None:
+            return 0
+        draw_time = self._current_track_end
+        if self._preloaded_track is not None:
+            draw_time += datetime.timedelta(
+                seconds=self._preloaded_track["length"]
             )
-        )
+        previous = self._next_track_draw_time or draw_time
+        self._next_track_draw_time = draw_time
+        return (draw_time - previous).total_seconds()
+
+    def _set_player_volume(self, val):
+        self._send_player_signal("SET_VOLUME", [val])
+
+    def _send_player_signal(self, name, args):
+        signal = encode_signal(name, args, self._zone)
         while not self._redis.publish(settings.PLAYER_REDIS_CHANNEL, signal):
             time.sleep(0.1)
 
     def _dispatch_signal(self, signal):
-        name, args = signal
+        name, args = signal[:2]
+        if len(signal) > 2 and signal[2] is not None:
+            self._latency.observe_since("signal_transit", signal[2])
         func = self._signal_map.get(name, Null())
         try:
             func(*args)
@@ -222,8 +628,19 @@ class Scheduler:
 
     # local signals
     def _on_player_ready(self):
+        """
+        Player has just started and plays nothing, tracks restored or
+        sent to previous player are played again, without waiting
+        for PLAYER_IDLE.
+        """
         logger.debug("Received PLAYER_READY signal")
         self._player_ready = True
+        self._requeue_preloaded_track()
+        if self._current_track is not None:
+            self._requeue_track(self._current_track)
+        self._current_track = None
+        self._current_track_end = None
+        self._next_track_draw_time = None
         self._set_player_volume(self._device.volume)
 
     def _on_player_idle(self):
@@ -236,6 +653,8 @@ class Scheduler:
         logger.debug("Received PLAYER_IDLE signal")
         self._player_ready = True
         self._current_track = None
+        self._preloaded_track = None
+        self._current_track_end = None
         self._next_track_draw_time = None
         if self._player_idle is not True:
             self._player_idle = True
@@ -246,48 +665,236 @@ class Scheduler:
             "Player started track: {} at: {}".format(track, current_time)
         )
         self._player_idle = False
+        self._current_track_end = current_time + datetime.timedelta(
+            seconds=track["length"]
+        )
+        self._schedule_preload(track["length"])
 
         # ack play on remote server
         payload = {
             "id": track["id"],
-            "timestamp": current_time,
+            "timestamp": str(current_time),
         }
-        response = client.make_request(self._ack_play_url, "post", data=payload)
-        logger.debug("Ack play finished with response: {}".format(response))
+        self._ack_play(payload)
+
+    def _ack_play(self, payload):
+        # uploaded in background by outbox
+        try:
+            self._outbox.append(payload)
+        except OSError as e:
+            logger.error("Unable to store play event {}: {}".format(payload, e))
+
+    def _ack_sync(self):
+        if self._is_primary:
+            client.make_request(self._ack_sync_url, "post")
+
+    def _on_track_position(self, track_id, position, duration) -> None:
+        """
+        Correct expected end of current track with position reported
+        by player.
+        """
+        track = self._current_track
+        if track is None or track["id"] != track_id:
+            return
+        remaining = max(duration - position, 0)
+        self._current_track_end = get_local_time(
+            self._device.timezone
+        ) + datetime.timedelta(seconds=remaining)
+        self._schedule_preload(remaining)
+        drift = self._update_next_track_draw_time()
+        if abs(drift) > self.DRIFT_TOLERANCE:
+            logger.debug("Next track draw time moved by {}s".format(drift))
+            # buffered music and ads delay were projected from old time
+            if self._music_generator is not None:
+                self._trim_music()
+            self._schedule_generators()
+
+    def _on_start_skew(self, track_id, skew) -> None:
+        """
+        Difference between synchronized start time of track
+        and time one of players started it.
+        """
+        logger.debug("Track {} started with skew {}s".format(track_id, skew))
+        self._latency.observe("start_skew", abs(skew))
+
+    def _on_spot_track_download(self, spot_id, track) -> None:
+        if not self._is_spot_signal(spot_id):
+            return
+        self._spot["track"] = track
+        remaining = (
+            self._spot["at"] - get_local_time(self._device.timezone)
+        ).total_seconds()
+        self._timers.schedule(
+            "spot", remaining - settings.SPOT_ARM_AHEAD, self._arm_spot
+        )
+
+    def _on_spot_track_download_failure(self, spot_id) -> None:
+        if not self._is_spot_signal(spot_id):
+            return
+        remaining = (
+            self._spot["at"] - get_local_time(self._device.timezone)
+        ).total_seconds()
+        if (
+            remaining - settings.SPOT_ARM_AHEAD
+            > self.GENERATOR_RETRY_INTERVAL
+        ):
+            self._timers.schedule(
+                "spot", self.GENERATOR_RETRY_INTERVAL, self._download_spot
+            )
+        else:
+            logger.error("Skipping spot {}".format(self._spot["spot"]))
+            self._schedule_spot(after=self._spot["at"])
+
+    def _on_spot_start(self, track, previous) -> None:
+        """
+        Player started fixed-time spot instead of preloaded track,
+        previous track was interrupted or has just finished.
+        """
+        logger.debug("Spot {} replaced {}".format(track, previous))
+        # player dropped preloaded track for spot
+        self._requeue_preloaded_track()
+        self._finished_at = None
+        self._current_track = track
+        self._current_track_end = get_local_time(
+            self._device.timezone
+        ) + datetime.timedelta(seconds=track["length"])
+        if self._update_next_track_draw_time():
+            self._schedule_generators()
+
+    def _on_spot_started(self, track_id, error) -> None:
+        """
+        Difference between fixed time of spot and its actual start.
+        """
+        logger.debug("Spot {} started with error {}s".format(track_id, error))
+        self._latency.observe("spot_start_error", abs(error))
 
     def _on_track_finished(self, track) -> None:
         logger.debug("Finished playing {}".format(track))
-        self._current_track = None
+        self._finished_at = latency.now()
+        self._start_preloaded_track()
 
-    def _on_ad_track_download(self, track) -> None:
+    def _on_track_failed(self, track) -> None:
+        logger.warning("Player failed to start {}".format(track))
+        # track was not played, next one starts now
+        self._next_track_draw_time = None
+        self._start_preloaded_track()
+
+    def _start_preloaded_track(self):
+        # player starts preloaded track on its own
+        self._timers.cancel("preload")
+        self._current_track = self._preloaded_track
+        self._preloaded_track = None
+        self._current_track_end = None
+
+    def _on_ad_track_download(self, track, generator_id=None) -> None:
+        if not self._is_current_generator(self._ads_generator, generator_id):
+            return
         logger.debug(
             "Downloaded track: {}," " adding to ads playlist".format(track)
         )
         self._ads.append(track)
 
-    def _on_music_track_download(self, track) -> None:
+    def _on_music_track_download(self, track, generator_id=None) -> None:
+        if not self._is_current_generator(
+            self._music_generator, generator_id
+        ):
+            return
         logger.debug(
             "Downloaded track: {}, adding to music playlist".format(track)
         )
         self._music.append(track)
+        if self._music_generator is not None and self._needs_music():
+            # keep filling lookahead buffer
+            self._schedule_music_generator(0)
 
-    def _on_music_track_download_failure(self, track) -> None:
+    def _on_music_track_download_failure(
+        self, track, generator_id=None
+    ) -> None:
         logger.debug("Failed to download track: {}".format(track))
 
+    @staticmethod
+    def _is_current_generator(generator, generator_id):
+        """
+        Tracks drawn by generator replaced by DEVICE_SYNC, dispatched
+        after it, are dropped.
+        """
+        if generator_id is None or (
+            generator is not None and generator.id == generator_id
+        ):
+            return True
+        logger.debug("Dropping track of replaced generator")
+        return False
+
     def _on_device_sync(self) -> None:
         logger.debug("Received DEVICE_SYNC signal")
+        self._refresh_device()
         self._ads = []
-        self._music = []
-        self._ads_generator = AdBlockBasedGenerator(self._device)
-        self._music_generator = MusicBlockBasedGenerator(self._device)
+        self._cancel_generators()
+        self._ads_generator = self._create_ads_generator()
+        self._music_generator = self._create_music_generator()
+        self._trim_music()
+        self._schedule_generators()
         self._set_player_volume(self._device.volume)
         self._skip_track()  # let scheduler draw new track
         self._last_device_sync = get_local_time(self._device.timezone).date()
         # ack sync on remote server
-        client.make_request(self._ack_sync_url, "post")
+        self._schedule_spot()
+        self._ack_sync()
+        self._generation = self._device.sync_generation
+
+    def _create_ads_generator(self):
+        return AdBlockBasedGenerator(self._device, zone=self._zone)
+
+    def _create_music_generator(self):
+        return MusicBlockBasedGenerator(self._device, zone=self._zone)
+
+    def _create_spot_generator(self):
+        return SpotGenerator(self._device, zone=self._zone)
+
+    def _cancel_generators(self):
+        # drop queued draws and results of draws in progress
+        self._workers.cancel(self._zone_key("ads"))
+        self._workers.cancel(self._zone_key("music"))
+        for generator in (self._ads_generator, self._music_generator):
+            if generator is not None:
+                generator.cancel()
+
+    def _update_worker_metrics(self):
+        stats = {
+            "workers_{}".format(key): value
+            for key, value in self._workers.stats().items()
+        }
+        self._store_metrics(**stats)
+
+    def _on_flush_latency(self) -> None:
+        self._timers.cancel("latency")
+        self._flush_latency()
+
+    def _on_device_update(self) -> None:
+        logger.debug("Received DEVICE_UPDATED signal")
+        self._refresh_device()
+
+    def _refresh_device(self):
+        # state changed in Redis, read it again on next access
+        self._device.invalidate()
 
     def _on_ads_generator_finish(self) -> None:
-        self._ads_generator_busy = False
+        self._update_worker_metrics()
+        if self._ads_generator is not None and not self._ads:
+            self._schedule_ads_generator(
+                self._get_ads_generator_delay(retry=True)
+            )
 
     def _on_music_generator_finish(self) -> None:
-        self._music_generator_busy = False
+        self._update_worker_metrics()
+        if (
+            self._music_generator is not None
+            and self._needs_music()
+            and not self._timers.is_scheduled("music")
+        ):
+            draw_time = self._get_music_draw_time()
+            self._schedule_music_generator(
+                self._get_block_change_delay(
+                    self._music_generator, draw_time
+                )
+            )
@@ -0,0 +1,446 @@
+"""
+Virtual time simulation of scheduler, generators and player.
+
+Scheduler runs its regular loop against in-memory Redis and virtual clock.
+Whenever scheduler waits for signals and none is pending, virtual clock
+jumps to the nearest deadline of scheduler timers or simulated player,
+so a full day of schedule is replayed in seconds.
+"""
+import collections
+import concurrent.futures
+import copy
+import datetime
+import fnmatch
+import heapq
+import itertools
+import json
+import logging
+import time
+
+import pytz
+
+from soundfleet_player import utils
+from soundfleet_player.conf import settings
+from soundfleet_player.device import Device
+from soundfleet_player.noise_generator import (
+    AdBlockBasedGenerator,
+    MusicBlockBasedGenerator,
+)
+from soundfleet_player.scheduler import Scheduler
+from soundfleet_player.utils import Null
+
+
+logger = logging.getLogger(__name__)
+
+
+class VirtualClock:
+    def __init__(self, start: datetime.datetime):
+        self._now = start.astimezone(pytz.utc)
+        self._start = self._now
+
+    @property
+    def now(self):
+        return self._now
+
+    def utcnow(self):
+        return self._now
+
+    def monotonic(self):
+        return (self._now - self._start).total_seconds()
+
+    def advance(self, seconds):
+        self._now += datetime.timedelta(seconds=max(seconds, 0))
+
+    def advance_to(self, dt):
+        if dt > self._now:
+            self._now = dt
+
+
+class MemoryPubSub:
+    def __init__(self, redis):
+        self._redis = redis
+        self._messages = collections.deque()
+        self.channels = set()
+
+    def subscribe(self, *channels):
+        self.channels.update(channels)
+
+    def close(self):
+        self.channels.clear()
+
+    def deliver(self, channel, data):
+        self._messages.append(
+            {"type": "message", "channel": channel, "data": data}
+        )
+
+    def get_message(self, timeout=0.0, **kwargs):
+        self._redis.commands += 1
+        if not self._messages and timeout and self._redis.on_wait:
+            # nothing to read, let simulation move time forward
+            self._redis.on_wait(timeout)
+        if self._messages:
+            return self._messages.popleft()
+        return None
+
+
+class MemoryRedis:
+    """
+    Subset of Redis commands used by the player, kept in memory.
+    Every command is counted as single round-trip.
+    """
+
+    def __init__(self):
+        self.commands = 0
+        self.on_wait = None
+        self._data = {}
+        self._pubsubs = []
+
+    def pubsub(self, **kwargs):
+        pubsub = MemoryPubSub(self)
+        self._pubsubs.append(pubsub)
+        return pubsub
+
+    def publish(self, channel, data):
+        self.commands += 1
+        receivers = 0
+        for pubsub in self._pubsubs:
+            if channel in pubsub.channels:
+                pubsub.deliver(channel, data)
+                receivers += 1
+        return receivers
+
+    def ping(self):
+        return True
+
+    def get(self, key):
+        self.commands += 1
+        return self._data.get(key)
+
+    def mget(self, keys):
+        self.commands += 1
+        return [self._data.get(key) for key in keys]
+
+    def set(self, key, val):
+        self.commands += 1
+        self._data[key] = str(val)
+
+    def incr(self, key):
+        self.commands += 1
+        self._data[key] = str(int(self._data.get(key, 0)) + 1)
+        return int(self._data[key])
+
+    def delete(self, *keys):
+        self.commands += 1
+        for key in keys:
+            self._data.pop(key, None)
+
+    def keys(self, pattern="*"):
+        self.commands += 1
+        return [key for key in self._data if fnmatch.fnmatchcase(key, pattern)]
+
+    def hset(self, key, mapping):
+        self.commands += 1
+        self._data.setdefault(key, {}).update(
+            {k: str(v) for k, v in mapping.items()}
+        )
+
+    def hgetall(self, key):
+        self.commands += 1
+        return dict(self._data.get(key, {}))
+
+
+class SimulatedStorage:
+    """
+    Storage with all tracks available immediately.
+    """
+
+    def __init__(self):
+        self.downloads = 0
+
+    def download(self, track):
+        self.downloads += 1
+        return dict(track, uri="file://{}".format(track["file"]))
+
+    def download_many(self, tracks):
+        futures = []
+        for track in tracks:
+            future = concurrent.futures.Future()
+            future.set_result(self.download(track))
+            futures.append(future)
+        return futures
+
+
+class SimulatedDevice(Device):
+    def __init__(self, state):
+        super().__init__()
+        self._state = state
+
+    def get_state(self):
+        return copy.deepcopy(self._state)
+
+
+class SimulatedPlayer:
+    """
+    Player which plays each track for its length in virtual time.
+    """
+
+    def __init__(self, simulation):
+        self._simulation = simulation
+        self._redis = utils.get_redis_conn()
+        self._pubsub = self._redis.pubsub()
+        self._pubsub.subscribe(settings.PLAYER_REDIS_CHANNEL)
+        self.current_track = None
+        self._next_track = None
+        self._end_event = None
+        self._signal_map = {
+            "PLAY": self._on_play,
+            "SKIP": self._on_skip,
+            "PRELOAD": self._on_preload,
+        }
+
+    def start(self):
+        self._publish("PLAYER_READY", [])
+
+    def process_signals(self):
+        msg = self._pubsub.get_message()
+        while msg:
+            name, args = json.loads(msg["data"])[:2]
+            func = self._signal_map.get(name)
+            if func is not None:
+                func(*args)
+            msg = self._pubsub.get_message()
+
+    def _on_play(self, track):
+        if self.current_track is not None:
+            self._finish()
+        self.current_track = track
+        self._simulation.record_play(track)
+        self._publish("TRACK_PLAY", [track])
+        self._end_event = self._simulation.call_later(
+            track["length"], self._on_end
+        )
+
+    def _on_skip(self):
+        self._next_track = None
+        if self.current_track is not None:
+            self._finish()
+
+    def _on_preload(self, track):
+        self._next_track = track
+
+    def _on_end(self):
+        self._finish()
+        track, self._next_track = self._next_track, None
+        if track is not None:
+            self._on_play(track)
+
+    def _finish(self):
+        if self._end_event is not None:
+            self._simulation.cancel(self._end_event)
+            self._end_event = None
+        track, self.current_track = self.current_track, None
+        self._simulation.record_finish(track)
+        self._publish("TRACK_FINISHED", [track])
+
+    def _publish(self, name, args):
+        self._redis.publish(
+            settings.SCHEDULER_REDIS_CHANNEL, json.dumps((name, args))
+        )
+
+
+class SimulatedScheduler(Scheduler):
+    def __init__(self, simulation, state):
+        super().__init__()
+        self._simulation = simulation
+        self._device = SimulatedDevice(state)
+        self._storage = SimulatedStorage()
+        # play acks are not uploaded
+        self._outbox = Null()
+
+    def _should_run(self):
+        return not self._simulation.finished
+
+    def _run_generator(self, fn, key):
+        # generators draw synchronously in virtual time
+        fn()
+
+    def _create_ads_generator(self):
+        return AdBlockBasedGenerator(self._device, storage=self._storage)
+
+    def _create_music_generator(self):
+        return MusicBlockBasedGenerator(self._device, storage=self._storage)
+
+    def _ack_play(self, payload):
+        pass
+
+    def _ack_sync(self):
+        pass
+
+    def _restore_state(self):
+        return False
+
+
+class Simulation:
+    def __init__(self, state, start, duration):
+        """
+        :param state: device state as returned by get-state API
+        :param start: aware datetime of simulation start
+        :param duration: timedelta of simulated time
+        """
+        self.clock = VirtualClock(start)
+        self.redis = MemoryRedis()
+        self._state = state
+        self._end = self.clock.now + duration
+        self._events = []
+        self._counter = itertools.count()
+
+        self._plays = []
+        self._gaps = []
+        self._last_finish = None
+        self._scheduler = None
+
+    @property
+    def finished(self):
+        return self.clock.now >= self._end
+
+    def call_later(self, delay, callback):
+        event = [
+            self.clock.now + datetime.timedelta(seconds=delay),
+            next(self._counter),
+            callback,
+        ]
+        heapq.heappush(self._events, event)
+        return event
+
+    def cancel(self, event):
+        event[-1] = None
+
+    def record_play(self, track):
+        now = self.clock.now
+        if self._last_finish is not None and self._is_music_scheduled(
+            self._last_finish
+        ):
+            # silence outside of music blocks is expected
+            self._gaps.append((now - self._last_finish).total_seconds())
+        self._plays.append((now, track))
+
+    def record_finish(self, track):
+        self._last_finish = self.clock.now
+
+    def _is_music_scheduled(self, dt):
+        device = self._scheduler._device
+        return device.music_schedule.get_block(dt) is not None
+
+    def run(self):
+        utils.set_clock(self.clock)
+        utils.set_redis_conn_factory(lambda: self.redis)
+        try:
+            self.redis.on_wait = self._wait
+            self._player = SimulatedPlayer(self)
+            scheduler = self._scheduler = SimulatedScheduler(
+                self, self._state
+            )
+            self._player.start()
+            started_at = time.perf_counter()
+            scheduler.run()
+            elapsed = time.perf_counter() - started_at
+        finally:
+            utils.set_clock(utils.Clock())
+            utils.set_redis_conn_factory(None)
+        return self._report(elapsed, scheduler)
+
+    def _wait(self, timeout):
+        """
+        Called when scheduler waits for signals, deliver player signals
+        or move virtual time to next event within timeout.
+        """
+        self._player.process_signals()
+        if self.redis_has_pending():
+            return
+        deadline = min(
+            self.clock.now + datetime.timedelta(seconds=timeout), self._end
+        )
+        while self._events and self._events[0][-1] is None:
+            heapq.heappop(self._events)
+        if self._events and self._events[0][0] <= deadline:
+            when, _, callback = heapq.heappop(self._events)
+            self.clock.advance_to(when)
+            callback()
+        else:
+            self.clock.advance_to(deadline)
+
+    def redis_has_pending(self):
+        return any(
+            pubsub._messages
+            for pubsub in self.redis._pubsubs
+            if settings.SCHEDULER_REDIS_CHANNEL in pubsub.channels
+        )
+
+    def _report(self, elapsed, scheduler):
+        tracks = len(self._plays)
+        simulated = (self.clock.now - self.clock._start).total_seconds()
+        dead_air = sum(self._gaps)
+        return {
+            "simulated_seconds": simulated,
+            "elapsed_seconds": round(elapsed, 3),
+            "tracks_played": tracks,
+            "music_tracks": sum(
+                1 for _, t in self._plays if t["track_type"] == "music"
+            ),
+            "ad_tracks": sum(
+                1 for _, t in self._plays if t["track_type"] == "ad"
+            ),
+            "decisions_per_second": round(tracks / elapsed, 1)
+            if elapsed
+            else None,
+            "dead_air_seconds": round(dead_air, 3),
+            "max_gap_seconds": round(max(self._gaps, default=0), 3),
+            "redis_round_trips_per_track": round(
+                self.redis.commands / tracks, 1
+            )
+            if tracks
+            else None,
+            "downloads": scheduler._storage.downloads,
+            **self._ad_interval_accuracy(),
+        }
+
+    def _ad_interval_accuracy(self):
+        """
+        Compare time between starts of ad breaks with block
+        playback interval.
+        """
+        ad_blocks = {block["id"]: block for block in self._state["ad_blocks"]}
+        breaks = []
+        previous = None
+        for when, track in self._plays:
+            if track["track_type"] == "ad" and (
+                previous is None or previous["track_type"] != "ad"
+            ):
+                breaks.append((when, track))
+            previous = track
+        errors = []
+        for (start, track), (next_start, _) in zip(breaks, breaks[1:]):
+            block = next(
+                (
+                    b
+                    for b in ad_blocks.values()
+                    if track["id"] in b["tracks"]
+                ),
+                None,
+            )
+            if block is None:
+                continue
+            expected = block["playback_interval"] * 60
+            actual = (next_start - start).total_seconds()
+            errors.append(abs(actual - expected))
+        return {
+            "ad_breaks": len(breaks),
+            "ad_interval_mean_error_seconds": round(
+                sum(errors) / len(errors), 3
+            )
+            if errors
+            else None,
+            "ad_interval_max_error_seconds": round(max(errors), 3)
+            if errors
+            else None,
+        }
@@ -1,65 +1,366 @@
+import errno
+import hashlib
 import logging
 import os
 import requests
 import shutil
+import threading
+import time
 
-from typing import Union
+from collections import defaultdict
+from concurrent.futures import Future, ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
 
 from soundfleet_player.conf import settings
+from soundfleet_player.eviction import CachedFile, LRUPolicy
 from soundfleet_player.types import AudioTrack
 
 
 logger = logging.getLogger(__name__)
 
 
+# suffix of files being downloaded and of their progress files
+PARTIAL_SUFFIX = ".part"
+OFFSET_SUFFIX = ".offset"
+# files are stored under hex digest of their content
+DIGEST = hashlib.sha256
+
+
 class DownloadFailed(Exception):
     pass
 
 
+class DownloadPool:
+    """
+    Bounded pool of download threads sharing HTTP session, so connections
+    to server are kept alive. Transfer of a file which is already in
+    flight is not started again, callers share its future.
+    """
+
+    def __init__(self, workers):
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="download"
+        )
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._lock = threading.Lock()
+        self._in_flight = {}
+        self.coalesced = 0
+
+    def submit(self, key, fn, *args) -> Future:
+        with self._lock:
+            future = self._in_flight.get(key)
+            if future is not None:
+                self.coalesced += 1
+                return future
+            future = self._in_flight[key] = self._executor.submit(fn, *args)
+        future.add_done_callback(lambda f: self._release(key, f))
+        return future
+
+    def _release(self, key, future):
+        with self._lock:
+            if self._in_flight.get(key) is future:
+                del self._in_flight[key]
+
+
+_download_pool = None
+_download_pool_lock = threading.Lock()
+
+
+def get_download_pool() -> DownloadPool:
+    global _download_pool
+    with _download_pool_lock:
+        if _download_pool is None:
+            _download_pool = DownloadPool(settings.DOWNLOAD_WORKERS)
+        return _download_pool
+
+
 class AudioTrackStorage:
+    """
+    Content-addressed store of track files. Files are named by digest of
+    their content, so audio uploaded under several names is downloaded
+    and stored once. Track file name is resolved to its digest by index.
+    """
+
     _download_dir = settings.DOWNLOAD_DIR
     _safe_buffer = 2**30  # 1GB
+    # downloads of all threads share free space
+    _space_lock = threading.Lock()
+    # expected size of each temp file being downloaded, by its path
+    _reservations = {}
 
-    def __init__(self):
+    def __init__(self, eviction_policy=None):
         from soundfleet_player.cache import (
             DownloadLRUCache,
+            TrackIndexCache,
         )  # avoid circular import
 
         if not os.path.exists(self._download_dir):
             os.makedirs(self._download_dir, exist_ok=True)
         self._download_lru_cache = DownloadLRUCache(self._download_dir)
+        self._index = TrackIndexCache()
+        self._pool = get_download_pool()
+        self._eviction_policy = eviction_policy or LRUPolicy()
 
     def track_file_exists(self, track):
-        return os.path.exists(self._get_path(track))
+        path = self._get_path(track)
+        if path is None or not os.path.exists(path):
+            return False
+        if track.get("size") and os.path.getsize(path) != track["size"]:
+            logger.warning(f"File {track['file']} is incomplete")
+            return False
+        return True
 
     def download(self, track: AudioTrack):
+        return self.download_async(track).result()
+
+    def download_async(self, track: AudioTrack) -> Future:
+        """
+        Download track in download pool.
+        :return: future resolved with track with uri of its stored file
+            or DownloadFailed
+        """
+        transfer = self._pool.submit(track["file"], self._download, track)
+        future = Future()
+
+        def on_done(transfer):
+            error = transfer.exception()
+            if error is not None:
+                future.set_exception(error)
+            else:
+                uri = f"file://{transfer.result()}"
+                future.set_result(dict(track, uri=uri))
+
+        transfer.add_done_callback(on_done)
+        return future
+
+    def download_many(self, tracks) -> list[Future]:
+        """
+        Download tracks in parallel.
+        :return: futures in order of tracks, each resolved as soon as
+            its file is downloaded
+        """
+        return [self.download_async(track) for track in tracks]
+
+    def _download(self, track: AudioTrack):
+        """
+        :return: path of stored file
+        """
         if not self.track_file_exists(track):
-            while not self.can_download(self._download_dir, track):
-                logger.debug(
-                    f"Unable to download {track['file']},"
-                    f" insufficient free space"
+            part_path = self._partial_path(self._download_dir, track)
+            with self._space_lock:
+                if not self.can_download(self._download_dir, track):
+                    logger.debug(
+                        f"Unable to download {track['file']},"
+                        f" insufficient free space"
+                    )
+                    self.release_disk_space(track.get("size") or 0)
+                if not self.can_download(self._download_dir, track):
+                    logger.error(
+                        f"Unable to free space for {track['file']}"
+                    )
+                    raise DownloadFailed(track)
+                # parallel downloads don't count the same free space
+                self._reservations[part_path] = track.get("size") or 0
+            try:
+                path = self._fetch(track)
+            finally:
+                with self._space_lock:
+                    self._reservations.pop(part_path, None)
+            logger.debug(f"Downloaded file: {track['file']}")
+        else:
+            path = self._get_path(track)
+            logger.debug(f"File {track['file']} already present in filesystem")
+        digest = os.path.basename(path)
+        self._index.set(track["file"], digest)
+        self._download_lru_cache.touch(digest)
+        return path
+
+    def _fetch(self, track: AudioTrack):
+        """
+        Download file to preallocated temp file, resuming by Range
+        requests after failures. Content is hashed while it is written
+        and file is moved to path named by digest once complete, unless
+        same content is already stored.
+        :return: path of stored file
+        """
+        part_path = self._partial_path(self._download_dir, track)
+        offset_path = part_path + OFFSET_SUFFIX
+        try:
+            offset, digest = self._transfer_with_retries(
+                track, part_path, offset_path
+            )
+            size = track.get("size")
+            if size and offset != size:
+                self._remove_partial(part_path, offset_path)
+                logger.error(
+                    f"Downloaded {offset}B of {track['file']},"
+                    f" expected {size}B"
                 )
-                self.release_disk_space()
+                raise DownloadFailed(track)
+            expected = track.get("sha256")
+            if expected and digest.hexdigest() != expected.lower():
+                self._remove_partial(part_path, offset_path)
+                logger.error(f"Checksum of {track['file']} does not match")
+                raise DownloadFailed(track)
+            path = os.path.join(self._download_dir, digest.hexdigest())
+            if os.path.exists(path):
+                # same content stored under other file name
+                self._remove_partial(part_path, offset_path)
+                return path
+            with self._open_partial(part_path, None) as f:
+                # drop preallocated space when size wasn't known
+                f.truncate(offset)
+                os.fsync(f.fileno())
+            os.replace(part_path, path)
+            self._remove_partial(offset_path)
+            return path
+        except DownloadFailed:
+            raise
+        except Exception as e:
+            logger.error(e)
+            raise DownloadFailed(track) from e
+
+    def _transfer_with_retries(self, track, part_path, offset_path):
+        offset = self._read_offset(part_path, offset_path)
+        if offset and offset == track.get("size"):
+            # transfer finished, but file wasn't moved
+            return offset, self._hash_prefix(part_path, offset)
+        attempts = 0
+        while True:
             try:
-                with requests.get(
-                    track.get("url"), stream=True, timeout=3
-                ) as r:
-                    r.raise_for_status()
-                    with open(self._get_path(track), "wb") as f:
-                        shutil.copyfileobj(r.raw, f)
-                logger.debug(f"Downloaded file: {track['file']}")
+                return self._transfer(track, part_path, offset_path, offset)
             except Exception as e:
-                logger.error(e)
+                attempts += 1
+                disk_full = getattr(e, "errno", None) == errno.ENOSPC
+                if attempts > settings.DOWNLOAD_RETRIES or disk_full:
+                    logger.error(e)
+                    raise DownloadFailed(track) from e
+                logger.warning(
+                    f"Download of {track['file']} interrupted, resuming: {e}"
+                )
+                offset = self._read_offset(part_path, offset_path)
+                time.sleep(min(attempts, 5))
+
+    def _transfer(self, track, part_path, offset_path, offset):
+        """
+        Write response to temp file from offset.
+        :return: offset after last written byte and digest of content
+        """
+        headers = {"Range": f"bytes={offset}-"} if offset else None
+        with self._pool.session.get(
+            track.get("url"),
+            headers=headers,
+            stream=True,
+            timeout=(3, settings.DOWNLOAD_TIMEOUT),
+        ) as r:
+            if r.status_code == 416:
+                # range is beyond end of file, next attempt starts over
+                self._remove_partial(part_path, offset_path)
                 raise DownloadFailed(track)
-        else:
-            logger.debug(f"File {track['file']} already present in filesystem")
-        self._download_lru_cache.touch(track["file"])
-        return track
+            r.raise_for_status()
+            if offset and r.status_code != 206:
+                # server ignored range, whole file is sent
+                offset = 0
+            # only resumed download reads back what was written before
+            digest = self._hash_prefix(part_path, offset)
+            with self._open_partial(part_path, track.get("size")) as f:
+                f.seek(offset)
+                for chunk in r.iter_content(settings.DOWNLOAD_CHUNK_SIZE):
+                    f.write(chunk)
+                    digest.update(chunk)
+                    offset += len(chunk)
+                    # data reaches disk before offset pointing past it
+                    f.flush()
+                    os.fsync(f.fileno())
+                    self._write_offset(offset_path, offset)
+        return offset, digest
+
+    @staticmethod
+    def _hash_prefix(part_path, offset):
+        digest = DIGEST()
+        if not offset:
+            return digest
+        with open(part_path, "rb") as f:
+            while offset > 0:
+                chunk = f.read(min(offset, settings.DOWNLOAD_CHUNK_SIZE))
+                if not chunk:
+                    break
+                digest.update(chunk)
+                offset -= len(chunk)
+        return digest
+
+    @staticmethod
+    def _open_partial(part_path, size):
+        if os.path.exists(part_path):
+            return open(part_path, "r+b")
+        f = open(part_path, "w+b")
+        if size:
+            # reserve space at once, file is not fragmented by chunks
+            try:
+                os.posix_fallocate(f.fileno(), 0, size)
+            except AttributeError:
+                f.truncate(size)
+            except OSError as e:
+                if e.errno not in (errno.EINVAL, errno.EOPNOTSUPP):
+                    # disk is full, sparse file would hide it
+                    f.close()
+                    os.unlink(part_path)
+                    raise
+                # filesystem can't preallocate
+                f.truncate(size)
+        return f
+
+    @staticmethod
+    def _partial_path(directory, track):
+        return os.path.join(directory, track["file"]) + PARTIAL_SUFFIX
+
+    @staticmethod
+    def _allocated(path):
+        try:
+            return os.stat(path).st_blocks * 512
+        except OSError:
+            return 0
+
+    @staticmethod
+    def _read_offset(part_path, offset_path):
+        if not os.path.exists(part_path):
+            return 0
+        try:
+            with open(offset_path) as f:
+                return int(f.read())
+        except (OSError, ValueError):
+            return 0
+
+    @staticmethod
+    def _write_offset(offset_path, offset):
+        with open(offset_path, "w") as f:
+            f.write(str(offset))
+
+    @staticmethod
+    def _remove_partial(*paths):
+        for path in paths:
+            if os.path.exists(path):
+                os.unlink(path)
 
     @classmethod
     def remove_tracks(cls, *tracks):
+        from soundfleet_player.cache import TrackIndexCache
+
+        index = TrackIndexCache()
         for track in tracks:
-            path = cls._get_path(track)
+            part_path = cls._partial_path(cls._download_dir, track)
+            if part_path not in cls._reservations:
+                # unfinished download won't be resumed
+                cls._remove_partial(part_path, part_path + OFFSET_SUFFIX)
+            digest = index.get(track["file"])
+            index.remove(track["file"])
+            if digest is None or index.references(digest):
+                # content is still used by other tracks
+                continue
+            path = os.path.join(cls._download_dir, digest)
             logger.debug(f"Trying to remove file: {path} from local filesystem")
             if os.path.exists(path):
                 os.unlink(path)
@@ -67,26 +368,93 @@ class AudioTrackStorage:
     @classmethod
     def can_download(cls, dest: str, track: dict):
         """
-        Check if destination has enough space with margin of 100MB
+        Check if destination has enough space with margin of 100MB,
+        after downloads in progress take space they still need.
         """
-        return shutil.disk_usage(dest).free - track["size"] >= cls._safe_buffer
+        part_path = cls._partial_path(dest, track)
+        needed = max(track["size"] - cls._allocated(part_path), 0)
+        free = shutil.disk_usage(dest).free - cls._reserved_space()
+        return free - needed >= cls._safe_buffer
 
     @classmethod
-    def _get_path(cls, track):
-        return os.path.join(cls._download_dir, track["file"])
+    def _reserved_space(cls):
+        """
+        Bytes downloads in progress are yet to take from disk.
+        """
+        return sum(
+            max(size - cls._allocated(part_path), 0)
+            for part_path, size in cls._reservations.items()
+        )
 
-    def release_disk_space(self) -> None:
+    def _get_path(self, track):
         """
-        Delete single track using LRU algorithm
+        :return: path of stored content of track, None when it wasn't
+            downloaded yet and server didn't send its digest
         """
-        files_with_date = self._download_lru_cache.all()
-        lru_ordered = iter(sorted(files_with_date.items(), key=lambda i: i[1]))
-        fname, counter = next(lru_ordered, (None, None))
-        self._delete_file(fname)
+        digest = track.get("sha256") or self._index.get(track["file"])
+        if digest is None:
+            return None
+        return os.path.join(self._download_dir, digest.lower())
 
-    def _delete_file(self, fname: Union[str, None]) -> None:
-        if fname is not None:
-            path = os.path.abspath(os.path.join(self._download_dir, fname))
-            if os.path.exists(path):
-                os.unlink(path)
-            self._download_lru_cache.remove(fname)
+    def release_disk_space(self, size=0) -> None:
+        """
+        Delete files in order of eviction policy until there is free
+        space for file of size and CACHE_FREE_WATERMARK on top of it, so
+        following downloads don't have to evict files one by one.
+        """
+        target = self._safe_buffer + size + settings.CACHE_FREE_WATERMARK
+        free = (
+            shutil.disk_usage(self._download_dir).free - self._reserved_space()
+        )
+        # temp files of failed downloads go first, they are started
+        # over if track is needed again
+        for part_path in self._idle_partials():
+            if free >= target:
+                break
+            free += os.path.getsize(part_path)
+            self._remove_partial(part_path, part_path + OFFSET_SUFFIX)
+        files = {f.name: f for f in self._cached_files()}
+        to_delete = []
+        for fname in self._eviction_policy.order(files.values()):
+            if free >= target:
+                break
+            free += files[fname].size
+            to_delete.append(fname)
+        for fname in to_delete:
+            self._delete_file(fname)
+        self._download_lru_cache.remove(*to_delete)
+        logger.debug(f"Released {len(to_delete)} files")
+
+    def _idle_partials(self):
+        """
+        Temp files of downloads which are not in progress.
+        """
+        return [
+            path
+            for path in (
+                os.path.join(self._download_dir, fname)
+                for fname in os.listdir(self._download_dir)
+                if fname.endswith(PARTIAL_SUFFIX)
+            )
+            if path not in self._reservations
+        ]
+
+    def _cached_files(self) -> list[CachedFile]:
+        tracks = defaultdict(set)
+        for track_file, digest in self._index.all().items():
+            tracks[digest].add(track_file)
+        files = []
+        for fname, last_access, hits in self._download_lru_cache.entries():
+            path = os.path.join(self._download_dir, fname)
+            size = os.path.getsize(path) if os.path.exists(path) else 0
+            files.append(
+                CachedFile(
+                    fname, last_access, hits, size, frozenset(tracks[fname])
+                )
+            )
+        return files
+
+    def _delete_file(self, fname: str) -> None:
+        path = os.path.abspath(os.path.join(self._download_dir, fname))
+        if os.path.exists(path):
+            os.unlink(path)
@@ -0,0 +1,60 @@
+import heapq
+import itertools
+
+from soundfleet_player.utils import monotonic
+
+
+class Timers:
+    """
+    Heap of named deadlines.
+
+    Scheduling a timer under a name that is already scheduled replaces
+    its deadline, replaced and cancelled entries are dropped lazily.
+    """
+
+    def __init__(self, clock=None):
+        self._clock = clock or monotonic
+        self._heap = []
+        self._entries = {}
+        self._counter = itertools.count()
+
+    def schedule(self, name, delay, callback):
+        self.cancel(name)
+        entry = [
+            self._clock() + max(delay, 0),
+            next(self._counter),
+            name,
+            callback,
+        ]
+        self._entries[name] = entry
+        heapq.heappush(self._heap, entry)
+
+    def cancel(self, name):
+        entry = self._entries.pop(name, None)
+        if entry is not None:
+            entry[-1] = None
+
+    def is_scheduled(self, name):
+        return name in self._entries
+
+    def timeout(self, max_timeout=None):
+        """
+        Seconds until the nearest deadline, capped by max_timeout.
+        """
+        while self._heap and self._heap[0][-1] is None:
+            heapq.heappop(self._heap)
+        if not self._heap:
+            return max_timeout
+        timeout = max(self._heap[0][0] - self._clock(), 0)
+        if max_timeout is not None:
+            timeout = min(timeout, max_timeout)
+        return timeout
+
+    def run_due(self):
+        now = self._clock()
+        while self._heap and self._heap[0][0] <= now:
+            _, _, name, callback = heapq.heappop(self._heap)
+            if callback is None:
+                continue
+            del self._entries[name]
+            callback()
@@ -10,16 +10,23 @@ class AudioTrack(TypedDict):
     length: int
     size: int
     url: str
+    # hex digest of content, optional
+    sha256: str
 
 
-class MusicBlock(TypedDict):
+class BlockCalendar(TypedDict, total=False):
+    weekdays: list[int]
+    dates: list[str]
+
+
+class MusicBlock(BlockCalendar):
     id: int
     start: datetime.time
     end: datetime.time
     tracks: list[int]
 
 
-class AdBlock(TypedDict):
+class AdBlock(BlockCalendar):
     id: int
     start: datetime.time
     end: datetime.time
@@ -29,6 +36,15 @@ class AdBlock(TypedDict):
     tracks: list[int]
 
 
+class Spot(BlockCalendar):
+    id: int
+    # "HH:MM:SS" local time of start
+    time: str
+    track: int
+    # "preempt" interrupts current track, "follow" waits for its end
+    priority: Literal["preempt", "follow"]
+
+
 class Device(TypedDict):
     id: str
     timezone_name: str
@@ -41,3 +57,4 @@ class DeviceState(TypedDict):
     audio_tracks: list[AudioTrack]
     music_blocks: list[MusicBlock]
     ad_blocks: list[AdBlock]
+    spots: list[Spot]
@@ -37,6 +37,38 @@ class Null:
         return self
 
 
+class Clock:
+    """
+    Source of current time, replaced with virtual clock in simulation.
+    """
+
+    def utcnow(self):
+        return datetime.datetime.utcnow().replace(tzinfo=pytz.utc)
+
+    def monotonic(self):
+        return time.monotonic()
+
+
+clock = Clock()
+
+# when set, called instead of connecting to Redis server
+_redis_conn_factory = None
+
+
+def set_clock(new_clock):
+    global clock
+    clock = new_clock
+
+
+def set_redis_conn_factory(factory):
+    global _redis_conn_factory
+    _redis_conn_factory = factory
+
+
+def monotonic():
+    return clock.monotonic()
+
+
 class RedisQueue:
     def __init__(self, redis, name, namespace="queue"):
         self.key = "{}:{}".format(namespace, name)
@@ -68,11 +100,34 @@ class RedisQueue:
         return item
 
 
-def get_and_decode_redis_message(redis_pipe, logger):
+def encode_signal(name, args, zone=None, timestamp=True):
+    """
+    Signal is JSON list of name, args and send timestamp, followed
+    by zone id in multi-zone setup.
+    :param timestamp: False for signals sent within process,
+        their transit is not measured
+    """
+    signal = [name, args, time.time() if timestamp else None]
+    if zone is not None:
+        signal.append(zone)
+    return json.dumps(signal)
+
+
+def get_signal_zone(signal):
+    return signal[3] if len(signal) > 3 else None
+
+
+def get_and_decode_redis_message(redis_pipe, logger, timeout=0.0):
+    """
+    Get next message from pubsub, block up to timeout seconds
+    when no message is pending.
+    """
     try:
-        msg = redis_pipe.get_message()
+        msg = redis_pipe.get_message(timeout=timeout)
     except redis.exceptions.ConnectionError:
         logger.error("Redis connection closed.")
+        # avoid spinning on closed connection
+        time.sleep(min(timeout, 1))
         return
     if msg and msg["type"] == "message":
         try:
@@ -85,7 +140,7 @@ def get_and_decode_redis_message(redis_pipe, logger):
 
 
 def get_local_time(timezone):
-    utc_now = datetime.datetime.utcnow().replace(tzinfo=pytz.utc)
+    utc_now = clock.utcnow()
     return utc_now.astimezone(timezone)
 
 
@@ -96,6 +151,8 @@ def get_local_time_from_time_str(timezone, time_str):
 
 
 def get_redis_conn(host="redis", port=6379, timeout=60 * 60):
+    if _redis_conn_factory is not None:
+        return _redis_conn_factory()
     conn = redis.StrictRedis(
         host=host,
         port=port,
@@ -0,0 +1,139 @@
+import logging
+import queue
+import threading
+import time
+import traceback
+
+
+logger = logging.getLogger(__name__)
+
+
+class Task:
+    def __init__(self, key, fn, args):
+        self.key = key
+        self.fn = fn
+        self.args = args
+        self.submitted_at = time.monotonic()
+        self.rerun = False
+        # task submitted for key while this one was cancelled but running
+        self.successor = None
+        self._cancelled = threading.Event()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def cancel(self):
+        self._cancelled.set()
+
+
+class WorkerPool:
+    """
+    Fixed number of long-lived threads running keyed tasks.
+
+    Only one task per key is in flight, submitting task for a key that is
+    already in flight requests single rerun after current run finishes,
+    so no submission is lost and work for a key never overlaps.
+    """
+
+    def __init__(self, size=2, name="worker"):
+        self._size = size
+        self._name = name
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._in_flight = {}
+        self._threads = []
+        self._tasks_count = 0
+        self._last_wait_time = 0.0
+        self._last_run_time = 0.0
+        self._max_wait_time = 0.0
+
+    def submit(self, key, fn, *args):
+        with self._lock:
+            task = self._in_flight.get(key)
+            if task is not None and not task.cancelled:
+                task.rerun = True
+                return task
+            new_task = Task(key, fn, args)
+            if task is not None:
+                # starts once cancelled task returns
+                task.successor = new_task
+                return new_task
+            self._in_flight[key] = new_task
+            self._start_workers()
+        self._queue.put(new_task)
+        return new_task
+
+    def cancel(self, key):
+        """
+        Cancel task for key, queued task will not run and running one
+        won't be rerun. Key stays busy until running task returns.
+        """
+        with self._lock:
+            task = self._in_flight.get(key)
+            if task is not None:
+                task.cancel()
+                task.successor = None
+
+    def is_busy(self, key):
+        return key in self._in_flight
+
+    def stats(self):
+        return {
+            "queue_depth": self._queue.qsize(),
+            "in_flight": len(self._in_flight),
+            "tasks_count": self._tasks_count,
+            "last_wait_time": round(self._last_wait_time, 4),
+            "max_wait_time": round(self._max_wait_time, 4),
+            "last_run_time": round(self._last_run_time, 4),
+        }
+
+    def shutdown(self):
+        for _ in self._threads:
+            self._queue.put(None)
+        self._threads = []
+
+    def _start_workers(self):
+        while len(self._threads) < self._size:
+            thread = threading.Thread(
+                target=self._work,
+                name="{}-{}".format(self._name, len(self._threads)),
+                daemon=True,
+            )
+            thread.start()
+            self._threads.append(thread)
+
+    def _work(self):
+        while True:
+            task = self._queue.get()
+            if task is None:
+                break
+            if not task.cancelled:
+                self._run(task)
+            with self._lock:
+                if task.rerun and not task.cancelled:
+                    task.rerun = False
+                    task.submitted_at = time.monotonic()
+                    self._queue.put(task)
+                elif task.successor is not None:
+                    self._in_flight[task.key] = task.successor
+                    self._queue.put(task.successor)
+                    task.successor = None
+                elif self._in_flight.get(task.key) is task:
+                    del self._in_flight[task.key]
+
+    def _run(self, task):
+        started_at = time.monotonic()
+        wait_time = started_at - task.submitted_at
+        try:
+            task.fn(*task.args)
+        except Exception as e:
+            logger.error(
+                "Task {} failed: {} \n {}".format(
+                    task.key, e, traceback.format_exc()
+                )
+            )
+        self._tasks_count += 1
+        self._last_wait_time = wait_time
+        self._max_wait_time = max(self._max_wait_time, wait_time)
+        self._last_run_time = time.monotonic() - started_at
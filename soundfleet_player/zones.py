@@ -0,0 +1,150 @@
+"""
+Several zones (rooms, outputs) played by single device.
+
+Each zone has its own scheduler and player, so playlists, current track,
+saved state and latency stats are kept per zone. Zone id is sent as fourth
+element of signals, signals without zone (device sync, playerctl) are
+delivered to all zones. Zones share device, Redis connection and
+generator workers, single loop serves all of them.
+"""
+import logging
+import time
+
+from soundfleet_player.conf import settings
+from soundfleet_player.device import Device
+from soundfleet_player.player import Player
+from soundfleet_player.scheduler import Scheduler
+from soundfleet_player.workers import WorkerPool
+from soundfleet_player.utils import (
+    get_and_decode_redis_message,
+    get_redis_conn,
+    get_signal_zone,
+)
+
+
+logger = logging.getLogger(__name__)
+
+
+def route_signal(signal, zones):
+    """
+    :param zones: dict of zone id and its scheduler or player
+    :return: list of zone schedulers or players signal is addressed to
+    """
+    zone = get_signal_zone(signal)
+    if zone is None:
+        return list(zones.values())
+    if zone not in zones:
+        logger.warning("Signal {} for unknown zone {}".format(signal, zone))
+        return []
+    return [zones[zone]]
+
+
+class MultiZoneScheduler:
+    def __init__(self, zones):
+        self._redis = get_redis_conn()
+        self._redis_pipe = self._redis.pubsub()
+        self._redis_pipe.subscribe(settings.SCHEDULER_REDIS_CHANNEL)
+        self._device = Device()
+        # two generators per zone
+        workers = WorkerPool(size=2 * len(zones), name="generator")
+        self._schedulers = {}
+        outbox = None
+        for zone in zones:
+            scheduler = self._create_scheduler(zone, workers, outbox)
+            outbox = scheduler._outbox
+            # device is synced once for all zones
+            scheduler._is_primary = not self._schedulers
+            self._schedulers[zone] = scheduler
+
+    def _create_scheduler(self, zone, workers, outbox):
+        return Scheduler(
+            zone=zone,
+            device=self._device,
+            workers=workers,
+            outbox=outbox,
+            redis=self._redis,
+        )
+
+    def run(self):
+        schedulers = list(self._schedulers.values())
+        schedulers[0]._outbox.start()
+        restored = [scheduler._restore_state() for scheduler in schedulers]
+        if not all(restored):
+            self._device.sync()
+        for scheduler in schedulers:
+            scheduler._schedule_day_change()
+        while self._should_run():
+            self._drain_signals(
+                timeout=min(
+                    scheduler._timers.timeout(Scheduler.MAX_WAIT)
+                    for scheduler in schedulers
+                )
+            )
+            for scheduler in schedulers:
+                scheduler._process()
+
+    @classmethod
+    def _should_run(cls):
+        return True
+
+    def _drain_signals(self, timeout):
+        signal = get_and_decode_redis_message(
+            self._redis_pipe, logger, timeout=timeout
+        )
+        deadline = time.monotonic() + settings.SCHEDULER_DRAIN_BUDGET
+        count = 0
+        while signal:
+            for scheduler in route_signal(signal, self._schedulers):
+                scheduler._queue_signal(signal)
+            count += 1
+            if (
+                count >= Scheduler.DRAIN_BATCH_SIZE
+                or time.monotonic() >= deadline
+            ):
+                break
+            signal = get_and_decode_redis_message(self._redis_pipe, logger)
+
+
+class MultiZonePlayer:
+    def __init__(self, media_backends):
+        """
+        :param media_backends: dict of zone id and its media backend
+        """
+        self._redis = get_redis_conn()
+        self._redis_pipe = self._redis.pubsub()
+        self._redis_pipe.subscribe(settings.PLAYER_REDIS_CHANNEL)
+        self._players = {
+            zone: self._create_player(media_backend, zone)
+            for zone, media_backend in media_backends.items()
+        }
+
+    def _create_player(self, media_backend, zone):
+        return Player(media_backend, zone=zone, redis=self._redis)
+
+    def run(self):
+        players = list(self._players.values())
+        for player in players:
+            player._ack_ready()
+        next_idle_check = time.monotonic() + Player.IDLE_INTERVAL
+        while self._should_run():
+            signal = get_and_decode_redis_message(
+                self._redis_pipe,
+                logger,
+                timeout=min(
+                    player._get_timeout(next_idle_check) for player in players
+                ),
+            )
+            if signal:
+                for player in route_signal(signal, self._players):
+                    player._dispatch_signal(signal)
+            for player in players:
+                player._check_deadlines()
+            if time.monotonic() >= next_idle_check:
+                for player in players:
+                    player._check_idle()
+                    player._latency.flush()
+                next_idle_check = time.monotonic() + Player.IDLE_INTERVAL
+
+    @classmethod
+    def _should_run(cls):
+        return True
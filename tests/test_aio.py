@@ -0,0 +1,134 @@
+import asyncio
+import json
+import pytest
+import pytz
+import threading
+import time
+
+from unittest import mock
+
+from soundfleet_player.aio import AsyncScheduler
+from soundfleet_player.conf import settings
+from soundfleet_player.utils import get_redis_conn
+from .utils import ExitAfter, is_redis_running
+
+
+class MyDevice:
+    @property
+    def timezone(self):
+        return pytz.UTC
+
+    @property
+    def playback_priority(self):
+        return "music_over_ads"
+
+    @property
+    def volume(self):
+        return 100
+
+    def __init__(self):
+        self.snapshot_threads = []
+        self.snapshot = None
+
+    def sync(self):
+        pass
+
+    def load_snapshot(self):
+        self.snapshot_threads.append(threading.get_ident())
+        return {"loaded": len(self.snapshot_threads)}
+
+    def invalidate(self, snapshot=None):
+        self.snapshot = snapshot
+
+
+@pytest.mark.skipif(
+    not is_redis_running(host="redis"), reason="Redis is not running"
+)
+@mock.patch("soundfleet_player.aio.AsyncScheduler.MAX_WAIT", 0.1)
+@mock.patch("soundfleet_player.aio.AsyncScheduler._should_run")
+@mock.patch("soundfleet_player.scheduler.Device")
+def test_async_scheduler_dispatches_signals(device, should_run):
+    device.return_value = MyDevice()
+    should_run.side_effect = ExitAfter(20)
+
+    def player_ready():
+        signal = json.dumps(("PLAYER_READY", []))
+        r = get_redis_conn()
+        while not r.publish(settings.SCHEDULER_REDIS_CHANNEL, signal):
+            time.sleep(0.01)
+
+    scheduler = AsyncScheduler()
+    threading.Timer(0.1, player_ready).start()
+    scheduler.run()
+    assert scheduler._player_ready
+
+
+@pytest.mark.skipif(
+    not is_redis_running(host="redis"), reason="Redis is not running"
+)
+@mock.patch("soundfleet_player.aio.AsyncScheduler.MAX_WAIT", 0.1)
+@mock.patch("soundfleet_player.aio.AsyncScheduler._should_run")
+@mock.patch("soundfleet_player.scheduler.Device")
+def test_async_scheduler_keeps_redis_reads_and_writes_off_loop(
+    device, should_run
+):
+    device.return_value = my_device = MyDevice()
+    should_run.side_effect = ExitAfter(20)
+
+    def publish_signals():
+        r = get_redis_conn()
+        for signal in (("PLAYER_READY", []), ("DEVICE_UPDATED", [])):
+            while not r.publish(
+                settings.SCHEDULER_REDIS_CHANNEL, json.dumps(signal)
+            ):
+                time.sleep(0.01)
+
+    scheduler = AsyncScheduler()
+    assert scheduler._redis_pipe is None
+    scheduler._state_cache.set({})
+    scheduler._generation = 1
+    threading.Timer(0.1, publish_signals).start()
+    with mock.patch.object(
+        scheduler._state_cache, "set"
+    ) as set_state, mock.patch.object(
+        scheduler._metrics, "set"
+    ) as set_metrics, mock.patch.object(
+        scheduler._clock, "measure", return_value=0.0
+    ):
+        loop_thread = threading.get_ident()
+        scheduler.run()
+    state = scheduler._state_cache.get()
+    scheduler._state_cache.set({})
+    set_state.assert_not_called()
+    set_metrics.assert_not_called()
+    # state was written by async connection
+    assert state["player_ready"]
+    # snapshot read at startup, after sync and after DEVICE_UPDATED,
+    # never on loop
+    assert len(my_device.snapshot_threads) == 3
+    assert loop_thread not in my_device.snapshot_threads
+    assert my_device.snapshot == {"loaded": 3}
+
+
+@pytest.mark.skipif(
+    not is_redis_running(host="redis"), reason="Redis is not running"
+)
+@mock.patch("soundfleet_player.scheduler.Device")
+def test_async_generators_are_single_flight(device):
+    device.return_value = MyDevice()
+    scheduler = AsyncScheduler()
+    calls = []
+
+    def generate():
+        calls.append(1)
+        time.sleep(0.1)
+
+    async def run():
+        scheduler._run_generator(generate, "music")
+        await asyncio.sleep(0.01)
+        scheduler._run_generator(generate, "music")
+        scheduler._run_generator(generate, "music")
+        await asyncio.gather(*scheduler._tasks)
+
+    asyncio.run(run())
+    assert len(calls) == 2
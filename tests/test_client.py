@@ -1,4 +1,5 @@
 import pytest
+import requests
 
 from unittest import mock
 
@@ -24,3 +25,18 @@ def test_make_request(method):
         request.return_value = MyResponse(200)
         client.make_request("http://127.0.0.1", method)
         assert request.called
+
+
+@pytest.mark.parametrize(
+    ["status_code", "returned"], [(404, True), (503, False)]
+)
+def test_make_request_returns_client_errors(status_code, returned):
+    response = requests.Response()
+    response.status_code = status_code
+    with mock.patch("soundfleet_player.client.requests.post") as request:
+        request.return_value = response
+        assert client.make_request("http://127.0.0.1", "post") is None
+        result = client.make_request(
+            "http://127.0.0.1", "post", return_client_errors=True
+        )
+        assert (result is response) == returned
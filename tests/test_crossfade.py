@@ -0,0 +1,161 @@
+import threading
+import time
+
+from unittest import mock
+
+import pytest
+
+from soundfleet_player.media_backends.crossfade import MediaBackend
+
+
+class MyMediaPlayer:
+    def __init__(self):
+        self.volumes = []
+        self.media = None
+        self.playing = False
+        self.length = -1
+        self.time = -1
+
+    def event_manager(self):
+        return mock.Mock()
+
+    def set_media(self, media):
+        self.media = media
+
+    def play(self):
+        self.playing = True
+
+    def stop(self):
+        self.playing = False
+
+    def is_playing(self):
+        return self.playing
+
+    def audio_set_volume(self, value):
+        self.volumes.append(value)
+
+    def get_length(self):
+        return self.length
+
+    def get_time(self):
+        return self.time
+
+
+@pytest.fixture
+def backend():
+    with mock.patch(
+        "soundfleet_player.media_backends.crossfade.vlc.MediaPlayer",
+        MyMediaPlayer,
+    ), mock.patch("soundfleet_player.media_backends.crossfade.vlc.Media"):
+        backend = MediaBackend(crossfade=0.2)
+        yield backend
+        backend.stop()
+
+
+def track(id, length=1):
+    return {"id": id, "uri": "file:///{}.ogg".format(id), "length": length}
+
+
+def test_end_is_reported_at_cue_out(backend):
+    events = []
+    ended = threading.Event()
+
+    def callback(name, track):
+        events.append((name, track))
+        ended.set()
+
+    backend.set_event_callback(callback)
+    t = time.monotonic()
+    backend.play(track(1))
+    assert ended.wait(2)
+    # end is reported crossfade before end of track
+    assert 0.7 <= time.monotonic() - t < 0.95
+    assert events == [("END_REACHED", track(1))]
+    assert backend._deck.cued_out
+
+
+def test_cue_out_is_rescheduled_by_position(backend):
+    events = []
+    backend.set_event_callback(lambda *args: events.append(args))
+    first = track(1, length=10)
+    backend.play(first)
+    backend._cancel_cue_timer()
+    deck = backend._deck
+    deck.player.length = 10000
+    # track started late
+    deck.player.time = 9000
+    backend._cue_out(deck, first)
+    assert not deck.cued_out
+    assert backend._cue_timer is not None
+    assert not events
+
+    deck.player.time = 9790
+    backend._cue_out(deck, first)
+    assert deck.cued_out
+    assert events == [("END_REACHED", first)]
+
+
+def test_next_track_crossfades_on_other_deck(backend):
+    first, second = track(1), track(2)
+    backend.play(first)
+    outgoing = backend._deck
+    backend._cancel_cue_timer()
+    backend._cue_out(outgoing, first)
+    backend.play(second)
+    incoming = backend._deck
+    assert incoming is not outgoing
+    assert incoming.track == second
+    assert incoming.player.volumes[0] == 0
+    # outgoing deck fades out while incoming one fades in
+    assert outgoing.player.playing
+    time.sleep(0.3)
+    assert outgoing.player.volumes[-1] == 0
+    assert not outgoing.player.playing
+    assert incoming.player.volumes[-1] == 100
+
+
+def test_track_is_replaced_without_crossfade(backend):
+    first, second = track(1), track(2)
+    backend.play(first)
+    outgoing = backend._deck
+    backend.play(second)
+    assert not outgoing.player.playing
+    assert outgoing.track is None
+    assert backend._deck.player.volumes == [100]
+
+
+def test_get_cue_points(backend):
+    assert backend.get_cue_points() is None
+    backend.play(track(1, length=10))
+    assert backend.get_cue_points() == {
+        "cue_in": 0,
+        "cue_out": 9800,
+        "length": 10000,
+        "crossfade": 200,
+    }
+    # length reported by VLC wins over declared one
+    backend._deck.player.length = 10500
+    assert backend.get_cue_points()["cue_out"] == 10300
+    assert backend.get_duration() == 10.3
+    # short tracks are played whole
+    backend.play(track(2, length=0.3))
+    assert backend.get_cue_points()["crossfade"] == 0
+
+
+def test_set_volume_during_ramps(backend):
+    first, second = track(1), track(2)
+    backend.play(first)
+    outgoing = backend._deck
+    backend._cancel_cue_timer()
+    backend._cue_out(outgoing, first)
+    backend.play(second)
+    incoming = backend._deck
+    backend.set_volume(50)
+    time.sleep(0.3)
+    # incoming track fades in to new volume, outgoing one still fades out
+    assert incoming.player.volumes[-1] == 50
+    assert max(incoming.player.volumes) <= 50
+    assert outgoing.player.volumes[-1] == 0
+
+    backend.set_volume(70)
+    assert incoming.player.volumes[-1] == 70
@@ -76,3 +76,31 @@ def test_sync(
     assert device.audio_tracks == expected_audio_tracks
     assert device.music_blocks == expected_music_blocks
     assert device.ad_blocks == expected_ad_blocks
+
+
+@pytest.mark.skipif(
+    not is_redis_running(host="redis"), reason="Redis is not running"
+)
+def test_state_is_read_from_redis_until_invalidated():
+    device = Device()
+    device._cache.set({"id": "1", "volume": 10})
+    assert device.volume == 10
+    with mock.patch.object(device._cache, "get") as get:
+        assert device.volume == 10
+        assert device.playback_priority == "music"
+        assert not get.called
+    device._cache.set({"id": "1", "volume": 20})
+    assert device.volume == 10
+    device.invalidate()
+    assert device.volume == 20
+
+
+@pytest.mark.skipif(
+    not is_redis_running(host="redis"), reason="Redis is not running"
+)
+def test_update_device_state_cache_invalidates_state():
+    device = Device()
+    device._cache.set({"id": "1", "volume": 10})
+    assert device.volume == 10
+    device.update_device_state_cache(volume=50)
+    assert device.volume == 50
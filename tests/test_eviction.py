@@ -0,0 +1,132 @@
+import datetime
+import pytz
+
+from soundfleet_player.benchmark import run_eviction_benchmark
+from soundfleet_player.eviction import (
+    CachedFile,
+    LRUPolicy,
+    ScheduleAwarePolicy,
+)
+from soundfleet_player.schedule import ScheduleIndex, SpotSchedule
+
+
+class MyDevice:
+    timezone = pytz.UTC
+
+    def __init__(self, music_blocks, ad_blocks=(), spots=(), tracks=60):
+        self.music_schedule = ScheduleIndex(music_blocks, self.timezone)
+        self.ad_schedule = ScheduleIndex(ad_blocks, self.timezone)
+        self.spot_schedule = SpotSchedule(spots, self.timezone)
+        self.audio_tracks = {
+            i: {
+                "id": i,
+                "file": "{}.ogg".format(i),
+                "size": 10 * 2**20,
+                "length": 180,
+            }
+            for i in range(1, tracks + 1)
+        }
+
+
+MUSIC_BLOCKS = [
+    {"id": 1, "start": "06:00:00", "end": "11:59:59", "tracks": [1, 2]},
+    {"id": 2, "start": "12:00:00", "end": "23:59:59", "tracks": [3, 4]},
+]
+AD_BLOCKS = [
+    {
+        "id": 1,
+        "start": "08:00:00",
+        "end": "20:00:00",
+        "playback_interval": 30,
+        "ads_count_per_block": 2,
+        "play_all_ads": False,
+        "tracks": [5, 6],
+    }
+]
+SPOTS = [{"id": 1, "time": "09:00:00", "track": 7, "priority": "preempt"}]
+NOW = datetime.datetime(2024, 1, 1, 10, 0, tzinfo=pytz.UTC)
+
+
+def cached_file(track_id, last_access=0, hits=1, size=2**20):
+    name = "{}.ogg".format(track_id)
+    return CachedFile(name, last_access, hits, size, frozenset([name]))
+
+
+def test_lru_policy_evicts_least_recently_used():
+    files = [cached_file(1, 20), cached_file(2, 10), cached_file(3, 30)]
+    assert LRUPolicy().order(files) == ["2.ogg", "1.ogg", "3.ogg"]
+
+
+def test_schedule_aware_policy_pins_upcoming_tracks():
+    device = MyDevice(MUSIC_BLOCKS, AD_BLOCKS, SPOTS)
+    files = [cached_file(track_id) for track_id in range(1, 9)]
+    # tracks of current blocks and of next music block are pinned,
+    # those needed later are evicted first when nothing else is left
+    order = ScheduleAwarePolicy(device, horizon=2).order(files, now=NOW)
+    assert order[:4] == ["8.ogg", "7.ogg", "3.ogg", "4.ogg"]
+    assert set(order[4:]) == {"1.ogg", "2.ogg", "5.ogg", "6.ogg"}
+    # spot of next day is pinned too
+    order = ScheduleAwarePolicy(device, horizon=23).order(files, now=NOW)
+    assert order[:4] == ["8.ogg", "7.ogg", "3.ogg", "4.ogg"]
+
+
+def test_schedule_aware_policy_evicts_unreferenced_tracks_first():
+    device = MyDevice(MUSIC_BLOCKS, AD_BLOCKS, SPOTS)
+    files = [cached_file(3, last_access=10), cached_file(8, last_access=20)]
+    order = ScheduleAwarePolicy(device, horizon=0).order(files, now=NOW)
+    assert order == ["8.ogg", "3.ogg"]
+
+
+def test_schedule_aware_policy_weighs_hits_and_size():
+    device = MyDevice(
+        [
+            {
+                "id": 1,
+                "start": "00:00:00",
+                "end": "01:00:00",
+                "tracks": [1, 2, 3, 4],
+            }
+        ]
+    )
+    files = [
+        cached_file(1, last_access=10, hits=5),
+        cached_file(2, last_access=10, hits=5, size=2**22),
+        cached_file(3, last_access=10, hits=1),
+        # recently used file outweighs hits of others
+        cached_file(4, last_access=10**6, hits=1),
+    ]
+    order = ScheduleAwarePolicy(device, horizon=0).order(files, now=NOW)
+    assert order == ["3.ogg", "2.ogg", "1.ogg", "4.ogg"]
+
+
+def test_eviction_benchmark_replays_week_of_schedule():
+    music_blocks = [
+        {
+            "id": 1,
+            "start": "06:00:00",
+            "end": "11:59:59",
+            "tracks": list(range(1, 21)),
+        },
+        {
+            "id": 2,
+            "start": "12:00:00",
+            "end": "21:59:59",
+            "tracks": list(range(21, 41)),
+        },
+    ]
+    ad_blocks = [dict(AD_BLOCKS[0], tracks=[41, 42, 43, 44])]
+    spots = [dict(SPOTS[0], track=45)]
+    device = MyDevice(music_blocks, ad_blocks, spots)
+    result = run_eviction_benchmark(
+        device,
+        capacity=30 * 10 * 2**20,
+        start=NOW,
+        watermark=0,
+    )
+    assert set(result) == {"lru", "schedule"}
+    assert result["lru"]["requests"] == result["schedule"]["requests"]
+    assert result["lru"]["requests"] > 7 * 16 * 3600 // 180
+    assert result["schedule"]["hit_rate"] >= result["lru"]["hit_rate"]
+    assert (
+        result["schedule"]["downloaded_mb"] <= result["lru"]["downloaded_mb"]
+    )
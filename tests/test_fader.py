@@ -0,0 +1,50 @@
+import threading
+import time
+
+from soundfleet_player.media_backends.fader import Fader
+
+
+def test_ramp_reaches_end_volume_on_time():
+    volumes = []
+    done = threading.Event()
+    fader = Fader()
+    t = time.monotonic()
+    fader.ramp("deck", volumes.append, 0, 100, 0.2, on_done=done.set)
+    assert done.wait(1)
+    elapsed = time.monotonic() - t
+    assert 0.2 <= elapsed < 0.3
+    assert volumes[-1] == 100
+    assert volumes == sorted(volumes)
+    assert len(volumes) > 5
+    assert not fader.is_ramping("deck")
+
+
+def test_ramp_is_replaced_and_cancelled():
+    volumes = []
+    done = threading.Event()
+    fader = Fader()
+    fader.ramp("deck", volumes.append, 100, 0, 10, on_done=done.set)
+    fader.ramp("deck", volumes.append, 50, 50, 0.05)
+    time.sleep(0.1)
+    assert volumes[-1] == 50
+    assert not done.is_set()
+
+    fader.ramp("deck", volumes.append, 0, 100, 0.05, on_done=done.set)
+    fader.cancel("deck")
+    time.sleep(0.1)
+    assert not done.is_set()
+
+
+def test_ramp_is_retargeted_on_time():
+    volumes = []
+    done = threading.Event()
+    fader = Fader()
+    assert not fader.retarget("deck", 50)
+    t = time.monotonic()
+    fader.ramp("deck", volumes.append, 0, 100, 0.2, on_done=done.set)
+    time.sleep(0.1)
+    assert fader.retarget("deck", 50)
+    assert done.wait(1)
+    assert 0.2 <= time.monotonic() - t < 0.3
+    assert volumes[-1] == 50
+    assert max(volumes) <= 60
@@ -0,0 +1,74 @@
+import os
+import signal
+import threading
+import time
+
+from unittest import mock
+
+from soundfleet_player.media_backends.isolated import MediaBackend
+
+
+def get_backend():
+    return MediaBackend(module="soundfleet_player.media_backends.dummy")
+
+
+def test_calls_and_events_are_passed_to_child():
+    events = []
+    finished = threading.Event()
+
+    def callback(name, track):
+        events.append((name, track))
+        if name == "END_REACHED":
+            finished.set()
+
+    backend = get_backend()
+    backend.set_event_callback(callback)
+    track = {"id": 1, "file": "1.ogg", "length": 0.1}
+    backend.play(track)
+    assert backend.is_playing()
+    assert finished.wait(5)
+    assert events == [("PLAYING", track), ("END_REACHED", track)]
+    assert not backend.is_playing()
+    backend.close()
+
+
+@mock.patch(
+    "soundfleet_player.media_backends.isolated.MediaBackend.CALL_TIMEOUT", 0.2
+)
+def test_hung_child_is_replaced_with_standby():
+    events = []
+    backend = get_backend()
+    backend.set_event_callback(lambda *args: events.append(args))
+    backend._standby.wait_ready(30)
+    track = {"id": 1, "file": "1.ogg", "length": 10}
+    backend.set_volume(50)
+    backend.play(track)
+    hung_pid = backend._active.pid
+    os.kill(hung_pid, signal.SIGSTOP)
+
+    t = time.monotonic()
+    assert not backend.is_playing()
+    # watchdog timeout plus switch to ready standby
+    assert time.monotonic() - t < 0.5
+    assert backend.restarts == 1
+    assert backend._active.pid != hung_pid
+    assert events[-1] == ("ERROR", track)
+    assert backend._call("get_duration") is None
+    backend.play(track)
+    assert backend.is_playing()
+    backend.close()
+
+
+def test_crashed_child_is_replaced():
+    backend = get_backend()
+    backend._standby.wait_ready(30)
+    crashed_pid = backend._active.pid
+    os.kill(crashed_pid, signal.SIGKILL)
+    deadline = time.monotonic() + 5
+    while backend.restarts == 0 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert backend.restarts == 1
+    assert backend._active.pid != crashed_pid
+    backend.play({"id": 1, "file": "1.ogg", "length": 10})
+    assert backend.is_playing()
+    backend.close()
@@ -0,0 +1,88 @@
+import pytest
+import time
+
+from unittest import mock
+
+from soundfleet_player.benchmark import run_benchmark, run_sync_benchmark
+from soundfleet_player.latency import (
+    Histogram,
+    LatencyTracker,
+    SharedClock,
+)
+from .utils import is_redis_running
+
+
+def test_histogram_percentiles():
+    histogram = Histogram()
+    for ms in range(1, 101):
+        histogram.observe(ms)
+    summary = histogram.summary()
+    assert summary["count"] == 100
+    assert summary["mean"] == 50.5
+    assert summary["max"] == 100
+    # estimates are upper bounds of buckets
+    assert 50 <= summary["p50"] <= 50 * 1.19
+    assert 95 <= summary["p95"] <= 100
+    assert 99 <= summary["p99"] <= 100
+
+
+def test_histogram_is_exported_and_loaded():
+    histogram = Histogram()
+    for ms in (0.05, 3, 250, 10**6):
+        histogram.observe(ms)
+    loaded = Histogram.from_dict(histogram.to_dict())
+    assert loaded.counts == histogram.counts
+    assert loaded.summary() == histogram.summary()
+    assert Histogram().summary()["p50"] is None
+
+
+@mock.patch("soundfleet_player.latency.LatencyCache")
+def test_latency_tracker_stores_histograms_on_flush(cache):
+    cache.return_value.get.return_value = {}
+    tracker = LatencyTracker("test")
+    for _ in range(100):
+        tracker.observe("signal_transit", 0.001)
+    assert not cache.return_value.set.called
+    tracker.flush()
+    tracker.flush()
+    assert cache.return_value.set.call_count == 1
+    (histograms,) = cache.return_value.set.call_args.args
+    assert histograms["signal_transit"]["count"] == 100
+
+
+@pytest.mark.skipif(
+    not is_redis_running(host="redis"), reason="Redis is not running"
+)
+def test_benchmark_measures_transitions():
+    summary = run_benchmark(transitions=5, track_length=0.01)
+    assert summary["backend_start"]["count"] == 6
+    assert summary["transition_gap"]["count"] == 5
+    assert summary["signal_transit"]["count"] == 6
+    assert summary["transition_gap"]["p99"] < 1000
+
+
+def test_shared_clock_offset():
+    redis = mock.Mock()
+
+    def server_time():
+        server = time.time() + 100.25
+        return int(server), int(server % 1 * 10**6)
+
+    redis.time.side_effect = server_time
+    clock = SharedClock(redis)
+    assert abs(clock.now() - time.time() - 100.25) < 0.01
+    assert redis.time.call_count == SharedClock.SAMPLES
+    # offset is reused until resync interval passes
+    clock.now()
+    assert redis.time.call_count == SharedClock.SAMPLES
+    assert abs(clock.from_local(1000) - 1100.25) < 0.01
+
+
+@pytest.mark.skipif(
+    not is_redis_running(host="redis"), reason="Redis is not running"
+)
+def test_sync_benchmark_measures_skew():
+    summary = run_sync_benchmark(players=3, starts=3, delay=0.1)
+    assert summary["start_skew"]["count"] == 9
+    assert summary["start_skew"]["max"] < 50
+    assert summary["max_spread_ms"] < 50
@@ -4,6 +4,7 @@ import pytest
 import pytz
 import time
 
+from concurrent.futures import Future
 from unittest import mock
 
 from soundfleet_player.cache import MusicBlocksCache, AdBlocksCache
@@ -105,6 +106,26 @@ def test_download_and_ack(download, publish, device):
     assert publish.call_count == 2
 
 
+@pytest.mark.skipif(
+    not is_redis_running(host="redis"), reason="Redis is not running"
+)
+@mock.patch("soundfleet_player.utils.redis.StrictRedis.publish")
+@mock.patch("soundfleet_player.noise_generator.AudioTrackStorage.download")
+def test_download_finished_after_cancel_is_not_acked(
+    download, publish, device
+):
+    generator = MusicBlockBasedGenerator(device)
+
+    def cancel_during_download(track):
+        generator.cancel()
+        return track
+
+    download.side_effect = cancel_during_download
+    generator._download_and_ack({"id": 1})
+    assert download.called
+    assert not publish.called
+
+
 @pytest.mark.skipif(
     not is_redis_running(host="redis"), reason="Redis is not running"
 )
@@ -225,7 +246,7 @@ def test_draw_music_performance(notify, download, device):
     ],
 )
 @mock.patch(
-    "soundfleet_player.noise_generator.AdBlockBasedGenerator._download_and_ack"
+    "soundfleet_player.noise_generator.AdBlockBasedGenerator._download_and_ack_many"  # noqa: E501
 )
 @mock.patch(
     "soundfleet_player.noise_generator.AdBlockBasedGenerator._notify_finished"
@@ -253,7 +274,7 @@ def test_draw_ads(notify, download, blocks, time, download_called, device):
     ],
 )
 @mock.patch(
-    "soundfleet_player.noise_generator.AdBlockBasedGenerator._download_and_ack"
+    "soundfleet_player.noise_generator.AdBlockBasedGenerator._download_and_ack_many"  # noqa: E501
 )
 @mock.patch(
     "soundfleet_player.noise_generator.AdBlockBasedGenerator._notify_finished"
@@ -288,8 +309,8 @@ def test_draw_ads_are_called_with_correct_interval(
     not is_redis_running(host="redis"), reason="Redis is not running"
 )
 @mock.patch("soundfleet_player.utils.redis.StrictRedis.publish")
-@mock.patch("soundfleet_player.noise_generator.AudioTrackStorage.download")
-def test_download_and_ack(download, publish, device):
+@mock.patch("soundfleet_player.noise_generator.AudioTrackStorage.download_many")
+def test_download_and_ack_many(download, publish, device):
     class MyPublish:
         def __init__(self):
             self.publish_values = iter([0, 1])
@@ -297,11 +318,13 @@ def test_download_and_ack(download, publish, device):
         def __call__(self, *args, **kwargs):
             return next(self.publish_values)
 
-    download.return_value = {"id": 1}
+    future = Future()
+    future.set_result({"id": 1})
+    download.return_value = [future]
     publish.side_effect = MyPublish()
 
     generator = AdBlockBasedGenerator(device)
-    generator._download_and_ack({"id": 1})
+    generator._download_and_ack_many([{"id": 1}])
     assert download.called
     assert publish.call_count == 2
 
@@ -329,7 +352,7 @@ def test_notify_finished(publish, device):
     not is_redis_running(host="redis"), reason="Redis is not running"
 )
 @mock.patch(
-    "soundfleet_player.noise_generator.AdBlockBasedGenerator._download_and_ack"
+    "soundfleet_player.noise_generator.AdBlockBasedGenerator._download_and_ack_many"  # noqa: E501
 )
 @mock.patch(
     "soundfleet_player.noise_generator.AdBlockBasedGenerator._notify_finished"
@@ -0,0 +1,105 @@
+import json
+import os
+
+from unittest import mock
+
+from soundfleet_player.outbox import Outbox
+
+
+@mock.patch("soundfleet_player.outbox.client.make_request")
+def test_events_are_uploaded_in_order(make_request, tmp_path):
+    outbox = Outbox(str(tmp_path), "http://127.0.0.1/ack-play/")
+    for i in range(3):
+        outbox.append({"id": i})
+    assert outbox.upload_pending()
+    assert [c.kwargs["data"] for c in make_request.call_args_list] == [
+        {"id": 0},
+        {"id": 1},
+        {"id": 2},
+    ]
+    make_request.reset_mock()
+    assert outbox.upload_pending()
+    assert not make_request.called
+
+
+@mock.patch("soundfleet_player.outbox.client.make_request")
+def test_failed_events_are_kept_across_restart(make_request, tmp_path):
+    outbox = Outbox(str(tmp_path), "http://127.0.0.1/ack-play/")
+    for i in range(3):
+        outbox.append({"id": i})
+    make_request.side_effect = [mock.Mock(), None]
+    assert not outbox.upload_pending()
+
+    make_request.side_effect = None
+    make_request.reset_mock()
+    restarted = Outbox(str(tmp_path), "http://127.0.0.1/ack-play/")
+    assert restarted.upload_pending()
+    assert [c.kwargs["data"] for c in make_request.call_args_list] == [
+        {"id": 1},
+        {"id": 2},
+    ]
+
+
+@mock.patch("soundfleet_player.outbox.client.make_request")
+def test_uploaded_segments_are_removed(make_request, tmp_path):
+    outbox = Outbox(str(tmp_path), "http://127.0.0.1/ack-play/")
+    outbox.SEGMENT_SIZE = 1
+    for i in range(5):
+        outbox.append({"id": i})
+    assert len(os.listdir(tmp_path)) == 5
+    assert outbox.upload_pending()
+    assert make_request.call_count == 5
+    assert sorted(os.listdir(tmp_path)) == [
+        "0000000005.jsonl",
+        "offset.json",
+    ]
+
+
+@mock.patch("soundfleet_player.outbox.client.make_request")
+def test_rejected_events_are_not_retried(make_request, tmp_path):
+    outbox = Outbox(str(tmp_path), "http://127.0.0.1/ack-play/")
+    for i in range(3):
+        outbox.append({"id": i})
+    make_request.side_effect = [
+        mock.Mock(),
+        mock.Mock(ok=False, status_code=400),
+        mock.Mock(),
+    ]
+    assert outbox.upload_pending()
+    assert make_request.call_count == 3
+    with open(os.path.join(tmp_path, "rejected.jsonl")) as f:
+        assert [json.loads(line) for line in f] == [
+            {"status": 400, "event": {"id": 1}}
+        ]
+
+    make_request.side_effect = None
+    make_request.reset_mock()
+    outbox.append({"id": 3})
+    assert outbox.upload_pending()
+    assert [c.kwargs["data"] for c in make_request.call_args_list] == [
+        {"id": 3}
+    ]
+
+
+@mock.patch("soundfleet_player.outbox.client.make_request")
+def test_failed_upload_keeps_unsent_segments(make_request, tmp_path):
+    outbox = Outbox(str(tmp_path), "http://127.0.0.1/ack-play/")
+    outbox.SEGMENT_SIZE = 1
+    for i in range(6):
+        outbox.append({"id": i})
+    make_request.side_effect = [mock.Mock(), mock.Mock(), None]
+    assert not outbox.upload_pending()
+    assert len(os.listdir(tmp_path)) == 5
+
+    make_request.side_effect = None
+    make_request.reset_mock()
+    restarted = Outbox(str(tmp_path), "http://127.0.0.1/ack-play/")
+    restarted.SEGMENT_SIZE = 1
+    assert restarted.upload_pending()
+    assert [c.kwargs["data"] for c in make_request.call_args_list] == [
+        {"id": i} for i in range(2, 6)
+    ]
+    assert sorted(os.listdir(tmp_path)) == [
+        "0000000006.jsonl",
+        "offset.json",
+    ]
@@ -20,20 +20,27 @@ def get_test_track_path(name):
 @pytest.mark.skipif(
     not is_redis_running(host="redis"), reason="Redis is not running"
 )
+@mock.patch("soundfleet_player.player.Player._report_position")
 @mock.patch("soundfleet_player.player.Player._ack_play")
-def test_play_file(ack_play):
+def test_play_file(ack_play, report_position):
     track = {"id": 1, "file": "1.ogg", "length": 1}
 
     player = Player(MediaBackend())
     assert not player._is_playing()
     player._play(track)
     assert player._is_playing()
+    # play is acked once backend confirms start
+    assert not ack_play.called
+    player._on_media_event("PLAYING", track)
     assert ack_play.called
+    assert not player._is_starting()
     time.sleep(2)
     assert not player._is_playing()
 
 
+@mock.patch("soundfleet_player.player.Player.IDLE_INTERVAL", 0.1)
 @mock.patch("soundfleet_player.player.Player._should_run")
+@mock.patch("soundfleet_player.player.Player._ack_idle")
 @mock.patch("soundfleet_player.player.Player._ack_play")
 @mock.patch("soundfleet_player.player.Player._ack_ready")
 @mock.patch("soundfleet_player.player.Player._ack_finish")
@@ -41,6 +48,7 @@ def test_skip(
     ack_finish,
     ack_ready,
     ack_play,
+    ack_idle,
     should_run,
 ):
     track = {"id": 1, "file": "1.ogg", "length": 5}
@@ -59,3 +67,248 @@ def test_skip(
     threading.Timer(0.1, skip_track).start()
     player.run()
     assert ack_finish.called
+
+
+@pytest.mark.skipif(
+    not is_redis_running(host="redis"), reason="Redis is not running"
+)
+@mock.patch("soundfleet_player.player.Player._should_run")
+@mock.patch("soundfleet_player.player.Player._ack_ready")
+@mock.patch("soundfleet_player.player.Player._ack_finish")
+def test_end_of_track_is_signalled_by_backend(
+    ack_finish, ack_ready, should_run
+):
+    track = {"id": 1, "file": "1.ogg", "length": 0.1}
+    should_run.side_effect = lambda: not ack_finish.called
+
+    player = Player(MediaBackend())
+    player._current_track = track
+    player._media_backend.play(track)
+    t = time.monotonic()
+    player.run()
+    # player doesn't wait for idle check to notice end of track
+    assert time.monotonic() - t < player.IDLE_INTERVAL / 2
+    assert ack_finish.called
+
+
+@pytest.mark.skipif(
+    not is_redis_running(host="redis"), reason="Redis is not running"
+)
+@mock.patch("soundfleet_player.player.Player._ack_finish")
+def test_media_event_of_replaced_track_is_ignored(ack_finish):
+    player = Player(MediaBackend())
+    player._current_track = {"id": 2, "file": "2.ogg", "length": 1}
+    player._on_media_event("END_REACHED", {"id": 1, "file": "1.ogg"})
+    assert not ack_finish.called
+    player._on_media_event("END_REACHED", player._current_track)
+    assert ack_finish.called
+
+
+@pytest.mark.skipif(
+    not is_redis_running(host="redis"), reason="Redis is not running"
+)
+@mock.patch("soundfleet_player.player.Player.PLAY_TIMEOUT", 0.05)
+@mock.patch("soundfleet_player.player.Player._ack_failed")
+@mock.patch("soundfleet_player.player.Player._ack_play")
+def test_start_timeout_is_signalled(ack_play, ack_failed):
+    track = {"id": 1, "file": "1.ogg", "length": 1}
+    backend = mock.Mock()
+    backend.is_playing.return_value = False
+
+    player = Player(backend)
+    player._play(track)
+    # loop keeps handling signals while track is starting
+    assert 0 < player._get_timeout(time.monotonic() + 10) <= 0.05
+    player._check_start_timeout()
+    assert not ack_failed.called
+    time.sleep(0.06)
+    player._check_start_timeout()
+    assert ack_failed.called
+    assert backend.stop.called
+    assert not ack_play.called
+
+
+@pytest.mark.skipif(
+    not is_redis_running(host="redis"), reason="Redis is not running"
+)
+@mock.patch("soundfleet_player.player.Player._ack_finish")
+def test_preloaded_track_starts_after_current_one(ack_finish):
+    current = {"id": 1, "file": "1.ogg", "length": 5}
+    preloaded = {"id": 2, "file": "2.ogg", "length": 5}
+    player = Player(MediaBackend())
+    player._play(current)
+    player._on_preload(preloaded)
+    player._on_media_event("END_REACHED", current)
+    assert ack_finish.called
+    assert player._current_track == preloaded
+    assert player._is_starting()
+    player._media_backend.stop()
+
+
+@pytest.mark.skipif(
+    not is_redis_running(host="redis"), reason="Redis is not running"
+)
+@mock.patch("soundfleet_player.player.Player._ack_finish")
+def test_play_drops_preloaded_track(ack_finish):
+    current = {"id": 1, "file": "1.ogg", "length": 5}
+    preloaded = {"id": 2, "file": "2.ogg", "length": 5}
+    ad = {"id": 3, "file": "3.ogg", "length": 5}
+    player = Player(MediaBackend())
+    player._play(current)
+    player._on_preload(preloaded, time.time() + 5)
+    player._on_play(ad)
+    assert player._next_track is None
+    assert player._next_start_at is None
+    # scheduler plays preloaded track later
+    player._play_next()
+    assert player._current_track == ad
+    player._media_backend.stop()
+
+
+@pytest.mark.skipif(
+    not is_redis_running(host="redis"), reason="Redis is not running"
+)
+@mock.patch("soundfleet_player.player.Player._send_scheduler_signal")
+def test_position_is_reported(send_scheduler_signal):
+    track = {"id": 1, "file": "1.ogg", "length": 5}
+    player = Player(MediaBackend())
+    player._play(track)
+    player._report_position()
+    name, (track_id, position, duration) = send_scheduler_signal.call_args[0]
+    assert name == "TRACK_POSITION"
+    assert track_id == 1
+    assert 0 <= position < 1
+    assert duration == 5
+    assert 4 < player._get_timeout(time.monotonic() + 10) <= 5
+    player._media_backend.stop()
+
+
+@pytest.mark.skipif(
+    not is_redis_running(host="redis"), reason="Redis is not running"
+)
+@mock.patch("soundfleet_player.player.Player._send_scheduler_signal")
+def test_synchronized_start(send_scheduler_signal):
+    track = {"id": 1, "file": "1.ogg", "length": 5}
+    player = Player(MediaBackend())
+    start_at = player._clock.now() + 0.1
+    player._on_play(track, start_at)
+    # track is loaded, not started
+    assert not player._is_playing()
+    player._check_idle()
+    assert not send_scheduler_signal.called
+    timeout = player._get_timeout(time.monotonic() + 10)
+    assert timeout <= 0.1 - Player.SYNC_GUARD
+    time.sleep(timeout)
+    player._check_deadlines()
+    assert player._is_playing()
+    player._on_media_event("PLAYING", track)
+    signals = {
+        call[0][0]: call[0][1] for call in send_scheduler_signal.call_args_list
+    }
+    track_id, skew = signals["START_SKEW"]
+    assert track_id == 1
+    assert abs(skew) < 0.05
+    player._media_backend.stop()
+
+
+@pytest.mark.skipif(
+    not is_redis_running(host="redis"), reason="Redis is not running"
+)
+def test_follower_reports_only_skew():
+    player = Player(MediaBackend())
+    player._follower = True
+    with mock.patch.object(player, "_redis") as redis:
+        player._ack_finish()
+        assert not redis.publish.called
+        player._send_scheduler_signal("START_SKEW", [1, 0.001])
+        assert redis.publish.called
+
+
+@pytest.mark.skipif(
+    not is_redis_running(host="redis"), reason="Redis is not running"
+)
+@mock.patch("soundfleet_player.player.Player._send_scheduler_signal")
+def test_spot_preempts_current_track(send_scheduler_signal):
+    current = {"id": 1, "file": "1.ogg", "length": 5}
+    preloaded = {"id": 2, "file": "2.ogg", "length": 5}
+    spot = {"id": 3, "file": "3.ogg", "length": 5}
+    player = Player(MediaBackend())
+    player._play(current)
+    player._on_preload(preloaded)
+    player._on_spot(spot, player._clock.now() + 0.1, "preempt")
+    timeout = player._get_timeout(time.monotonic() + 10)
+    assert timeout <= 0.1 - Player.SYNC_GUARD
+    time.sleep(timeout)
+    player._check_deadlines()
+    assert player._current_track == spot
+    # preloaded track is dropped, scheduler picks track after spot
+    assert player._next_track is None
+    player._on_media_event("PLAYING", spot)
+    signals = {
+        call[0][0]: call[0][1] for call in send_scheduler_signal.call_args_list
+    }
+    assert signals["SPOT_START"] == [spot, current]
+    track_id, error = signals["SPOT_STARTED"]
+    assert track_id == 3
+    assert abs(error) < 0.05
+    player._media_backend.stop()
+
+
+@pytest.mark.skipif(
+    not is_redis_running(host="redis"), reason="Redis is not running"
+)
+@mock.patch("soundfleet_player.player.Player._send_scheduler_signal")
+def test_spot_follows_current_track(send_scheduler_signal):
+    current = {"id": 1, "file": "1.ogg", "length": 5}
+    spot = {"id": 3, "file": "3.ogg", "length": 5}
+    player = Player(MediaBackend())
+    player._play(current)
+    player._on_spot(spot, player._clock.now(), "follow")
+    player._check_deadlines()
+    assert player._current_track == current
+    player._on_media_event("END_REACHED", current)
+    assert player._current_track == spot
+    send_scheduler_signal.assert_called_with("SPOT_START", [spot, current])
+    player._media_backend.stop()
+
+
+@pytest.mark.skipif(
+    not is_redis_running(host="redis"), reason="Redis is not running"
+)
+@mock.patch("soundfleet_player.player.Player._send_scheduler_signal")
+def test_lost_end_of_track_starts_spot_like_end_event(send_scheduler_signal):
+    current = {"id": 1, "file": "1.ogg", "length": 5}
+    spot = {"id": 3, "file": "3.ogg", "length": 5}
+    player = Player(MediaBackend())
+    player._play(current)
+    player._on_media_event("PLAYING", current)
+    player._on_spot(spot, player._clock.now(), "follow")
+    player._check_deadlines()
+    # end of track event is lost
+    player._media_backend.stop()
+    send_scheduler_signal.reset_mock()
+    player._check_idle()
+    assert player._current_track == spot
+    assert [c[0] for c in send_scheduler_signal.call_args_list] == [
+        ("SPOT_START", [spot, current])
+    ]
+    player._media_backend.stop()
+
+
+@pytest.mark.skipif(
+    not is_redis_running(host="redis"), reason="Redis is not running"
+)
+@mock.patch("soundfleet_player.player.Player._send_scheduler_signal")
+def test_late_preload_is_started(send_scheduler_signal):
+    current = {"id": 1, "file": "1.ogg", "length": 5}
+    preloaded = {"id": 2, "file": "2.ogg", "length": 5}
+    player = Player(MediaBackend())
+    player._play(current)
+    player._on_media_event("PLAYING", current)
+    player._current_track = None
+    # scheduler got TRACK_FINISHED after it sent PRELOAD
+    player._on_preload(preloaded)
+    assert player._current_track == preloaded
+    assert player._is_starting()
+    assert player._next_track is None
+    player._media_backend.stop()
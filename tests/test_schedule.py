@@ -0,0 +1,126 @@
+import datetime
+import pytest
+import pytz
+
+from soundfleet_player.schedule import ScheduleIndex, SpotSchedule
+
+
+def local(timezone, *args):
+    return timezone.localize(datetime.datetime(*args))
+
+
+@pytest.mark.parametrize(
+    ["time", "expected_id"],
+    [
+        ((2022, 1, 3, 7, 59, 59), None),
+        ((2022, 1, 3, 8, 0, 0), 1),
+        ((2022, 1, 3, 11, 59, 59), 1),
+        ((2022, 1, 3, 11, 59, 59, 500000), None),
+        ((2022, 1, 3, 12, 0, 0), None),
+        ((2022, 1, 3, 22, 0, 0), 2),
+        ((2022, 1, 4, 1, 30, 0), 2),
+        ((2022, 1, 4, 2, 0, 1), None),
+    ],
+)
+def test_get_block(time, expected_id):
+    schedule = ScheduleIndex(
+        [
+            {"id": 1, "start": "08:00:00", "end": "11:59:59"},
+            {"id": 2, "start": "22:00:00", "end": "02:00:00"},
+        ],
+        pytz.UTC,
+    )
+    block = schedule.get_block(local(pytz.UTC, *time))
+    assert (block or {}).get("id") == expected_id
+
+
+@pytest.mark.parametrize(
+    ["time", "expected_id"],
+    [
+        # monday
+        ((2022, 1, 3, 12, 0, 0), 2),
+        # tuesday
+        ((2022, 1, 4, 12, 0, 0), 1),
+        # specific date overrides weekday block
+        ((2022, 1, 10, 12, 0, 0), 3),
+        # cross midnight block of sunday continues on monday
+        ((2022, 1, 3, 1, 0, 0), 4),
+        ((2022, 1, 4, 1, 0, 0), 1),
+    ],
+)
+def test_get_block_from_calendar(time, expected_id):
+    schedule = ScheduleIndex(
+        [
+            {"id": 1, "start": "00:00:00", "end": "23:59:59"},
+            {"id": 2, "start": "08:00:00", "end": "16:00:00", "weekdays": [0]},
+            {
+                "id": 3,
+                "start": "08:00:00",
+                "end": "16:00:00",
+                "dates": ["2022-01-10"],
+            },
+            {"id": 4, "start": "23:00:00", "end": "02:00:00", "weekdays": [6]},
+        ],
+        pytz.UTC,
+    )
+    block = schedule.get_block(local(pytz.UTC, *time))
+    assert (block or {}).get("id") == expected_id
+
+
+def test_block_follows_wall_clock_over_dst_change():
+    tz = pytz.timezone("Europe/Warsaw")
+    schedule = ScheduleIndex(
+        [{"id": 1, "start": "03:00:00", "end": "04:00:00"}], tz
+    )
+    # clocks jump from 02:00 to 03:00 on 2022-03-27
+    assert schedule.get_block(local(tz, 2022, 3, 27, 3, 30)) is not None
+    utc_time = pytz.UTC.localize(datetime.datetime(2022, 3, 27, 1, 30))
+    assert schedule.get_block(utc_time) is not None
+    next_change = schedule.next_change(local(tz, 2022, 3, 27, 1, 30))
+    assert next_change == local(tz, 2022, 3, 27, 3, 0)
+
+
+def test_next_change():
+    schedule = ScheduleIndex(
+        [{"id": 1, "start": "08:00:00", "end": "11:59:59"}], pytz.UTC
+    )
+    assert schedule.next_change(
+        local(pytz.UTC, 2022, 1, 3, 6, 0)
+    ) == local(pytz.UTC, 2022, 1, 3, 8, 0)
+    assert schedule.next_change(
+        local(pytz.UTC, 2022, 1, 3, 13, 0)
+    ) == local(pytz.UTC, 2022, 1, 4, 0, 0)
+
+
+@pytest.mark.parametrize(
+    ["time", "expected"],
+    [
+        # monday
+        ((2022, 1, 3, 11, 59, 59), (1, (2022, 1, 3, 12, 0, 0))),
+        # spot at exactly given time is already started
+        ((2022, 1, 3, 12, 0, 0), (2, (2022, 1, 3, 18, 30, 0))),
+        ((2022, 1, 3, 12, 0, 0, 1), (2, (2022, 1, 3, 18, 30, 0))),
+        # weekend spot on saturday
+        ((2022, 1, 7, 19, 0, 0), (3, (2022, 1, 8, 9, 0, 0))),
+        ((2022, 1, 8, 9, 0, 0), (1, (2022, 1, 8, 12, 0, 0))),
+    ],
+)
+def test_next_spot(time, expected):
+    schedule = SpotSchedule(
+        [
+            {"id": 2, "time": "18:30:00", "weekdays": [0, 1, 2, 3, 4]},
+            {"id": 1, "time": "12:00:00"},
+            {"id": 3, "time": "09:00:00", "weekdays": [5, 6]},
+        ],
+        pytz.UTC,
+    )
+    at, spot = schedule.next_spot(local(pytz.UTC, *time))
+    expected_id, expected_time = expected
+    assert spot["id"] == expected_id
+    assert at == local(pytz.UTC, *expected_time)
+
+
+def test_next_spot_without_spots():
+    assert SpotSchedule([], pytz.UTC).next_spot(
+        local(pytz.UTC, 2022, 1, 3)
+    ) is None
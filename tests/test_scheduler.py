@@ -141,21 +141,35 @@ def test_on_player_idle(device, should_run, get_msg):
 
 
 @pytest.mark.parametrize(
-    ["loops", "expected_calls"],
+    ["signals", "expected_calls"],
     [
-        (1, 0),
-        (9, 0),
-        (10, 2),
-        (11, 2),
-        (19, 2),
-        (20, 4),
+        ([None], 0),
+        ([None] * 20, 0),
+        ([("DEVICE_SYNC", [])], 2),
+        ([("DEVICE_SYNC", [])] + [None] * 20, 2),
     ],
 )
-@mock.patch("soundfleet_player.scheduler.threading.Thread.start")
+@mock.patch("soundfleet_player.scheduler.client.make_request")
+@mock.patch("soundfleet_player.scheduler.Scheduler._skip_track")
+@mock.patch("soundfleet_player.scheduler.Scheduler._set_player_volume")
+@mock.patch("soundfleet_player.scheduler.AdBlockBasedGenerator")
+@mock.patch("soundfleet_player.scheduler.MusicBlockBasedGenerator")
+@mock.patch("soundfleet_player.scheduler.WorkerPool.submit")
+@mock.patch("soundfleet_player.scheduler.get_and_decode_redis_message")
 @mock.patch("soundfleet_player.scheduler.Scheduler._should_run")
 @mock.patch("soundfleet_player.scheduler.Device")
-def test_generators_are_started_every_1_second(
-    device, should_run, thread_start, loops, expected_calls
+def test_generators_are_started_only_when_due(
+    device,
+    should_run,
+    get_msg,
+    submit,
+    _,
+    ads,
+    set_volume,
+    skip_track,
+    make_request,
+    signals,
+    expected_calls,
 ):
     class MyDevice:
         @property
@@ -167,21 +181,48 @@ def test_generators_are_started_every_1_second(
             return "music_over_ads"
 
         @property
-        def playback_mode(self):
-            return "calendar"
+        def volume(self):
+            return 100
 
         def sync(self):
             pass
 
+        def invalidate(self):
+            pass
+
+    device.return_value = MyDevice()
+    ads.return_value.next_draw_time = None
+    should_run.side_effect = ExitAfter(len(signals))
+    signals = iter(signals)
+    get_msg.side_effect = lambda *args, **kwargs: next(signals, None)
+    scheduler = Scheduler()
+    scheduler.run()
+    assert submit.call_count == expected_calls
+
+
+@mock.patch("soundfleet_player.scheduler.get_and_decode_redis_message")
+@mock.patch("soundfleet_player.scheduler.Scheduler._should_run")
+@mock.patch("soundfleet_player.scheduler.Device")
+def test_wait_timeout_follows_nearest_timer(device, should_run, get_msg):
+    class MyDevice:
         @property
-        def stream(self):
-            return None
+        def timezone(self):
+            return pytz.UTC
+
+        @property
+        def playback_priority(self):
+            return "music_over_ads"
+
+        def sync(self):
+            pass
 
     device.return_value = MyDevice()
-    should_run.side_effect = ExitAfter(loops)
+    should_run.side_effect = ExitAfter(1)
+    get_msg.return_value = None
     scheduler = Scheduler()
+    scheduler._timers.schedule("test", 0.5, lambda: None)
     scheduler.run()
-    assert thread_start.call_count == expected_calls
+    assert 0 < get_msg.call_args.kwargs["timeout"] <= 0.5
 
 
 @mock.patch(
@@ -192,6 +233,7 @@ def test_generators_are_started_every_1_second(
 )
 @mock.patch("soundfleet_player.scheduler.Scheduler._run_generator")
 @mock.patch("soundfleet_player.scheduler.Scheduler._should_run")
+@mock.patch("soundfleet_player.scheduler.Scheduler.MAX_WAIT", 0.1)
 @mock.patch("soundfleet_player.scheduler.Device")
 def test_ads_and_music_generator_is_called_when_it_should(
     device, should_run, run_generator, draw_music, draw_ads
@@ -209,6 +251,9 @@ def test_ads_and_music_generator_is_called_when_it_should(
         def playback_mode(self):
             return "calendar"
 
+        def invalidate(self):
+            pass
+
         def sync(self):
             signal = json.dumps(("DEVICE_SYNC", []))
             r = get_redis_conn(host="redis")
@@ -221,8 +266,354 @@ def test_ads_and_music_generator_is_called_when_it_should(
 
     device.return_value = MyDevice()
     should_run.side_effect = ExitAfter(10)
-    run_generator.side_effect = lambda fn, *args: fn()
+    run_generator.side_effect = lambda fn, key: fn()
     scheduler = Scheduler()
     scheduler.run()
     assert draw_ads.called
     assert draw_music.called
+
+
+@mock.patch("soundfleet_player.scheduler.get_and_decode_redis_message")
+@mock.patch("soundfleet_player.scheduler.Scheduler._dispatch_signal")
+@mock.patch("soundfleet_player.scheduler.Scheduler._should_run")
+@mock.patch("soundfleet_player.scheduler.Device")
+def test_pending_signals_are_drained_with_control_signals_first(
+    device, should_run, dispatch, get_msg
+):
+    class MyDevice:
+        @property
+        def timezone(self):
+            return pytz.UTC
+
+        @property
+        def playback_priority(self):
+            return "music_over_ads"
+
+        def sync(self):
+            pass
+
+    device.return_value = MyDevice()
+    should_run.side_effect = ExitAfter(1)
+    get_msg.side_effect = [
+        ("AD_TRACK_DOWNLOADED", [{"id": 1}]),
+        ("AD_TRACK_DOWNLOADED", [{"id": 2}]),
+        ("TRACK_FINISHED", [{"id": 3}]),
+        None,
+    ]
+    scheduler = Scheduler()
+    scheduler.run()
+    assert [c.args[0][0] for c in dispatch.call_args_list] == [
+        "TRACK_FINISHED",
+        "AD_TRACK_DOWNLOADED",
+        "AD_TRACK_DOWNLOADED",
+    ]
+    assert scheduler._metrics.get()["dispatch_backlog"] == "3"
+
+
+@mock.patch("soundfleet_player.scheduler.Device")
+def test_tracks_of_replaced_generators_are_dropped(device):
+    scheduler = Scheduler()
+    scheduler._ads_generator = mock.Mock(id="new")
+    scheduler._music_generator = None
+    scheduler._dispatch_signal(("AD_TRACK_DOWNLOADED", [{"id": 1}, "old"]))
+    scheduler._dispatch_signal(("AD_TRACK_DOWNLOADED", [{"id": 2}, "new"]))
+    scheduler._dispatch_signal(("MUSIC_TRACK_DOWNLOADED", [{"id": 3}, "old"]))
+    assert scheduler._ads == [{"id": 2}]
+    assert scheduler._music == []
+
+
+@mock.patch("soundfleet_player.scheduler.Scheduler._ack_play")
+@mock.patch("soundfleet_player.scheduler.Device")
+def test_failed_track_is_not_acked(device, ack_play):
+    device.return_value = mock.Mock()
+    scheduler = Scheduler()
+    scheduler._current_track = {"id": 1}
+    scheduler._next_track_draw_time = "some_time"
+    scheduler._dispatch_signal(("TRACK_FAILED", [{"id": 1}]))
+    assert scheduler._current_track is None
+    assert scheduler._next_track_draw_time is None
+    assert not ack_play.called
+
+
+@mock.patch("soundfleet_player.scheduler.Scheduler._send_player_signal")
+@mock.patch("soundfleet_player.scheduler.Device")
+def test_next_track_is_preloaded(device, send_player_signal):
+    class MyDevice:
+        @property
+        def timezone(self):
+            return pytz.UTC
+
+    device.return_value = MyDevice()
+    current = {"id": 1, "track_type": "music", "length": 60}
+    preloaded = {"id": 2, "track_type": "music", "length": 60}
+    scheduler = Scheduler()
+    scheduler._player_ready = True
+    scheduler._current_track = current
+    scheduler._music = [preloaded]
+    scheduler._preload_next_track()
+    send_player_signal.assert_called_with("PRELOAD", [preloaded])
+    assert scheduler._music == []
+    # player starts preloaded track on its own
+    send_player_signal.reset_mock()
+    scheduler._dispatch_signal(("TRACK_FINISHED", [current]))
+    scheduler._schedule_music_over_ads()
+    assert scheduler._current_track == preloaded
+    assert not send_player_signal.called
+
+
+@mock.patch("soundfleet_player.scheduler.Scheduler._send_player_signal")
+@mock.patch("soundfleet_player.scheduler.Device")
+def test_interrupting_play_requeues_preloaded_track(
+    device, send_player_signal
+):
+    class MyDevice:
+        @property
+        def timezone(self):
+            return pytz.UTC
+
+    device.return_value = MyDevice()
+    current = {"id": 1, "track_type": "music", "length": 60}
+    preloaded = {"id": 2, "track_type": "music", "length": 60}
+    ad = {"id": 3, "track_type": "ad", "length": 30}
+    scheduler = Scheduler()
+    scheduler._player_ready = True
+    scheduler._current_track = current
+    scheduler._music = [preloaded]
+    scheduler._preload_next_track()
+    scheduler._ads = [ad]
+    scheduler._timers.schedule("preload", 10, scheduler._preload_next_track)
+    scheduler._schedule_ads_over_music()
+    send_player_signal.assert_called_with("PLAY", [ad])
+    assert scheduler._preloaded_track is None
+    assert not scheduler._timers.is_scheduled("preload")
+    assert scheduler._music == [preloaded]
+
+
+@mock.patch("soundfleet_player.scheduler.Scheduler._schedule_generators")
+@mock.patch("soundfleet_player.scheduler.Scheduler._ack_play")
+@mock.patch("soundfleet_player.scheduler.Device")
+def test_track_position_corrects_draw_time(
+    device, ack_play, schedule_generators
+):
+    class MyDevice:
+        @property
+        def timezone(self):
+            return pytz.UTC
+
+    device.return_value = MyDevice()
+    track = {"id": 1, "track_type": "music", "length": 180}
+    start = datetime.datetime(2022, 1, 1, 12, tzinfo=pytz.UTC)
+    scheduler = Scheduler()
+    scheduler._current_track = track
+    scheduler._next_track_draw_time = start + datetime.timedelta(seconds=180)
+    with freezegun.freeze_time(start):
+        scheduler._on_track_play(track)
+    with freezegun.freeze_time(start + datetime.timedelta(seconds=10)):
+        # track started late and is longer than declared
+        scheduler._dispatch_signal(("TRACK_POSITION", [1, 9.5, 190.5]))
+    assert scheduler._next_track_draw_time == start + datetime.timedelta(
+        seconds=191
+    )
+    assert schedule_generators.called
+
+    schedule_generators.reset_mock()
+    with freezegun.freeze_time(start + datetime.timedelta(seconds=15)):
+        scheduler._dispatch_signal(("TRACK_POSITION", [1, 14.5, 190.5]))
+    assert not schedule_generators.called
+
+
+@mock.patch("soundfleet_player.scheduler.Device")
+def test_music_is_drawn_for_projected_play_time(device):
+    class MyDevice:
+        @property
+        def timezone(self):
+            return pytz.UTC
+
+    device.return_value = MyDevice()
+    scheduler = Scheduler()
+    scheduler._music_buffer_length = 3
+    scheduler._music_generator = mock.Mock()
+    scheduler._next_track_draw_time = datetime.datetime(
+        2022, 1, 1, 12, tzinfo=pytz.UTC
+    )
+    scheduler._music = [
+        {"id": 1, "track_type": "music", "length": 60},
+        {"id": 2, "track_type": "music", "length": 60},
+    ]
+    scheduler._generate_music()
+    scheduler._music_generator.draw_and_download.assert_called_with(
+        datetime.datetime(2022, 1, 1, 12, 2, tzinfo=pytz.UTC)
+    )
+    scheduler._music.append({"id": 3, "track_type": "music", "length": 60})
+    scheduler._music_generator.reset_mock()
+    scheduler._generate_music()
+    assert not scheduler._music_generator.draw_and_download.called
+
+
+@mock.patch("soundfleet_player.scheduler.Device")
+def test_music_buffer_is_trimmed_to_schedule(device):
+    class MyDevice:
+        @property
+        def timezone(self):
+            return pytz.UTC
+
+    device.return_value = MyDevice()
+    scheduler = Scheduler()
+    scheduler._music_generator = mock.Mock()
+    scheduler._music_generator.is_track_scheduled.side_effect = (
+        lambda track, draw_time: track["id"] != 2
+    )
+    scheduler._music = [
+        {"id": 1, "track_type": "music", "length": 60},
+        {"id": 2, "track_type": "music", "length": 60},
+        {"id": 3, "track_type": "music", "length": 60},
+    ]
+    scheduler._trim_music()
+    assert scheduler._music == [{"id": 1, "track_type": "music", "length": 60}]
+
+
+@pytest.mark.skipif(
+    not is_redis_running(host="redis"), reason="Redis is not running"
+)
+@mock.patch("soundfleet_player.scheduler.Device")
+def test_state_is_restored_after_restart(device):
+    class MyDevice:
+        sync_generation = 7
+
+        @property
+        def timezone(self):
+            return pytz.UTC
+
+        @property
+        def playback_priority(self):
+            return "music_over_ads"
+
+        @property
+        def music_schedule(self):
+            return mock.Mock()
+
+        @property
+        def ad_schedule(self):
+            return mock.Mock()
+
+        @property
+        def spot_schedule(self):
+            return mock.Mock(**{"next_spot.return_value": None})
+
+    device.return_value = MyDevice()
+    next_block = datetime.datetime(2022, 1, 1, 12, tzinfo=pytz.UTC)
+    scheduler = Scheduler()
+    scheduler._state_cache.set({})
+    assert not scheduler._restore_state()
+
+    scheduler._generation = 7
+    scheduler._player_ready = True
+    scheduler._music = [{"id": 1, "track_type": "music", "length": 1}]
+    scheduler._current_track = {"id": 2, "track_type": "music", "length": 1}
+    scheduler._ads_generator = mock.Mock()
+    scheduler._ads_generator.get_state.return_value = {
+        "current_block_id": 1,
+        "next_block": next_block.isoformat(),
+    }
+    scheduler._music_generator = mock.Mock()
+    scheduler._music_generator.get_state.return_value = {"history": [1]}
+    scheduler._save_state()
+
+    restarted = Scheduler()
+    assert restarted._restore_state()
+    assert restarted._player_ready
+    assert restarted._music == scheduler._music
+    assert restarted._current_track == scheduler._current_track
+    assert restarted._ads_generator.next_draw_time == next_block
+    assert list(restarted._music_generator._history) == [1]
+
+    # in-place change of queue is saved too
+    scheduler._music.pop()
+    scheduler._save_state()
+    assert scheduler._state_cache.get()["music"] == []
+
+    # fresh player plays restored track right away
+    restarted._set_player_volume = mock.Mock()
+    restarted._dispatch_signal(("PLAYER_READY", []))
+    assert restarted._current_track is None
+    assert restarted._music[0] == scheduler._current_track
+
+    MyDevice.sync_generation = 8
+    assert not Scheduler()._restore_state()
+    scheduler._state_cache.set({})
+
+
+@mock.patch.dict(settings, {"SYNC_START_DELAY": 0.5})
+@mock.patch("soundfleet_player.scheduler.Scheduler._send_player_signal")
+@mock.patch("soundfleet_player.scheduler.Device")
+def test_play_carries_synchronized_start(device, send_player_signal):
+    scheduler = Scheduler()
+    scheduler._clock = mock.Mock()
+    scheduler._clock.now.return_value = 1000.0
+    track = {"id": 1, "track_type": "music", "length": 5}
+    scheduler._play_track(track)
+    send_player_signal.assert_called_with("PLAY", [track, 1000.5])
+
+    scheduler._on_start_skew(1, -0.004)
+    assert scheduler._latency.summary()["start_skew"]["count"] >= 1
+
+
+@mock.patch("soundfleet_player.scheduler.Device")
+def test_latency_is_flushed_by_timer_or_on_request(device):
+    scheduler = Scheduler()
+    scheduler._latency = mock.Mock(dirty=True, FLUSH_INTERVAL=10)
+    scheduler._schedule_latency_flush()
+    scheduler._schedule_latency_flush()
+    assert scheduler._timers.is_scheduled("latency")
+    assert not scheduler._latency.flush.called
+    scheduler._dispatch_signal(("FLUSH_LATENCY", []))
+    assert scheduler._latency.flush.call_count == 1
+    assert not scheduler._timers.is_scheduled("latency")
+
+
+@mock.patch.dict(settings, {"SPOT_DOWNLOAD_AHEAD": 300, "SPOT_ARM_AHEAD": 10})
+@mock.patch("soundfleet_player.scheduler.Scheduler._send_player_signal")
+@mock.patch("soundfleet_player.scheduler.Scheduler._run_generator")
+@mock.patch("soundfleet_player.scheduler.Device")
+def test_spot_is_downloaded_and_armed(device, run_generator, send):
+    spot = {"id": 1, "time": "12:00:00", "track": 5, "priority": "preempt"}
+    at = datetime.datetime(2022, 1, 3, 12, tzinfo=pytz.UTC)
+    device.return_value.timezone = pytz.UTC
+    device.return_value.spot_schedule.next_spot.side_effect = [
+        (at, spot),
+        (at + datetime.timedelta(days=1), spot),
+    ]
+    track = {"id": 5, "track_type": "ad", "length": 30}
+    scheduler = Scheduler()
+    scheduler._clock = mock.Mock()
+    scheduler._clock.now.return_value = 1000.0
+    with freezegun.freeze_time("2022-01-03 11:50:00"):
+        scheduler._schedule_spot()
+        assert scheduler._timers.timeout() == 300
+    with freezegun.freeze_time("2022-01-03 11:55:00"):
+        scheduler._timers.run_due()
+        assert run_generator.call_args[0][1] == "spot"
+        scheduler._on_spot_track_download(1, track)
+        assert scheduler._timers.timeout() == 290
+    with freezegun.freeze_time("2022-01-03 11:59:50"):
+        scheduler._timers.run_due()
+    send.assert_called_with("SPOT", [track, 1010.0, "preempt"])
+    # next occurrence is looked up after armed one
+    assert scheduler._spot["at"] == at + datetime.timedelta(days=1)
+
+
+@mock.patch("soundfleet_player.scheduler.Device")
+def test_spot_start_replaces_preloaded_track(device):
+    device.return_value.timezone = pytz.UTC
+    scheduler = Scheduler()
+    current = {"id": 1, "track_type": "music", "length": 100}
+    spot = {"id": 5, "track_type": "ad", "length": 30}
+    scheduler._current_track = current
+    scheduler._preloaded_track = {"id": 2, "track_type": "music"}
+    scheduler._timers.schedule("preload", 10, mock.Mock())
+    scheduler._on_spot_start(spot, current)
+    assert scheduler._current_track == spot
+    assert scheduler._preloaded_track is None
+    assert not scheduler._timers.is_scheduled("preload")
+    # preloaded track is played after spot
+    assert scheduler._music == [{"id": 2, "track_type": "music"}]
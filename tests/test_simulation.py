@@ -0,0 +1,70 @@
+import datetime
+import pytz
+
+from soundfleet_player.simulation import Simulation
+
+
+def get_state():
+    music = [
+        {
+            "id": i,
+            "file": f"{i}.ogg",
+            "track_type": "music",
+            "length": 180,
+            "size": 1,
+            "url": "",
+        }
+        for i in range(1, 21)
+    ]
+    ads = [
+        {
+            "id": i,
+            "file": f"{i}.ogg",
+            "track_type": "ad",
+            "length": 30,
+            "size": 1,
+            "url": "",
+        }
+        for i in range(100, 103)
+    ]
+    return {
+        "device": {
+            "id": "1",
+            "timezone_name": "Europe/Warsaw",
+            "volume": 100,
+            "playback_priority": "music_over_ads",
+        },
+        "audio_tracks": music + ads,
+        "music_blocks": [
+            {
+                "id": 1,
+                "start": "08:00:00",
+                "end": "20:00:00",
+                "tracks": [t["id"] for t in music],
+            }
+        ],
+        "ad_blocks": [
+            {
+                "id": 1,
+                "start": "08:00:00",
+                "end": "20:00:00",
+                "playback_interval": 15,
+                "ads_count_per_block": 2,
+                "play_all_ads": False,
+                "tracks": [t["id"] for t in ads],
+            }
+        ],
+    }
+
+
+def test_simulate_broadcast_day():
+    tz = pytz.timezone("Europe/Warsaw")
+    start = tz.localize(datetime.datetime(2022, 6, 1))
+    report = Simulation(get_state(), start, datetime.timedelta(days=1)).run()
+    assert report["simulated_seconds"] == 24 * 60 * 60
+    # 12h of music with 3 minute tracks and ad breaks
+    assert 200 < report["music_tracks"] <= 241
+    assert report["ad_breaks"] > 30
+    assert report["dead_air_seconds"] == 0
+    assert report["ad_interval_max_error_seconds"] < 240
+    assert report["elapsed_seconds"] < 30
@@ -1,9 +1,19 @@
+import errno
+import hashlib
+import os
 import pytest
+import threading
 import time
 
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from unittest import mock
 
-from soundfleet_player.storage import AudioTrackStorage
+from soundfleet_player.conf import settings
+from soundfleet_player.storage import (
+    AudioTrackStorage,
+    DownloadFailed,
+    PARTIAL_SUFFIX,
+)
 
 from .utils import is_redis_running
 
@@ -11,83 +21,461 @@ from .utils import is_redis_running
 @pytest.mark.skipif(
     not is_redis_running(host="redis"), reason="Redis is not running"
 )
-@mock.patch("soundfleet_player.storage.shutil.copyfileobj")
-@mock.patch("soundfleet_player.storage.requests.get")
+@mock.patch("soundfleet_player.storage.requests.Session.get")
 @mock.patch("soundfleet_player.storage.AudioTrackStorage.can_download")
 @mock.patch("soundfleet_player.storage.AudioTrackStorage.track_file_exists")
 def test_download_track_if_it_does_not_exist(
-    track_file_exists, can_download, get, _
+    track_file_exists, can_download, get
 ):
     can_download.return_value = True
     track_file_exists.return_value = False
     track = {"url": "", "file": "test.ogg"}
-    AudioTrackStorage().download(track)
+    storage = AudioTrackStorage()
+    track = storage.download(track)
     assert get.called
+    assert track["uri"] == "file://{}".format(storage._get_path(track))
+    storage.remove_tracks(track)
+    storage._download_lru_cache.remove(os.path.basename(track["uri"]))
 
 
 @pytest.mark.skipif(
     not is_redis_running(host="redis"), reason="Redis is not running"
 )
-@mock.patch("soundfleet_player.storage.requests.get")
+@mock.patch("soundfleet_player.storage.requests.Session.get")
 @mock.patch("soundfleet_player.storage.AudioTrackStorage.can_download")
 @mock.patch("soundfleet_player.storage.AudioTrackStorage.track_file_exists")
 def test_download_track_if_it_exist(track_file_exists, can_download, get):
     can_download.return_value = True
     track_file_exists.return_value = True
-    track = {"url": "", "file": "test.ogg"}
-    AudioTrackStorage().download(track)
+    track = {"url": "", "file": "test.ogg", "sha256": "e3b0c442"}
+    storage = AudioTrackStorage()
+    storage.download(track)
     assert not get.called
+    storage.remove_tracks(track)
+    storage._download_lru_cache.remove(track["sha256"])
+
+
+def mock_disk_usage(disk_usage, directory, capacity):
+    """
+    Free space of disk of capacity taken by files of directory only.
+    """
+
+    def usage(path):
+        used = sum(
+            os.path.getsize(os.path.join(directory, fname))
+            for fname in os.listdir(directory)
+        )
+        return mock.Mock(free=capacity - used)
+
+    disk_usage.side_effect = usage
+
+
+def create_files(storage, directory, *fnames, size=2**20):
+    for fname in fnames:
+        with open(os.path.join(directory, fname), "wb") as f:
+            f.truncate(size)
+        storage._download_lru_cache.touch(fname)
 
 
 @pytest.mark.skipif(
     not is_redis_running(host="redis"), reason="Redis is not running"
 )
-@mock.patch("soundfleet_player.storage.requests.get")
-@mock.patch("soundfleet_player.storage.shutil.copyfileobj")
-@mock.patch("soundfleet_player.storage.AudioTrackStorage._delete_file")
+@mock.patch("soundfleet_player.storage.AudioTrackStorage._fetch")
 @mock.patch("soundfleet_player.storage.shutil.disk_usage")
-@mock.patch("soundfleet_player.storage.AudioTrackStorage.track_file_exists")
-def test_storage_file_rotation(track_file_exists, disk_usage, delete_file, *_):
-    class MyDiskUsage:
-        _free = 0
+@mock.patch.dict(settings, {"CACHE_FREE_WATERMARK": 2**21})
+def test_storage_file_rotation(disk_usage, fetch, tmp_path):
+    track = {"url": "", "file": "test.ogg", "size": 2**20}
+    fetch.return_value = str(tmp_path / "test.ogg")
+    with mock.patch.object(AudioTrackStorage, "_download_dir", str(tmp_path)):
+        storage = AudioTrackStorage()
+        lru_cache = storage._download_lru_cache
+        lru_cache._redis.delete(lru_cache.get_key())
+        create_files(storage, tmp_path, "1.ogg", "2.ogg", "3.ogg", "4.ogg")
+        # disk is full, there is just safety buffer
+        mock_disk_usage(
+            disk_usage, tmp_path, AudioTrackStorage._safe_buffer + 2**22
+        )
+        storage.download(track)
+        # space of track and watermark is freed at once
+        assert sorted(os.listdir(tmp_path)) == ["4.ogg"]
+        assert [
+            fname for fname, _, _ in storage._download_lru_cache.entries()
+        ] == ["4.ogg", "test.ogg"]
+        storage._download_lru_cache.remove("4.ogg", "test.ogg")
 
-        @property
-        def free(self):
-            self._free += 2**20
-            return self._free
 
-    disk_usage.return_value = MyDiskUsage()
-    track_file_exists.return_value = False
+@pytest.mark.skipif(
+    not is_redis_running(host="redis"), reason="Redis is not running"
+)
+@mock.patch("soundfleet_player.storage.AudioTrackStorage._fetch")
+@mock.patch("soundfleet_player.storage.shutil.disk_usage")
+@mock.patch.dict(settings, {"CACHE_FREE_WATERMARK": 0})
+def test_file_rotation_removes_least_used_file(disk_usage, fetch, tmp_path):
     track = {"url": "", "file": "test.ogg", "size": 2**20}
-    AudioTrackStorage().download(track)
-    assert delete_file.call_count == 1024
+    fetch.return_value = str(tmp_path / "test.ogg")
+    with mock.patch.object(AudioTrackStorage, "_download_dir", str(tmp_path)):
+        storage = AudioTrackStorage()
+        lru_cache = storage._download_lru_cache
+        lru_cache._redis.delete(lru_cache.get_key())
+        create_files(storage, tmp_path, "to_delete.ogg", "used.ogg")
+        mock_disk_usage(
+            disk_usage, tmp_path, AudioTrackStorage._safe_buffer + 2**21
+        )
+        storage.download(track)
+        assert os.listdir(tmp_path) == ["used.ogg"]
+        storage._download_lru_cache.remove("used.ogg", "test.ogg")
 
 
 @pytest.mark.skipif(
     not is_redis_running(host="redis"), reason="Redis is not running"
 )
-@mock.patch("soundfleet_player.storage.requests.get")
-@mock.patch("soundfleet_player.storage.shutil.copyfileobj")
-@mock.patch("soundfleet_player.storage.AudioTrackStorage._delete_file")
+@mock.patch("soundfleet_player.storage.AudioTrackStorage._fetch")
 @mock.patch("soundfleet_player.storage.shutil.disk_usage")
+def test_download_fails_when_space_cannot_be_freed(disk_usage, fetch):
+    disk_usage.return_value = mock.Mock(free=0)
+    track = {"url": "", "file": "huge.ogg", "size": 2**40}
+    with pytest.raises(DownloadFailed):
+        AudioTrackStorage().download(track)
+    assert not fetch.called
+
+
+@pytest.mark.skipif(
+    not is_redis_running(host="redis"), reason="Redis is not running"
+)
+@mock.patch("soundfleet_player.storage.requests.Session.get")
+@mock.patch("soundfleet_player.storage.AudioTrackStorage.can_download")
 @mock.patch("soundfleet_player.storage.AudioTrackStorage.track_file_exists")
-def test_file_rotation_removes_least_used_file(
-    track_file_exists, disk_usage, delete_file, *_
+def test_download_many_in_parallel_and_coalesced(
+    track_file_exists, can_download, get
 ):
-    class MyDiskUsage:
-        _free = 99 * 2**20
+    def slow_get(*args, **kwargs):
+        time.sleep(0.2)
+        return mock.MagicMock()
+
+    can_download.return_value = True
+    track_file_exists.return_value = False
+    get.side_effect = slow_get
+    tracks = [
+        {"url": "", "file": "parallel-1.ogg"},
+        {"url": "", "file": "parallel-2.ogg"},
+        {"url": "", "file": "parallel-1.ogg", "track_type": "ad"},
+    ]
+    storage = AudioTrackStorage()
+    started_at = time.monotonic()
+    futures = storage.download_many(tracks)
+    # file requested again while in flight joins running transfer
+    assert storage.download(tracks[0])["file"] == tracks[0]["file"]
+    downloaded = [future.result() for future in futures]
+    assert [track["file"] for track in downloaded] == [
+        track["file"] for track in tracks
+    ]
+    assert time.monotonic() - started_at < 0.4
+    assert get.call_count == 2
+    storage.remove_tracks(*tracks[:2])
+    for track in downloaded:
+        storage._download_lru_cache.remove(os.path.basename(track["uri"]))
 
-        @property
-        def free(self):
-            self._free += 2**20
-            return self._free
 
-    disk_usage.return_value = MyDiskUsage()
+@pytest.mark.skipif(
+    not is_redis_running(host="redis"), reason="Redis is not running"
+)
+@mock.patch("soundfleet_player.storage.requests.Session.get")
+@mock.patch("soundfleet_player.storage.AudioTrackStorage.can_download")
+@mock.patch("soundfleet_player.storage.AudioTrackStorage.track_file_exists")
+def test_download_many_reports_failures(track_file_exists, can_download, get):
+    can_download.return_value = True
     track_file_exists.return_value = False
+    get.side_effect = ConnectionError()
+    (future,) = AudioTrackStorage().download_many(
+        [{"url": "", "file": "failing.ogg"}]
+    )
+    with pytest.raises(DownloadFailed):
+        future.result()
+
+
+def response(status_code, content=b""):
+    r = mock.MagicMock(status_code=status_code)
+    r.__enter__.return_value = r
+    r.iter_content.return_value = [content]
+    return r
+
+
+class FlakyHandler(BaseHTTPRequestHandler):
+    """
+    Serves file with Range support, connection of first request is
+    killed in half of transfer.
+    """
+
+    content = bytes(range(256)) * 64
+    requests = []
+
+    def do_GET(self):
+        self.requests.append(self.headers.get("Range"))
+        start = 0
+        if self.headers.get("Range"):
+            start = int(self.headers["Range"][len("bytes=") : -1])
+            self.send_response(206)
+        else:
+            self.send_response(200)
+        body = self.content[start:]
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if len(self.requests) == 1:
+            self.wfile.write(body[: len(body) // 2])
+            self.wfile.flush()
+            self.close_connection = True
+            return
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub_server():
+    FlakyHandler.requests = []
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FlakyHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}/track.ogg"
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.mark.skipif(
+    not is_redis_running(host="redis"), reason="Redis is not running"
+)
+@mock.patch("soundfleet_player.storage.time.sleep")
+@mock.patch("soundfleet_player.storage.AudioTrackStorage.can_download")
+@mock.patch.dict(settings, {"DOWNLOAD_CHUNK_SIZE": 1024})
+def test_download_resumes_after_connection_is_killed(
+    can_download, sleep, stub_server, tmp_path
+):
+    can_download.return_value = True
+    content = FlakyHandler.content
+    track = {"url": stub_server, "file": "resumed.ogg", "size": len(content)}
+    digest = hashlib.sha256(content).hexdigest()
+    with mock.patch.object(AudioTrackStorage, "_download_dir", str(tmp_path)):
+        storage = AudioTrackStorage()
+        storage.download(track)
+        # file is named by digest of content hashed while downloading
+        assert (tmp_path / digest).read_bytes() == content
+        storage.remove_tracks(track)
+        storage._download_lru_cache.remove(digest)
+    assert FlakyHandler.requests[0] is None
+    assert FlakyHandler.requests[-1] == f"bytes={len(content) // 2}-"
+    assert os.listdir(tmp_path) == []
+
+
+@pytest.mark.skipif(
+    not is_redis_running(host="redis"), reason="Redis is not running"
+)
+@mock.patch("soundfleet_player.storage.time.sleep")
+@mock.patch("soundfleet_player.storage.AudioTrackStorage.can_download")
+@mock.patch.dict(settings, {"DOWNLOAD_CHUNK_SIZE": 1024})
+def test_download_with_wrong_size_is_not_visible(
+    can_download, sleep, stub_server, tmp_path
+):
+    can_download.return_value = True
+    track = {
+        "url": stub_server,
+        "file": "wrong-size.ogg",
+        "size": len(FlakyHandler.content) + 1,
+    }
+    with mock.patch.object(AudioTrackStorage, "_download_dir", str(tmp_path)):
+        storage = AudioTrackStorage()
+        with pytest.raises(DownloadFailed):
+            storage.download(track)
+        assert not storage.track_file_exists(track)
+    assert os.listdir(tmp_path) == []
+
+
+@pytest.mark.skipif(
+    not is_redis_running(host="redis"), reason="Redis is not running"
+)
+@mock.patch("soundfleet_player.storage.time.sleep")
+@mock.patch("soundfleet_player.storage.requests.Session.get")
+@mock.patch("soundfleet_player.storage.AudioTrackStorage.can_download")
+def test_download_starts_over_when_range_is_not_satisfiable(
+    can_download, get, sleep, tmp_path
+):
+    can_download.return_value = True
+    get.side_effect = [response(416), response(200, b"audio")]
+    track = {"url": "", "file": "stale.ogg", "size": 5}
+    part_path = str(tmp_path / "stale.ogg") + PARTIAL_SUFFIX
+    with open(part_path, "wb") as f:
+        f.write(b"stale content")
+    with open(part_path + ".offset", "w") as f:
+        f.write("13")
+    with mock.patch.object(AudioTrackStorage, "_download_dir", str(tmp_path)):
+        storage = AudioTrackStorage()
+        track = storage.download(track)
+        with open(track["uri"][len("file://") :], "rb") as f:
+            assert f.read() == b"audio"
+        storage.remove_tracks(track)
+        storage._download_lru_cache.remove(os.path.basename(track["uri"]))
+    assert get.call_args_list[0].kwargs["headers"] == {"Range": "bytes=13-"}
+    assert get.call_args_list[1].kwargs["headers"] is None
+
+
+@pytest.mark.skipif(
+    not is_redis_running(host="redis"), reason="Redis is not running"
+)
+@mock.patch("soundfleet_player.storage.requests.Session.get")
+@mock.patch("soundfleet_player.storage.AudioTrackStorage.can_download")
+def test_same_content_is_stored_once(can_download, get, tmp_path):
+    can_download.return_value = True
+    get.side_effect = lambda *args, **kwargs: response(200, b"jingle")
+    digest = hashlib.sha256(b"jingle").hexdigest()
+    first = {"url": "", "file": "jingle.ogg", "size": 6}
+    second = {"url": "", "file": "jingle-copy.ogg", "size": 6}
+    third = {"url": "", "file": "jingle-v2.ogg", "size": 6, "sha256": digest}
+    with mock.patch.object(AudioTrackStorage, "_download_dir", str(tmp_path)):
+        storage = AudioTrackStorage()
+        tracks = [storage.download(track) for track in (first, second)]
+        assert get.call_count == 2
+        # known digest of stored content is not downloaded again
+        tracks.append(storage.download(third))
+        assert get.call_count == 2
+        assert {track["uri"] for track in tracks} == {
+            f"file://{tmp_path / digest}"
+        }
+        assert os.listdir(tmp_path) == [digest]
+        storage.remove_tracks(first, second)
+        assert os.listdir(tmp_path) == [digest]
+        storage.remove_tracks(third)
+        assert os.listdir(tmp_path) == []
+        storage._download_lru_cache.remove(digest)
+
+
+@pytest.mark.skipif(
+    not is_redis_running(host="redis"), reason="Redis is not running"
+)
+@mock.patch("soundfleet_player.storage.requests.Session.get")
+@mock.patch("soundfleet_player.storage.AudioTrackStorage.can_download")
+def test_download_with_wrong_checksum_fails(can_download, get, tmp_path):
+    can_download.return_value = True
+    get.return_value = response(200, b"corrupted")
+    track = {
+        "url": "",
+        "file": "corrupted.ogg",
+        "size": 9,
+        "sha256": hashlib.sha256(b"jingle").hexdigest(),
+    }
+    with mock.patch.object(AudioTrackStorage, "_download_dir", str(tmp_path)):
+        storage = AudioTrackStorage()
+        with pytest.raises(DownloadFailed):
+            storage.download(track)
+        assert not storage.track_file_exists(track)
+    assert os.listdir(tmp_path) == []
+
+
+@pytest.mark.skipif(
+    not is_redis_running(host="redis"), reason="Redis is not running"
+)
+@mock.patch("soundfleet_player.storage.AudioTrackStorage._fetch")
+@mock.patch("soundfleet_player.storage.shutil.disk_usage")
+@mock.patch.dict(settings, {"CACHE_FREE_WATERMARK": 0})
+def test_file_rotation_follows_eviction_policy(disk_usage, fetch, tmp_path):
     track = {"url": "", "file": "test.ogg", "size": 2**20}
-    storage = AudioTrackStorage()
-    storage._download_lru_cache.touch("to_delete.ogg")
-    time.sleep(1)
-    storage._download_lru_cache.touch("test.ogg")
-    storage.download(track)
-    delete_file.assert_called_with("to_delete.ogg")
+    fetch.return_value = str(tmp_path / "test.ogg")
+    policy = mock.Mock()
+    policy.order.return_value = ["used.ogg", "to_delete.ogg"]
+    with mock.patch.object(AudioTrackStorage, "_download_dir", str(tmp_path)):
+        storage = AudioTrackStorage(policy)
+        lru_cache = storage._download_lru_cache
+        lru_cache._redis.delete(lru_cache.get_key())
+        create_files(storage, tmp_path, "to_delete.ogg", "used.ogg")
+        storage._index.set("used.ogg", "used.ogg")
+        mock_disk_usage(
+            disk_usage, tmp_path, AudioTrackStorage._safe_buffer + 2**21
+        )
+        storage.download(track)
+        (files,) = policy.order.call_args.args
+        assert {f.name: f.tracks for f in files} == {
+            "to_delete.ogg": frozenset(),
+            "used.ogg": frozenset(["used.ogg"]),
+        }
+        assert os.listdir(tmp_path) == ["to_delete.ogg"]
+        storage._index.remove("used.ogg")
+        lru_cache.remove("to_delete.ogg", "test.ogg")
+
+
+@mock.patch("soundfleet_player.storage.shutil.disk_usage")
+def test_space_of_downloads_in_progress_is_reserved(disk_usage, tmp_path):
+    size = 2**20
+    track = {"url": "", "file": "next.ogg", "size": size}
+    disk_usage.return_value = mock.Mock(
+        free=AudioTrackStorage._safe_buffer + size * 3 // 2
+    )
+    assert AudioTrackStorage.can_download(str(tmp_path), track)
+    running = str(tmp_path / "running.ogg") + PARTIAL_SUFFIX
+    with mock.patch.dict(AudioTrackStorage._reservations, {running: size}):
+        assert not AudioTrackStorage.can_download(str(tmp_path), track)
+        # space already taken by temp file isn't reserved twice
+        with open(running, "wb") as f:
+            f.write(b"\0" * size)
+        assert AudioTrackStorage.can_download(str(tmp_path), track)
+
+
+@pytest.mark.skipif(
+    not is_redis_running(host="redis"), reason="Redis is not running"
+)
+@mock.patch("soundfleet_player.storage.os.posix_fallocate")
+@mock.patch("soundfleet_player.storage.requests.Session.get")
+@mock.patch("soundfleet_player.storage.AudioTrackStorage.can_download")
+def test_download_fails_when_space_cannot_be_allocated(
+    can_download, get, fallocate, tmp_path
+):
+    can_download.return_value = True
+    get.return_value = response(200, b"audio")
+    fallocate.side_effect = OSError(errno.ENOSPC, "No space left on device")
+    track = {"url": "", "file": "full.ogg", "size": 5}
+    with mock.patch.object(AudioTrackStorage, "_download_dir", str(tmp_path)):
+        with pytest.raises(DownloadFailed):
+            AudioTrackStorage().download(track)
+    # full disk isn't retried
+    assert get.call_count == 1
+    assert os.listdir(tmp_path) == []
+    assert not AudioTrackStorage._reservations
+
+
+@pytest.mark.skipif(
+    not is_redis_running(host="redis"), reason="Redis is not running"
+)
+def test_partial_download_of_removed_track_is_deleted(tmp_path):
+    track = {"url": "", "file": "dropped.ogg", "size": 2**20}
+    part_path = str(tmp_path / "dropped.ogg") + PARTIAL_SUFFIX
+    with open(part_path, "wb") as f:
+        f.truncate(track["size"])
+    with open(part_path + ".offset", "w") as f:
+        f.write("1024")
+    with mock.patch.object(AudioTrackStorage, "_download_dir", str(tmp_path)):
+        AudioTrackStorage.remove_tracks(track)
+    assert os.listdir(tmp_path) == []
+
+
+@pytest.mark.skipif(
+    not is_redis_running(host="redis"), reason="Redis is not running"
+)
+@mock.patch("soundfleet_player.storage.AudioTrackStorage._fetch")
+@mock.patch("soundfleet_player.storage.shutil.disk_usage")
+@mock.patch.dict(settings, {"CACHE_FREE_WATERMARK": 0})
+def test_failed_partial_downloads_are_evicted_first(
+    disk_usage, fetch, tmp_path
+):
+    track = {"url": "", "file": "test.ogg", "size": 2**20}
+    fetch.return_value = str(tmp_path / "test.ogg")
+    with mock.patch.object(AudioTrackStorage, "_download_dir", str(tmp_path)):
+        storage = AudioTrackStorage()
+        lru_cache = storage._download_lru_cache
+        lru_cache._redis.delete(lru_cache.get_key())
+        create_files(storage, tmp_path, "cached.ogg")
+        with open(tmp_path / ("failed.ogg" + PARTIAL_SUFFIX), "wb") as f:
+            f.truncate(2**20)
+        mock_disk_usage(
+            disk_usage, tmp_path, AudioTrackStorage._safe_buffer + 2**21
+        )
+        storage.download(track)
+        assert os.listdir(tmp_path) == ["cached.ogg"]
+        storage._download_lru_cache.remove("cached.ogg", "test.ogg")
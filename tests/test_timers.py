@@ -0,0 +1,50 @@
+from soundfleet_player.timers import Timers
+
+
+class MyClock:
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+def test_timers_run_in_deadline_order():
+    clock = MyClock()
+    timers = Timers(clock=clock)
+    calls = []
+    timers.schedule("b", 2, lambda: calls.append("b"))
+    timers.schedule("a", 1, lambda: calls.append("a"))
+    assert timers.timeout() == 1
+    clock.now = 1
+    timers.run_due()
+    assert calls == ["a"]
+    clock.now = 5
+    timers.run_due()
+    assert calls == ["a", "b"]
+    assert timers.timeout(60) == 60
+
+
+def test_reschedule_replaces_deadline():
+    clock = MyClock()
+    timers = Timers(clock=clock)
+    calls = []
+    timers.schedule("a", 1, lambda: calls.append(1))
+    timers.schedule("a", 10, lambda: calls.append(10))
+    assert timers.timeout() == 10
+    clock.now = 10
+    timers.run_due()
+    assert calls == [10]
+
+
+def test_cancel():
+    clock = MyClock()
+    timers = Timers(clock=clock)
+    calls = []
+    timers.schedule("a", 1, lambda: calls.append(1))
+    timers.cancel("a")
+    assert not timers.is_scheduled("a")
+    assert timers.timeout() is None
+    clock.now = 1
+    timers.run_due()
+    assert calls == []
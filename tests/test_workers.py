@@ -0,0 +1,78 @@
+import threading
+import time
+
+from soundfleet_player.workers import WorkerPool
+
+
+def wait_until_idle(pool, key, timeout=1):
+    t = time.time()
+    while pool.is_busy(key) and time.time() - t < timeout:
+        time.sleep(0.01)
+
+
+def test_submit_runs_task():
+    pool = WorkerPool(size=1)
+    done = threading.Event()
+    pool.submit("a", done.set)
+    assert done.wait(1)
+    wait_until_idle(pool, "a")
+    assert not pool.is_busy("a")
+    assert pool.stats()["tasks_count"] == 1
+    pool.shutdown()
+
+
+def test_submit_while_in_flight_reruns_once():
+    pool = WorkerPool(size=2)
+    release = threading.Event()
+    calls = []
+
+    def fn():
+        calls.append(1)
+        release.wait(1)
+
+    pool.submit("a", fn)
+    pool.submit("a", fn)
+    pool.submit("a", fn)
+    release.set()
+    wait_until_idle(pool, "a")
+    assert len(calls) == 2
+    pool.shutdown()
+
+
+def test_cancelled_task_does_not_run():
+    pool = WorkerPool(size=1)
+    release = threading.Event()
+    calls = []
+    pool.submit("a", release.wait, 1)
+    pool.submit("b", calls.append, 1)
+    pool.cancel("b")
+    release.set()
+    wait_until_idle(pool, "a")
+    time.sleep(0.05)
+    assert calls == []
+    pool.shutdown()
+
+
+def test_cancelled_key_stays_busy_until_task_returns():
+    pool = WorkerPool(size=2)
+    release = threading.Event()
+    running = threading.Event()
+    calls = []
+
+    def slow():
+        running.set()
+        release.wait(1)
+        calls.append("old")
+
+    pool.submit("a", slow)
+    assert running.wait(1)
+    pool.cancel("a")
+    assert pool.is_busy("a")
+    pool.submit("a", calls.append, "new")
+    time.sleep(0.05)
+    # new task doesn't overlap cancelled one
+    assert calls == []
+    release.set()
+    wait_until_idle(pool, "a")
+    assert calls == ["old", "new"]
+    pool.shutdown()
@@ -0,0 +1,140 @@
+import json
+import pytest
+import pytz
+
+from unittest import mock
+
+from soundfleet_player.media_backends.dummy import MediaBackend
+from soundfleet_player.utils import encode_signal, get_signal_zone
+from soundfleet_player.zones import (
+    MultiZonePlayer,
+    MultiZoneScheduler,
+    route_signal,
+)
+from .utils import ExitAfter
+
+
+class MyDevice:
+    volume = 50
+
+    @property
+    def timezone(self):
+        return pytz.UTC
+
+    @property
+    def playback_priority(self):
+        return "music_over_ads"
+
+    def sync(self):
+        pass
+
+
+def test_encode_signal():
+    signal = json.loads(encode_signal("SKIP", []))
+    assert signal[:2] == ["SKIP", []]
+    assert get_signal_zone(signal) is None
+    signal = json.loads(encode_signal("SKIP", [], "bar"))
+    assert get_signal_zone(signal) == "bar"
+
+
+def test_route_signal():
+    zones = {"bar": "bar scheduler", "hall": "hall scheduler"}
+    assert route_signal(("SKIP", [], 0, "bar"), zones) == ["bar scheduler"]
+    assert route_signal(("SKIP", [], 0), zones) == [
+        "bar scheduler",
+        "hall scheduler",
+    ]
+    assert route_signal(("SKIP", []), zones) == [
+        "bar scheduler",
+        "hall scheduler",
+    ]
+    assert route_signal(("SKIP", [], 0, "kitchen"), zones) == []
+
+
+@pytest.mark.parametrize(
+    "signal, expected_ready",
+    [
+        (("PLAYER_READY", [], 0, "bar"), {"bar": True, "hall": False}),
+        (("PLAYER_READY", [], 0), {"bar": True, "hall": True}),
+    ],
+)
+@mock.patch("soundfleet_player.scheduler.Scheduler._set_player_volume")
+@mock.patch("soundfleet_player.scheduler.Scheduler._restore_state")
+@mock.patch("soundfleet_player.zones.get_and_decode_redis_message")
+@mock.patch("soundfleet_player.zones.MultiZoneScheduler._should_run")
+@mock.patch("soundfleet_player.zones.Device")
+def test_multi_zone_scheduler_routes_signals(
+    device,
+    should_run,
+    get_msg,
+    restore_state,
+    set_volume,
+    signal,
+    expected_ready,
+):
+    device.return_value = MyDevice()
+    should_run.side_effect = ExitAfter(1)
+    get_msg.side_effect = [signal, None]
+    restore_state.return_value = True
+    scheduler = MultiZoneScheduler(["bar", "hall"])
+    scheduler.run()
+    ready = {
+        zone: zone_scheduler._player_ready
+        for zone, zone_scheduler in scheduler._schedulers.items()
+    }
+    assert ready == expected_ready
+    assert set_volume.call_count == sum(expected_ready.values())
+
+
+@mock.patch("soundfleet_player.zones.Device")
+def test_multi_zone_scheduler_shares_device(device):
+    device.return_value = MyDevice()
+    scheduler = MultiZoneScheduler(["bar", "hall"])
+    bar, hall = scheduler._schedulers.values()
+    assert bar._device is hall._device
+    assert bar._outbox is hall._outbox
+    assert bar._workers is hall._workers
+    # only first zone syncs device and acks syncs
+    assert bar._is_primary and not hall._is_primary
+    assert bar._zone_key("music") == "music:bar"
+    assert bar._state_cache.get_key() == "SCHEDULER_STATE:bar"
+
+
+@mock.patch("soundfleet_player.scheduler.Scheduler._restore_state")
+@mock.patch("soundfleet_player.zones.get_and_decode_redis_message")
+@mock.patch("soundfleet_player.zones.MultiZoneScheduler._should_run")
+@mock.patch("soundfleet_player.zones.Device")
+def test_multi_zone_scheduler_syncs_device_once(
+    device, should_run, get_msg, restore_state
+):
+    device.return_value = MyDevice()
+    should_run.side_effect = ExitAfter(0)
+    restore_state.side_effect = [True, False]
+    scheduler = MultiZoneScheduler(["bar", "hall"])
+    with mock.patch.object(MyDevice, "sync") as sync:
+        scheduler.run()
+    assert sync.call_count == 1
+
+
+@mock.patch("soundfleet_player.player.Player._ack_ready")
+@mock.patch("soundfleet_player.zones.get_and_decode_redis_message")
+@mock.patch("soundfleet_player.zones.MultiZonePlayer._should_run")
+def test_multi_zone_player_routes_signals(should_run, get_msg, ack_ready):
+    should_run.side_effect = ExitAfter(2)
+    get_msg.side_effect = [
+        ("SET_VOLUME", [30], 0, "bar"),
+        ("SET_VOLUME", [70], 0),
+    ]
+    backends = {"bar": MediaBackend(), "hall": MediaBackend()}
+    player = MultiZonePlayer(backends)
+    assert ack_ready.call_count == 0
+    player.run()
+    assert ack_ready.call_count == 2
+    assert backends["bar"]._volume == 70
+    assert backends["hall"]._volume == 70
+
+    should_run.side_effect = ExitAfter(1)
+    get_msg.side_effect = [("SET_VOLUME", [30], 0, "bar")]
+    player.run()
+    assert backends["bar"]._volume == 30
+    assert backends["hall"]._volume == 70